@@ -3,6 +3,32 @@ ASGI config for SNS project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
 
+The dashboards and detail views are async and read their independent
+queries concurrently (see workshop.fanout), which only pays off when they
+are served here. Run it with an ASGI server, e.g.::
+
+    WEB_CONCURRENCY=4 uvicorn SNS.asgi:application
+    WEB_CONCURRENCY=4 gunicorn SNS.asgi:application -k uvicorn.workers.UvicornWorker
+
+With more than one worker, set CACHE_URL to a shared Redis server (see
+CACHES in SNS.settings); the app refuses to start on a per-process cache.
+
+Keep DATABASE_POOL set under ASGI: each request and each concurrent read
+runs in its own thread, so persistent connections (CONN_MAX_AGE) would pile
+up per thread instead of being reused; pooled ones are shared.
+
+To compare with the WSGI deployment, benchmark both servers over HTTP
+against the same data, keeping the WSGI run as the baseline::
+
+    WEB_CONCURRENCY=4 gunicorn SNS.wsgi:application &
+    manage.py benchmark --base-url http://localhost:8000 \\
+        --only patient_dashboard doctor_dashboard medicacao_detail exames_detail \\
+        --baseline benchmarks/wsgi.json --save-baseline
+    WEB_CONCURRENCY=4 uvicorn SNS.asgi:application &
+    manage.py benchmark --base-url http://localhost:8000 \\
+        --only patient_dashboard doctor_dashboard medicacao_detail exames_detail \\
+        --baseline benchmarks/wsgi.json --tolerance 0
+
 For more information on this file, see
 https://docs.djangoproject.com/en/6.0/howto/deployment/asgi/
 """
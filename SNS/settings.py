@@ -38,11 +38,15 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django.contrib.postgres',
     'workshop',
 ]
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    'workshop.middleware.QueryBudgetMiddleware',
+    'workshop.middleware.ConnectionPoolMiddleware',
+    'workshop.middleware.ReplicaMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -74,6 +78,22 @@ WSGI_APPLICATION = 'SNS.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/6.0/ref/settings/#databases
 
+# Connections come from a psycopg_pool pool (pip install "psycopg[pool]"),
+# checked on checkout and returned at the end of each request; see
+# workshop.dbpool. max_size bounds the connections of each worker process,
+# so keep workers * max_size under the server's max_connections. Set to None
+# to fall back to persistent connections, one per thread (WSGI only).
+DATABASE_POOL = {
+    'min_size': 2,
+    'max_size': 10,
+    # Seconds a request waits for a free connection before a 503
+    'timeout': 5,
+    # Requests allowed to wait at once; more are answered 503 at once
+    'max_waiting': 50,
+    'max_idle': 5 * 60,
+    'max_lifetime': 30 * 60,
+}
+
 DATABASES = { 
     'default': { 
     'ENGINE': 'django.db.backends.postgresql', 
@@ -82,9 +102,32 @@ DATABASES = {
     'PASSWORD': 'medico', 
     'HOST': 'localhost', 
     'PORT': '5432', 
+    'CONN_MAX_AGE': 0 if DATABASE_POOL else 60,
+    'CONN_HEALTH_CHECKS': True,
+    'OPTIONS': {'pool': DATABASE_POOL} if DATABASE_POOL else {},
 } 
 } 
 
+# Streaming replicas of 'default', added as replica1, replica2, ... Each
+# entry overrides the connection settings of 'default', e.g. for a second
+# local PostgreSQL instance: [{'HOST': 'localhost', 'PORT': '5433'}]. Reads
+# of the views marked read_replica and of the admin changelists go to them;
+# see workshop.routers. DATABASE_REPLICA_LAG bounds, in seconds, how long
+# after a write a replica may still serve pre-write data.
+DATABASE_REPLICAS = []
+DATABASE_REPLICA_LAG = 5
+
+for number, replica in enumerate(DATABASE_REPLICAS, 1):
+    DATABASES[f'replica{number}'] = {
+        **DATABASES['default'],
+        'OPTIONS': dict(DATABASES['default']['OPTIONS']),
+        **replica,
+        # Tests run against the primary's test database
+        'TEST': {'MIRROR': 'default'},
+    }
+
+DATABASE_ROUTERS = ['workshop.routers.ReplicaRouter']
+
 
 # Password validation
 # https://docs.djangoproject.com/en/6.0/ref/settings/#auth-password-validators
@@ -127,4 +170,53 @@ STATICFILES_DIRS = [os.path.join(BASE_DIR, 'static')]
 TEMPLATES[0]['DIRS'] = [os.path.join(BASE_DIR, 'templates')]
 
 MEDIA_URL = '/media/'
-MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
\ No newline at end of file
+MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
+# Exam images are stored by content hash and deduplicated, and their
+# previews saved under names derived from that hash (workshop.storage)
+STORAGES = {
+    'default': {'BACKEND': 'django.core.files.storage.FileSystemStorage'},
+    'staticfiles': {'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage'},
+    'exam_images': {'BACKEND': 'workshop.storage.ContentAddressedStorage'},
+    'exam_previews': {'BACKEND': 'workshop.storage.DerivedFileStorage'},
+}
+# Per-view query statistics (workshop.middleware.QueryBudgetMiddleware).
+# Adds X-Query-Count and Server-Timing headers to every response.
+QUERY_BUDGET_HEADERS = DEBUG
+
+# Resumable exam image uploads (workshop.uploads). Partial files live under
+# MEDIA_ROOT so finished uploads are moved into storage without a copy.
+CHUNKED_UPLOAD_DIR = os.path.join(MEDIA_ROOT, 'partial')
+CHUNKED_UPLOAD_MAX_SIZE = 2 * 1024 ** 3
+
+# How workshop.media hands file transfers to the front-end server: None
+# (sendfile through the WSGI server), 'x-accel-redirect' behind nginx, with
+# an internal location mapping MEDIA_ACCEL_REDIRECT_PREFIX to MEDIA_ROOT,
+# or 'x-sendfile' behind Apache with mod_xsendfile.
+MEDIA_OFFLOAD = None
+MEDIA_ACCEL_REDIRECT_PREFIX = '/protected-media/'
+
+# Number of worker processes serving the site. gunicorn and uvicorn take
+# their default worker count from the same variable, so start them with
+# e.g. WEB_CONCURRENCY=4 rather than -w/--workers.
+WEB_CONCURRENCY = int(os.environ.get('WEB_CONCURRENCY', 1))
+
+# Dashboard fragment versions (workshop.fragments), API generations
+# (workshop.api) and catalog generations (workshop.catalog) live in the
+# default cache, which every worker process must share: set CACHE_URL to a
+# Redis server, e.g. redis://localhost:6379/0 (pip install redis). The
+# per-process LocMemCache is only allowed with a single worker; the app
+# refuses to start otherwise (workshop.checks).
+CACHE_URL = os.environ.get('CACHE_URL')
+CACHES = {
+    'default': (
+        {'BACKEND': 'django.core.cache.backends.redis.RedisCache', 'LOCATION': CACHE_URL}
+        if CACHE_URL else
+        {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}
+    ),
+}
+PATIENT_FRAGMENT_TIMEOUT = 24 * 60 * 60
+
+# Consultation slots offered by workshop.scheduling: their length, and the
+# opening and closing hour of the weekdays they are offered on.
+SCHEDULE_SLOT_MINUTES = 30
+SCHEDULE_HOURS = (8, 19)
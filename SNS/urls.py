@@ -17,13 +17,10 @@ Including another URLconf
 from django.contrib import admin
 from django.urls import path, include
 from django.conf import settings
-from django.conf.urls.static import static
+from workshop.views import MediaView
 
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('', include('workshop.urls')),
-]
-
-if settings.DEBUG:
-    urlpatterns += static(settings.MEDIA_URL,
-    document_root=settings.MEDIA_ROOT)
\ No newline at end of file
+    path(f"{settings.MEDIA_URL.lstrip('/')}<path:name>", MediaView.as_view(), name='media'),
+]
\ No newline at end of file
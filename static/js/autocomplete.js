@@ -0,0 +1,119 @@
+// Autocomplete for the AutocompleteInput widgets of the clinical forms.
+// Events are delegated from the document, so formset rows added after the
+// page loaded work too. The search box shows the label; the hidden input
+// next to it carries the key that is posted and validated by the server.
+(function() {
+    let timer = null;
+    let controller = null;
+
+    function parts(searchInput) {
+        const container = searchInput.closest('.autocomplete');
+        return {
+            hidden: container.querySelector('input[type="hidden"]'),
+            list: container.querySelector('.typeahead-results'),
+        };
+    }
+
+    function clearResults(list) {
+        list.innerHTML = '';
+        list.hidden = true;
+        list.activeIndex = -1;
+    }
+
+    function choose(searchInput, result) {
+        const {hidden, list} = parts(searchInput);
+        hidden.value = result.id;
+        searchInput.value = result.label;
+        clearResults(list);
+    }
+
+    function highlight(list, index) {
+        list.querySelectorAll('li').forEach(function(item, i) {
+            item.classList.toggle('active', i === index);
+        });
+        list.activeIndex = index;
+    }
+
+    function render(searchInput, results) {
+        const {list} = parts(searchInput);
+        list.innerHTML = '';
+        if (!results.length) {
+            const empty = document.createElement('li');
+            empty.className = 'typeahead-empty';
+            empty.textContent = 'No matches found.';
+            list.appendChild(empty);
+        }
+        results.forEach(function(result) {
+            const item = document.createElement('li');
+            item.textContent = result.label;
+            item.addEventListener('mousedown', function(e) {
+                e.preventDefault();
+                choose(searchInput, result);
+            });
+            item.result = result;
+            list.appendChild(item);
+        });
+        list.hidden = false;
+        list.activeIndex = -1;
+    }
+
+    function lookup(searchInput, term) {
+        if (controller) {
+            controller.abort();
+        }
+        controller = new AbortController();
+        const url = searchInput.dataset.autocompleteUrl;
+        fetch(url + '?q=' + encodeURIComponent(term), {signal: controller.signal})
+            .then(function(response) { return response.json(); })
+            .then(function(data) { render(searchInput, data.results); })
+            .catch(function() {});
+    }
+
+    function isAutocomplete(target) {
+        return target instanceof HTMLInputElement && 'autocompleteUrl' in target.dataset;
+    }
+
+    document.addEventListener('input', function(e) {
+        const searchInput = e.target;
+        if (!isAutocomplete(searchInput)) {
+            return;
+        }
+        const {hidden, list} = parts(searchInput);
+        hidden.value = '';
+        clearTimeout(timer);
+        const term = searchInput.value.trim();
+        if (!term) {
+            clearResults(list);
+            return;
+        }
+        timer = setTimeout(function() { lookup(searchInput, term); }, 200);
+    });
+
+    document.addEventListener('keydown', function(e) {
+        const searchInput = e.target;
+        if (!isAutocomplete(searchInput)) {
+            return;
+        }
+        const {list} = parts(searchInput);
+        const items = list.querySelectorAll('li');
+        const activeIndex = list.activeIndex === undefined ? -1 : list.activeIndex;
+        if (e.key === 'ArrowDown' && items.length) {
+            e.preventDefault();
+            highlight(list, Math.min(activeIndex + 1, items.length - 1));
+        } else if (e.key === 'ArrowUp' && items.length) {
+            e.preventDefault();
+            highlight(list, Math.max(activeIndex - 1, 0));
+        } else if (e.key === 'Enter' && activeIndex >= 0 && items[activeIndex].result) {
+            e.preventDefault();
+            choose(searchInput, items[activeIndex].result);
+        } else if (e.key === 'Escape') {
+            clearResults(list);
+        }
+    });
+
+    document.addEventListener('focusout', function(e) {
+        if (isAutocomplete(e.target)) {
+            clearResults(parts(e.target).list);
+        }
+    });
+})();
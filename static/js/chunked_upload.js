@@ -0,0 +1,142 @@
+// Resumable exam image uploads through the upload_create/upload_session
+// endpoints. A chosen file is sent in CHUNK_SIZE pieces; after a failure
+// the server's offset is fetched and the upload continues from there, also
+// across page reloads for the same file. When it completes, the form's
+// hidden "-upload" field gets the session id and the file input is cleared,
+// so the form itself is submitted without the image.
+document.addEventListener('DOMContentLoaded', function() {
+    const form = document.querySelector('form[data-upload-url]');
+    if (!form) {
+        return;
+    }
+
+    const createUrl = form.dataset.uploadUrl;
+    const csrfToken = form.querySelector('[name=csrfmiddlewaretoken]').value;
+    const CHUNK_SIZE = 4 * 1024 * 1024;
+    const MAX_RETRIES = 5;
+    // Only hash files small enough to read into memory in one go
+    const HASH_LIMIT = 64 * 1024 * 1024;
+    let pending = 0;
+
+    function statusFor(input) {
+        let status = input.parentNode.querySelector('.upload-status');
+        if (!status) {
+            status = document.createElement('span');
+            status.className = 'form-text upload-status';
+            input.parentNode.appendChild(status);
+        }
+        return status;
+    }
+
+    function storageKey(file) {
+        return `chunked-upload:${file.name}:${file.size}:${file.lastModified}`;
+    }
+
+    async function sha256(file) {
+        if (!window.crypto || !crypto.subtle || file.size > HASH_LIMIT) {
+            return '';
+        }
+        const digest = await crypto.subtle.digest('SHA-256', await file.arrayBuffer());
+        return Array.from(new Uint8Array(digest))
+            .map(b => b.toString(16).padStart(2, '0')).join('');
+    }
+
+    async function request(url, options) {
+        const response = await fetch(url, Object.assign({
+            credentials: 'same-origin',
+            headers: {'X-CSRFToken': csrfToken},
+        }, options));
+        const body = await response.json().catch(() => ({}));
+        return {response, body};
+    }
+
+    async function openSession(file) {
+        const saved = localStorage.getItem(storageKey(file));
+        if (saved) {
+            const {response, body} = await request(saved, {method: 'GET'});
+            if (response.ok && body.status !== 'failed') {
+                return body;
+            }
+        }
+        const data = new URLSearchParams({
+            filename: file.name, size: file.size, sha256: await sha256(file),
+        });
+        const {response, body} = await request(createUrl, {method: 'POST', body: data});
+        if (!response.ok) {
+            throw new Error(body.error || `Upload refused (${response.status}).`);
+        }
+        localStorage.setItem(storageKey(file), body.url);
+        return body;
+    }
+
+    async function upload(file, input, hidden) {
+        const status = statusFor(input);
+        let session = await openSession(file);
+        let retries = 0;
+
+        while (session.status === 'pending') {
+            status.textContent = `A enviar... ${Math.floor(session.offset * 100 / file.size)}%`;
+            const chunk = file.slice(session.offset, session.offset + CHUNK_SIZE);
+            try {
+                const {response, body} = await request(session.url, {
+                    method: 'PATCH',
+                    headers: {
+                        'X-CSRFToken': csrfToken,
+                        'Content-Type': 'application/offset+octet-stream',
+                        'Upload-Offset': String(session.offset),
+                    },
+                    body: chunk,
+                });
+                if (response.status === 409 || response.status >= 500) {
+                    throw new Error(body.error || `Upload failed (${response.status}).`);
+                }
+                if (!response.ok) {
+                    localStorage.removeItem(storageKey(file));
+                    throw Object.assign(new Error(body.error), {fatal: true});
+                }
+                session = body;
+                retries = 0;
+            } catch (error) {
+                if (error.fatal || ++retries > MAX_RETRIES) {
+                    throw error;
+                }
+                await new Promise(resolve => setTimeout(resolve, 1000 * retries));
+                // Resume from whatever the server actually has
+                session = (await request(session.url, {method: 'GET'})).body;
+            }
+        }
+
+        localStorage.removeItem(storageKey(file));
+        hidden.value = session.id;
+        input.value = '';
+        status.textContent = `${file.name} enviado.`;
+    }
+
+    form.addEventListener('change', async function(e) {
+        const input = e.target;
+        if (input.type !== 'file' || !input.name.endsWith('-imagem') || !input.files.length) {
+            return;
+        }
+        const hidden = form.querySelector(`[name="${input.name.replace(/-imagem$/, '-upload')}"]`);
+        if (!hidden) {
+            return;
+        }
+        hidden.value = '';
+        pending += 1;
+        try {
+            await upload(input.files[0], input, hidden);
+        } catch (error) {
+            // Leave the file in the input: it is then posted with the form
+            statusFor(input).textContent = error.message || 'O envio falhou.';
+        } finally {
+            pending -= 1;
+        }
+    });
+
+    form.addEventListener('submit', function(e) {
+        if (pending) {
+            e.preventDefault();
+            alert('Aguarde que o envio das imagens termine.');
+        }
+    });
+});
@@ -0,0 +1,99 @@
+// Patient picker backed by the paciente_typeahead JSON endpoint.
+// Only the top matches for what the user typed are ever fetched.
+document.addEventListener('DOMContentLoaded', function() {
+    const searchInput = document.getElementById('patient_search');
+    const hiddenInput = document.getElementById('patient_cc');
+    const resultsList = document.getElementById('patient_results');
+
+    if (!searchInput || !hiddenInput || !resultsList) {
+        return;
+    }
+
+    const url = searchInput.dataset.typeaheadUrl;
+    let timer = null;
+    let controller = null;
+    let activeIndex = -1;
+
+    function clearResults() {
+        resultsList.innerHTML = '';
+        resultsList.hidden = true;
+        activeIndex = -1;
+    }
+
+    function choose(result) {
+        hiddenInput.value = result.cc;
+        searchInput.value = result.label;
+        clearResults();
+        searchInput.form.submit();
+    }
+
+    function highlight(index) {
+        const items = resultsList.querySelectorAll('li');
+        items.forEach(function(item, i) {
+            item.classList.toggle('active', i === index);
+        });
+        activeIndex = index;
+    }
+
+    function render(results) {
+        resultsList.innerHTML = '';
+        if (!results.length) {
+            const empty = document.createElement('li');
+            empty.className = 'typeahead-empty';
+            empty.textContent = 'No patients found.';
+            resultsList.appendChild(empty);
+        }
+        results.forEach(function(result) {
+            const item = document.createElement('li');
+            item.textContent = result.label;
+            item.addEventListener('mousedown', function(e) {
+                e.preventDefault();
+                choose(result);
+            });
+            item.result = result;
+            resultsList.appendChild(item);
+        });
+        resultsList.hidden = false;
+        activeIndex = -1;
+    }
+
+    function lookup(term) {
+        if (controller) {
+            controller.abort();
+        }
+        controller = new AbortController();
+        fetch(url + '?q=' + encodeURIComponent(term), {signal: controller.signal})
+            .then(function(response) { return response.json(); })
+            .then(function(data) { render(data.results); })
+            .catch(function() {});
+    }
+
+    searchInput.addEventListener('input', function() {
+        hiddenInput.value = '';
+        clearTimeout(timer);
+        const term = this.value.trim();
+        if (!term) {
+            clearResults();
+            return;
+        }
+        timer = setTimeout(function() { lookup(term); }, 200);
+    });
+
+    searchInput.addEventListener('keydown', function(e) {
+        const items = resultsList.querySelectorAll('li');
+        if (e.key === 'ArrowDown' && items.length) {
+            e.preventDefault();
+            highlight(Math.min(activeIndex + 1, items.length - 1));
+        } else if (e.key === 'ArrowUp' && items.length) {
+            e.preventDefault();
+            highlight(Math.max(activeIndex - 1, 0));
+        } else if (e.key === 'Enter' && activeIndex >= 0 && items[activeIndex].result) {
+            e.preventDefault();
+            choose(items[activeIndex].result);
+        } else if (e.key === 'Escape') {
+            clearResults();
+        }
+    });
+
+    searchInput.addEventListener('blur', clearResults);
+});
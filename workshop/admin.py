@@ -2,8 +2,9 @@ from django.contrib import admin
 from .models import (
     Medico, Paciente, Consulta, MedicoConsulta,
     Receita, Medicamento, Medicacao, ItemMedicacao,
-    Exame, Exames, ItemExames
+    Exame, Exames, ItemExames, EstatisticaDiaria, EstatisticaTotal
 )
+from .routers import ReplicaChangeListMixin
 
 
 # -------------------------------
@@ -31,9 +32,10 @@ class ItemExamesInline(admin.TabularInline):
 # -------------------------------
 # Main Model Admins
 # -------------------------------
+# Changelists are read from the replicas (workshop.routers)
 
 @admin.register(Medico)
-class MedicoAdmin(admin.ModelAdmin):
+class MedicoAdmin(ReplicaChangeListMixin, admin.ModelAdmin):
     list_display = ['cc', 'nome', 'numero_medico', 'especialidade', 'email', 'telefone']
     search_fields = ['nome', 'numero_medico', 'especialidade', 'email', 'cc']
     list_filter = ['especialidade']
@@ -50,12 +52,12 @@ class MedicoAdmin(admin.ModelAdmin):
 
 
 @admin.register(Paciente)
-class PacienteAdmin(admin.ModelAdmin):
+class PacienteAdmin(ReplicaChangeListMixin, admin.ModelAdmin):
     list_display = ['cc', 'nome', 'numero_seguranca_social', 'email', 'telefone', 'data_registo']
     search_fields = ['nome', 'numero_seguranca_social', 'email', 'cc']
     list_filter = ['data_registo']
     ordering = ['nome']
-    readonly_fields = ['data_registo']
+    readonly_fields = ['data_registo', 'num_consultas', 'num_medicacoes', 'num_exames', 'ultima_consulta']
     
     fieldsets = (
         ('Informação Pessoal', {
@@ -64,11 +66,14 @@ class PacienteAdmin(admin.ModelAdmin):
         ('Informação do Paciente', {
             'fields': ('numero_seguranca_social', 'data_registo')
         }),
+        ('Atividade', {
+            'fields': ('num_consultas', 'num_medicacoes', 'num_exames', 'ultima_consulta')
+        }),
     )
 
 
 @admin.register(Consulta)
-class ConsultaAdmin(admin.ModelAdmin):
+class ConsultaAdmin(ReplicaChangeListMixin, admin.ModelAdmin):
     list_display = ['id', 'paciente', 'data_hora', 'motivo_resumo']
     search_fields = ['paciente__nome', 'motivo']
     list_filter = ['data_hora']
@@ -89,21 +94,21 @@ class ConsultaAdmin(admin.ModelAdmin):
 
 
 @admin.register(MedicoConsulta)
-class MedicoConsultaAdmin(admin.ModelAdmin):
+class MedicoConsultaAdmin(ReplicaChangeListMixin, admin.ModelAdmin):
     list_display = ['id', 'medico', 'consulta', 'role']
     search_fields = ['medico__nome', 'consulta__paciente__nome']
     list_filter = ['role']
 
 
 @admin.register(Medicamento)
-class MedicamentoAdmin(admin.ModelAdmin):
+class MedicamentoAdmin(ReplicaChangeListMixin, admin.ModelAdmin):
     list_display = ['id_medicamento', 'nome']
     search_fields = ['nome', 'id_medicamento']
     ordering = ['nome']
 
 
 @admin.register(Medicacao)
-class MedicacaoAdmin(admin.ModelAdmin):
+class MedicacaoAdmin(ReplicaChangeListMixin, admin.ModelAdmin):
     list_display = ['id_receita', 'paciente', 'date']
     search_fields = ['paciente__nome']
     list_filter = ['date']
@@ -120,21 +125,21 @@ class MedicacaoAdmin(admin.ModelAdmin):
 
 
 @admin.register(ItemMedicacao)
-class ItemMedicacaoAdmin(admin.ModelAdmin):
+class ItemMedicacaoAdmin(ReplicaChangeListMixin, admin.ModelAdmin):
     list_display = ['id', 'medicacao', 'medicamento', 'dose', 'quantidade']
     search_fields = ['medicamento__nome', 'medicacao__paciente__nome']
     list_filter = ['medicamento']
 
 
 @admin.register(Exame)
-class ExameAdmin(admin.ModelAdmin):
+class ExameAdmin(ReplicaChangeListMixin, admin.ModelAdmin):
     list_display = ['id_exame', 'nome']
     search_fields = ['nome', 'id_exame']
     ordering = ['nome']
 
 
 @admin.register(Exames)
-class ExamesAdmin(admin.ModelAdmin):
+class ExamesAdmin(ReplicaChangeListMixin, admin.ModelAdmin):
     list_display = ['id_receita', 'paciente', 'date']
     search_fields = ['paciente__nome']
     list_filter = ['date']
@@ -151,7 +156,7 @@ class ExamesAdmin(admin.ModelAdmin):
 
 
 @admin.register(ItemExames)
-class ItemExamesAdmin(admin.ModelAdmin):
+class ItemExamesAdmin(ReplicaChangeListMixin, admin.ModelAdmin):
     list_display = ['id', 'exames', 'exame', 'resultados_resumo']
     search_fields = ['exame__nome', 'exames__paciente__nome']
     list_filter = ['exame']
@@ -164,6 +169,20 @@ class ItemExamesAdmin(admin.ModelAdmin):
 
 
 @admin.register(Receita)
-class ReceitaAdmin(admin.ModelAdmin):
+class ReceitaAdmin(ReplicaChangeListMixin, admin.ModelAdmin):
     list_display = ['id_receita']
-    ordering = ['-id_receita']
\ No newline at end of file
+    ordering = ['-id_receita']
+
+
+@admin.register(EstatisticaDiaria)
+class EstatisticaDiariaAdmin(ReplicaChangeListMixin, admin.ModelAdmin):
+    list_display = ['data', 'consultas', 'pacientes', 'medicacoes', 'exames']
+    date_hierarchy = 'data'
+    ordering = ['-data']
+    readonly_fields = ['data', 'consultas', 'pacientes', 'medicacoes', 'exames']
+
+
+@admin.register(EstatisticaTotal)
+class EstatisticaTotalAdmin(ReplicaChangeListMixin, admin.ModelAdmin):
+    list_display = ['consultas', 'pacientes', 'medicacoes', 'exames']
+    readonly_fields = ['consultas', 'pacientes', 'medicacoes', 'exames']
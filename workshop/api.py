@@ -0,0 +1,319 @@
+import hashlib
+import uuid
+from collections import defaultdict
+
+from django.apps import apps
+from django.core.cache import cache
+from django.db import transaction
+
+from .pagination import keyset_paginate
+from .routers import retire_after_commit
+from .storage import exam_image_storage
+
+# -------------------------------
+# Read-only JSON API
+# -------------------------------
+# /api/v1/<resource>/ and /api/v1/<resource>/<pk>/ expose the clinical
+# records to external systems. Rows are read with ``values()``, never as
+# model instances, and only for the columns asked for:
+#
+# * ``?fields=nome,email`` selects the columns (the primary key is always
+#   sent);
+# * ``?include=paciente,items`` adds related data: to-one includes are
+#   joined into the same query, to-many includes cost one query for the
+#   whole page;
+# * ``?cursor=`` walks the list by keyset (workshop.pagination), in primary
+#   key order, ``?limit=`` rows at a time;
+# * every response carries an ETag derived from the request and from a
+#   generation token per model it reads. The signal handlers in
+#   workshop.signals retire a model's token when one of its rows is written,
+#   so a poll whose If-None-Match still matches is answered 304 before any
+#   query runs.
+#
+# Like the fragment versions (workshop.fragments), generations live in the
+# default cache, which must be shared by every worker process.
+
+VERSION = 'v1'
+DEFAULT_LIMIT = 50
+MAX_LIMIT = 200
+
+
+class ApiError(Exception):
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.message = message
+        self.status = status
+
+
+def _unchanged(value):
+    return value
+
+
+def _image_url(name):
+    return exam_image_storage().url(name) if name else None
+
+
+class ToOne:
+    """A related row joined into the main query, sent as a nested object."""
+
+    def __init__(self, name, model, fields):
+        self.name = name
+        self.models = (model,)
+        self.fields = fields
+
+    def lookups(self):
+        return [f'{self.name}__{field}' for field in self.fields]
+
+    def attach(self, rows, pk):
+        for row in rows:
+            related = {field: row.pop(f'{self.name}__{field}') for field in self.fields}
+            row[self.name] = related if related[self.fields[0]] is not None else None
+
+
+class ToMany:
+    """Related rows fetched for a whole page at once, sent as a list.
+
+    ``fields`` maps each output key to the lookup (on ``model``) it reads.
+    """
+
+    def __init__(self, name, model, fk, fields, models=(), transforms=None):
+        self.name = name
+        self.model_label = f'workshop.{model}'
+        self.fk = fk
+        self.fields = fields
+        self.models = (model, *models)
+        self.transforms = transforms or {}
+
+    def lookups(self):
+        return []
+
+    def attach(self, rows, pk):
+        model = apps.get_model(self.model_label)
+        related = defaultdict(list)
+        fk = f'{self.fk}_id'
+        values = (
+            model._default_manager.filter(**{f'{fk}__in': [row[pk] for row in rows]})
+            .values(fk, *self.fields.values()).order_by(fk, 'pk')
+        )
+        for value in values:
+            related[value[fk]].append({
+                key: self.transforms.get(key, _unchanged)(value[lookup])
+                for key, lookup in self.fields.items()
+            })
+        for row in rows:
+            row[self.name] = related.get(row[pk], [])
+
+
+class Resource:
+    """One model exposed by the API.
+
+    ``fields`` maps each output key to the lookup it reads; the first is
+    the primary key, which also orders the list.
+    """
+
+    def __init__(self, name, model, fields, includes=(), filters=(), depends_on=()):
+        self.name = name
+        self.model_name = model
+        self.fields = fields
+        self.pk = next(iter(fields))
+        self.includes = {include.name: include for include in includes}
+        self.filters = filters
+        # Models besides ``model`` whose writes change this resource's rows
+        self.depends_on = depends_on
+
+    @property
+    def model(self):
+        return apps.get_model('workshop', self.model_name)
+
+    def parse(self, params):
+        """``(fields, includes)`` requested by ``params``; ApiError if unknown."""
+        fields = list(self.fields)
+        if params.get('fields'):
+            fields = [self.pk] + [
+                name for name in _split(params['fields']) if name != self.pk
+            ]
+            unknown = sorted(set(fields) - set(self.fields))
+            if unknown:
+                raise ApiError(f"Unknown field(s) for {self.name}: {', '.join(unknown)}.")
+        includes = _split(params.get('include', ''))
+        unknown = sorted(set(includes) - set(self.includes))
+        if unknown:
+            raise ApiError(f"Unknown include(s) for {self.name}: {', '.join(unknown)}.")
+        return fields, [self.includes[name] for name in includes]
+
+    def models(self, includes):
+        names = {self.model_name, *self.depends_on}
+        for include in includes:
+            names.update(include.models)
+        return sorted(names)
+
+    def queryset(self, params, fields, includes):
+        lookups = [self.fields[name] for name in fields]
+        for include in includes:
+            lookups += include.lookups()
+        queryset = self.model._default_manager.all()
+        for name in self.filters:
+            if name in params:
+                try:
+                    queryset = queryset.filter(**{name: int(params[name])})
+                except ValueError:
+                    raise ApiError(f'Invalid {name}.')
+        return queryset.values(*dict.fromkeys(lookups))
+
+    def serialize(self, rows, fields, includes):
+        rows = [
+            {name: row[self.fields[name]] for name in fields}
+            | {key: value for key, value in row.items() if '__' in key}
+            for row in rows
+        ]
+        for include in includes:
+            include.attach(rows, self.pk)
+        return rows
+
+    def page(self, params):
+        """The list response body for ``params``."""
+        fields, includes = self.parse(params)
+        try:
+            limit = max(1, min(int(params.get('limit', DEFAULT_LIMIT)), MAX_LIMIT))
+        except ValueError:
+            raise ApiError('Invalid limit.')
+        page = keyset_paginate(
+            self.queryset(params, fields, includes), (self.fields[self.pk],), limit,
+            params.get('cursor'),
+        )
+        return {
+            'data': self.serialize(page.object_list, fields, includes),
+            'next_cursor': page.next_cursor,
+            'previous_cursor': page.previous_cursor,
+        }
+
+    def detail(self, params, pk):
+        """The detail response body for row ``pk``, or None if there is none."""
+        fields, includes = self.parse(params)
+        rows = list(self.queryset(params, fields, includes).filter(pk=pk))
+        if not rows:
+            return None
+        return {'data': self.serialize(rows, fields, includes)[0]}
+
+
+def _split(value):
+    return [name for name in (part.strip() for part in value.split(',')) if name]
+
+
+PACIENTE = ToOne('paciente', 'Paciente', ('cc', 'nome'))
+
+RESOURCES = {resource.name: resource for resource in [
+    Resource(
+        'pacientes', 'Paciente',
+        {name: name for name in (
+            'cc', 'nome', 'data_nascimento', 'morada', 'telefone', 'email',
+            'numero_seguranca_social', 'data_registo', 'num_consultas',
+            'num_medicacoes', 'num_exames', 'ultima_consulta',
+        )},
+        # The activity counters follow these
+        depends_on=('Consulta', 'Medicacao', 'Exames'),
+    ),
+    Resource(
+        'medicos', 'Medico',
+        {name: name for name in (
+            'cc', 'nome', 'data_nascimento', 'morada', 'telefone', 'email',
+            'numero_medico', 'especialidade',
+        )},
+    ),
+    Resource(
+        'consultas', 'Consulta',
+        {'id': 'id', 'paciente': 'paciente', 'data_hora': 'data_hora', 'motivo': 'motivo'},
+        includes=[
+            PACIENTE,
+            ToMany(
+                'medicos', 'MedicoConsulta', 'consulta',
+                {'medico': 'medico', 'nome': 'medico__nome', 'role': 'role'},
+                models=('Medico',),
+            ),
+        ],
+        filters=('paciente',),
+    ),
+    Resource(
+        'medicacoes', 'Medicacao',
+        {'id': 'receita_ptr', 'paciente': 'paciente', 'date': 'date'},
+        includes=[
+            PACIENTE,
+            ToMany(
+                'items', 'ItemMedicacao', 'medicacao',
+                {
+                    'id': 'id', 'medicamento': 'medicamento', 'nome': 'medicamento__nome',
+                    'dose': 'dose', 'quantidade': 'quantidade',
+                },
+                models=('Medicamento',),
+            ),
+        ],
+        filters=('paciente',),
+    ),
+    Resource(
+        'exames', 'Exames',
+        {'id': 'receita_ptr', 'paciente': 'paciente', 'date': 'date'},
+        includes=[
+            PACIENTE,
+            ToMany(
+                'items', 'ItemExames', 'exames',
+                {
+                    'id': 'id', 'exame': 'exame', 'nome': 'exame__nome',
+                    'resultados': 'resultados', 'imagem': 'imagem',
+                },
+                models=('Exame',),
+                transforms={'imagem': _image_url},
+            ),
+        ],
+        filters=('paciente',),
+    ),
+]}
+
+# Every model some resource reads, for the signal handlers
+TRACKED_MODELS = sorted({
+    name
+    for resource in RESOURCES.values()
+    for name in resource.models(resource.includes.values())
+})
+
+
+# -------------------------------
+# Generations and ETags
+# -------------------------------
+
+def generation_key(model_name):
+    return f'api:{model_name}:generation'
+
+
+def generations(model_names):
+    """The current generation token of each of ``model_names``."""
+    keys = {generation_key(name): name for name in model_names}
+    found = cache.get_many(keys)
+    for key in keys.keys() - found.keys():
+        token = uuid.uuid4().hex
+        if not cache.add(key, token, None):
+            token = cache.get(key, token)
+        found[key] = token
+    return [found[key] for key in sorted(keys)]
+
+
+def invalidate(*model_names):
+    """Retire the ETags of every response reading ``model_names``.
+
+    Done at once and again after commit, like ``fragments.invalidate``.
+    """
+    keys = [generation_key(name) for name in set(model_names)]
+    cache.delete_many(keys)
+    transaction.on_commit(lambda: retire_after_commit(keys))
+
+
+def etag(resource, request):
+    """Strong ETag of ``request``'s response; no queries."""
+    try:
+        _, includes = resource.parse(request.GET)
+    except ApiError:
+        includes = []
+    digest = hashlib.sha256()
+    digest.update(request.get_full_path().encode())
+    for token in generations(resource.models(includes)):
+        digest.update(token.encode())
+    return f'"{VERSION}-{digest.hexdigest()[:32]}"'
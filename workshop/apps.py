@@ -3,3 +3,9 @@ from django.apps import AppConfig
 
 class WorkshopConfig(AppConfig):
     name = 'workshop'
+
+    def ready(self):
+        from . import signals  # noqa: F401
+        from .checks import check_shared_cache
+
+        check_shared_cache()
@@ -0,0 +1,511 @@
+import http.cookiejar
+import itertools
+import statistics
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime, timedelta
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.test import Client
+from django.urls import reverse
+
+from . import urls as workshop_urls
+from .models import (
+    Medico, Paciente, Consulta, Medicamento, Medicacao, ItemMedicacao,
+    Exame, Exames, ItemExames
+)
+
+# -------------------------------
+# HTTP Benchmark
+# -------------------------------
+# Drives every route of workshop.urls with concurrent clients and reports
+# throughput and latency percentiles per route (see ``manage.py benchmark``).
+# By default requests go through Django's WSGI handler in-process, one
+# test client per thread, and every POST is rolled back so runs can be
+# repeated against the same data. With ``base_url`` they are sent over HTTP
+# to a running server instead, and POSTs are kept; that is how the ASGI
+# and WSGI deployments are compared (see SNS/asgi.py).
+
+
+class Scenario:
+    """One request to drive: ``data`` is a callable of the iteration number."""
+
+    def __init__(self, url_name, path, method='GET', data=None, expect=None, label=None):
+        self.url_name = url_name
+        self.label = label
+        self.path = path
+        self.method = method
+        self.data = data
+        self.expect = expect or (302 if method == 'POST' else 200)
+
+    @property
+    def name(self):
+        name = self.url_name if self.method == 'GET' else f'{self.url_name} [{self.method}]'
+        return f'{name} ({self.label})' if self.label else name
+
+
+def _allowed_host():
+    for host in settings.ALLOWED_HOSTS:
+        if host != '*':
+            return host.lstrip('.')
+    return 'localhost'
+
+
+class InProcessClient:
+    def __init__(self):
+        self.client = Client(raise_request_exception=False, HTTP_HOST=_allowed_host())
+
+    def request(self, method, path, data=None):
+        if method == 'GET':
+            return self.client.get(path, data).status_code
+        with transaction.atomic():
+            status = self.client.post(path, data).status_code
+            transaction.set_rollback(True)
+        return status
+
+    def close(self):
+        connection.close()
+
+
+class HttpClient:
+    def __init__(self, base_url):
+        self.base_url = base_url.rstrip('/')
+        self.cookies = http.cookiejar.CookieJar()
+        self.opener = urllib.request.build_opener(
+            urllib.request.HTTPCookieProcessor(self.cookies),
+            _NoRedirect,
+        )
+
+    def _csrf_token(self, path):
+        for cookie in self.cookies:
+            if cookie.name == settings.CSRF_COOKIE_NAME:
+                return cookie.value
+        self.request('GET', path)
+        return next(
+            (cookie.value for cookie in self.cookies if cookie.name == settings.CSRF_COOKIE_NAME), ''
+        )
+
+    def request(self, method, path, data=None):
+        url = self.base_url + path
+        body, headers = None, {}
+        if method == 'GET':
+            if data:
+                url += '?' + urllib.parse.urlencode(data, doseq=True)
+        else:
+            token = self._csrf_token(path)
+            body = urllib.parse.urlencode(
+                {**(data or {}), 'csrfmiddlewaretoken': token}, doseq=True
+            ).encode()
+            headers = {'X-CSRFToken': token, 'Referer': url}
+        request = urllib.request.Request(url, data=body, headers=headers, method=method)
+        try:
+            with self.opener.open(request) as response:
+                response.read()
+                return response.status
+        except urllib.error.HTTPError as error:
+            return error.code
+
+    def close(self):
+        pass
+
+
+class _NoRedirect(urllib.request.HTTPRedirectHandler):
+    def redirect_request(self, *args, **kwargs):
+        return None
+
+
+# -------------------------------
+# Scenarios
+# -------------------------------
+
+def _person_data(obj, **overrides):
+    data = {
+        'cc': obj.cc, 'nome': obj.nome, 'data_nascimento': obj.data_nascimento.isoformat(),
+        'morada': obj.morada, 'telefone': obj.telefone, 'email': obj.email,
+    }
+    data.update(overrides)
+    return data
+
+
+def _inline_formset_data(prefix, items, fields, parent_field, parent):
+    data = {
+        f'{prefix}-TOTAL_FORMS': len(items),
+        f'{prefix}-INITIAL_FORMS': len(items),
+        f'{prefix}-MIN_NUM_FORMS': 1,
+        f'{prefix}-MAX_NUM_FORMS': 1000,
+    }
+    for i, item in enumerate(items):
+        data[f'{prefix}-{i}-id'] = item.pk
+        data[f'{prefix}-{i}-{parent_field}'] = parent.pk
+        for field, attname in fields.items():
+            data[f'{prefix}-{i}-{field}'] = getattr(item, attname)
+    return data
+
+
+def _new_formset_data(prefix, fields):
+    data = {
+        f'{prefix}-TOTAL_FORMS': 1,
+        f'{prefix}-INITIAL_FORMS': 0,
+        f'{prefix}-MIN_NUM_FORMS': 1,
+        f'{prefix}-MAX_NUM_FORMS': 1000,
+    }
+    data.update({f'{prefix}-0-{field}': value for field, value in fields.items()})
+    return data
+
+
+def _future_slot(serial):
+    """A distinct consultation time from tomorrow on, for the ``serial``-th booking."""
+    tomorrow = datetime.combine(date.today() + timedelta(days=1), datetime.min.time())
+    return (tomorrow + timedelta(minutes=30 * (serial % 10**6))).strftime('%Y-%m-%dT%H:%M')
+
+
+def _future_series(serial, weeks):
+    """First time of the ``serial``-th weekly series of ``weeks`` consultations.
+
+    Series start a year out, so they never meet single bookings, and each
+    week of start times is followed by ``weeks`` weeks left to its series.
+    """
+    first = datetime.combine(date.today() + timedelta(days=365), datetime.min.time())
+    block, slot = divmod(serial % 10**6, 7 * 48)
+    return (first + timedelta(weeks=block * weeks, minutes=30 * slot)).strftime('%Y-%m-%dT%H:%M')
+
+
+def build_scenarios():
+    """Build requests for every route, using rows sampled from the database.
+
+    Routes whose arguments cannot be filled from the current data (e.g. an
+    empty table) are left out; ``uncovered_routes`` reports them.
+    """
+    paciente = Paciente.objects.order_by('cc').first()
+    medico = Medico.objects.order_by('cc').first()
+    consulta = Consulta.objects.order_by('pk').first()
+    medicacao = Medicacao.objects.order_by('pk').first()
+    exames = Exames.objects.order_by('pk').first()
+    item_exames = ItemExames.objects.order_by('pk').first()
+    medicamento = Medicamento.objects.order_by('pk').first()
+    exame = Exame.objects.order_by('pk').first()
+    numeric_exame = next(
+        (pk for pk in Exame.objects.values_list('pk', flat=True).order_by('pk') if pk.isdigit()), None
+    )
+    today = date.today().isoformat()
+    # Unique values for rows created by POSTs, also across runs over HTTP
+    serial = itertools.count(int(time.time() * 1000) % 10**9)
+
+    scenarios = [
+        Scenario('home', reverse('home')),
+        Scenario('patient_dashboard', reverse('patient_dashboard')),
+        Scenario('doctor_dashboard', reverse('doctor_dashboard')),
+        Scenario('patient_medicacoes', reverse('patient_medicacoes')),
+        Scenario('patient_exames', reverse('patient_exames')),
+        Scenario('admin_dashboard', reverse('admin_dashboard')),
+        Scenario('list_medicos', reverse('list_medicos')),
+        Scenario('list_pacientes', reverse('list_pacientes')),
+        Scenario('list_medicamento', reverse('list_medicamento')),
+        Scenario('list_exame', reverse('list_exame')),
+        Scenario('schedule_consulta', reverse('schedule_consulta')),
+        Scenario('schedule_series', reverse('schedule_series')),
+        Scenario('create_medicacao', reverse('create_medicacao')),
+        Scenario('create_exames', reverse('create_exames')),
+        Scenario('create_medico', reverse('create_medico')),
+        Scenario('create_paciente', reverse('create_paciente')),
+        Scenario('create_medicamento', reverse('create_medicamento')),
+        Scenario('create_exame', reverse('create_exame')),
+        Scenario('query_report', reverse('query_report'), expect=200 if settings.DEBUG else 404),
+        Scenario('paciente_typeahead', reverse('paciente_typeahead'), data=lambda n: {'q': 'Ma'}),
+        Scenario('autocomplete', reverse('autocomplete', args=['paciente']),
+                 data=lambda n: {'q': 'Ma'}, label='paciente'),
+        Scenario('autocomplete', reverse('autocomplete', args=['medicamento']),
+                 data=lambda n: {'q': 'Para'}, label='medicamento'),
+        Scenario('list_pacientes', reverse('list_pacientes'),
+                 data=lambda n: {'search': 'Silva'}, label='search'),
+        Scenario(
+            'create_medico', reverse('create_medico'), 'POST',
+            lambda n: {
+                'cc': 9 * 10**9 + n, 'nome': f'Benchmark Medico {n}', 'data_nascimento': '1970-01-01',
+                'morada': 'Rua', 'telefone': 910000000, 'email': f'bench-medico{n}@sns.example.pt',
+                'numero_medico': 9 * 10**9 + n, 'especialidade': 'General Medicine',
+            },
+        ),
+        Scenario(
+            'create_paciente', reverse('create_paciente'), 'POST',
+            lambda n: {
+                'cc': 9 * 10**9 + n, 'nome': f'Benchmark Paciente {n}', 'data_nascimento': '1980-01-01',
+                'morada': 'Rua', 'telefone': 920000000, 'email': f'bench-paciente{n}@sns.example.pt',
+                'numero_seguranca_social': 9 * 10**9 + n,
+            },
+        ),
+        Scenario(
+            'create_medicamento', reverse('create_medicamento'), 'POST',
+            lambda n: {'id_medicamento': f'BENCH{n}', 'nome': f'Benchmark {n}'},
+        ),
+        Scenario(
+            'create_exame', reverse('create_exame'), 'POST',
+            lambda n: {'id_exame': f'BENCH{n}', 'nome': f'Benchmark {n}'},
+        ),
+        Scenario(
+            'upload_create', reverse('upload_create'), 'POST',
+            lambda n: {'filename': f'benchmark{n}.png', 'size': 1024}, expect=201,
+        ),
+        Scenario('upload_session', reverse('upload_session', args=[uuid.UUID(int=0)]),
+                 expect=404, label='unknown'),
+        Scenario('api_list', reverse('api_list', args=['pacientes']),
+                 data=lambda n: {'fields': 'nome,email'}, label='pacientes'),
+        Scenario('api_list', reverse('api_list', args=['medicacoes']),
+                 data=lambda n: {'include': 'paciente,items'}, label='medicacoes'),
+    ]
+
+    if paciente:
+        scenarios += [
+            Scenario('patient_dashboard', reverse('patient_dashboard'),
+                     data=lambda n: {'patient_cc': paciente.cc}, label='patient selected'),
+            Scenario('doctor_dashboard', reverse('doctor_dashboard'),
+                     data=lambda n: {'patient_cc': paciente.cc}, label='patient selected'),
+            Scenario('patient_timeline', reverse('patient_timeline', args=[paciente.cc])),
+            Scenario('patient_timeline_json', reverse('patient_timeline_json', args=[paciente.cc])),
+            Scenario('update_paciente', reverse('update_paciente', args=[paciente.cc])),
+            Scenario(
+                'update_paciente', reverse('update_paciente', args=[paciente.cc]), 'POST',
+                lambda n: _person_data(
+                    paciente, numero_seguranca_social=paciente.numero_seguranca_social,
+                    morada=f'Rua {n}',
+                ),
+            ),
+            Scenario(
+                'schedule_consulta', reverse('schedule_consulta'), 'POST',
+                lambda n: {
+                    'paciente': paciente.cc, 'medico': medico.cc if medico else '',
+                    'data_hora': _future_slot(next(serial)), 'motivo': f'Benchmark {n}',
+                },
+            ),
+        ]
+    if paciente and medico:
+        scenarios.append(Scenario(
+            'schedule_series', reverse('schedule_series'), 'POST',
+            lambda n: {
+                'paciente': paciente.cc, 'medico': medico.cc, 'frequencia': 'weekly',
+                'ocorrencias': 4, 'data_hora': _future_series(next(serial), 4),
+                'motivo': f'Benchmark {n}',
+            },
+        ))
+    if medico:
+        scenarios += [
+            Scenario('free_slots', reverse('free_slots'),
+                     data=lambda n: {'medico': medico.cc}, label='doctor'),
+            Scenario('free_slots', reverse('free_slots'),
+                     data=lambda n: {'especialidade': medico.especialidade}, label='specialty'),
+            Scenario('update_medico', reverse('update_medico', args=[medico.cc])),
+            Scenario(
+                'update_medico', reverse('update_medico', args=[medico.cc]), 'POST',
+                lambda n: _person_data(
+                    medico, numero_medico=medico.numero_medico,
+                    especialidade=medico.especialidade, morada=f'Rua {n}',
+                ),
+            ),
+        ]
+    if consulta:
+        scenarios += [
+            Scenario('consulta_detail', reverse('consulta_detail', args=[consulta.pk])),
+            Scenario('update_consulta', reverse('update_consulta', args=[consulta.pk])),
+            Scenario(
+                'update_consulta', reverse('update_consulta', args=[consulta.pk]), 'POST',
+                lambda n: {'data_hora': f'{today}T11:00', 'motivo': f'Benchmark {n}'},
+            ),
+        ]
+    if medicacao:
+        med_items = list(ItemMedicacao.objects.filter(medicacao=medicacao))
+        scenarios += [
+            Scenario('medicacao_detail', reverse('medicacao_detail', args=[medicacao.pk])),
+            Scenario('api_detail', reverse('api_detail', args=['medicacoes', medicacao.pk]),
+                     data=lambda n: {'include': 'items'}, label='medicacoes'),
+            Scenario('update_medicacao', reverse('update_medicacao', args=[medicacao.pk])),
+            Scenario(
+                'update_medicacao', reverse('update_medicacao', args=[medicacao.pk]), 'POST',
+                lambda n: {
+                    'paciente': medicacao.paciente_id, 'date': medicacao.date.isoformat(),
+                    **_inline_formset_data(
+                        'itemmedicacao_set', med_items,
+                        {'medicamento': 'medicamento_id', 'dose': 'dose', 'quantidade': 'quantidade'},
+                        'medicacao', medicacao,
+                    ),
+                },
+            ),
+        ]
+    if exames:
+        exam_items = list(ItemExames.objects.filter(exames=exames))
+        scenarios += [
+            Scenario('exames_detail', reverse('exames_detail', args=[exames.pk])),
+            Scenario('update_exames', reverse('update_exames', args=[exames.pk])),
+            Scenario(
+                'update_exames', reverse('update_exames', args=[exames.pk]), 'POST',
+                lambda n: {
+                    'paciente': exames.paciente_id, 'date': exames.date.isoformat(),
+                    **_inline_formset_data(
+                        'itemexames_set', exam_items,
+                        {'exame': 'exame_id', 'resultados': 'resultados'}, 'exames', exames,
+                    ),
+                },
+            ),
+        ]
+    if item_exames:
+        scenarios += [
+            Scenario('update_exame_results', reverse('update_exame_results', args=[item_exames.pk])),
+            Scenario(
+                'update_exame_results', reverse('update_exame_results', args=[item_exames.pk]), 'POST',
+                lambda n: {'resultados': f'Benchmark {n}'},
+            ),
+        ]
+    if medicamento:
+        scenarios += [
+            Scenario('update_medicamento', reverse('update_medicamento', args=[medicamento.pk])),
+            Scenario(
+                'update_medicamento', reverse('update_medicamento', args=[medicamento.pk]), 'POST',
+                lambda n: {'id_medicamento': medicamento.pk, 'nome': medicamento.nome},
+            ),
+        ]
+    if paciente and medicamento:
+        scenarios.append(Scenario(
+            'create_medicacao', reverse('create_medicacao'), 'POST',
+            lambda n: {
+                'paciente': paciente.cc, 'date': today,
+                **_new_formset_data('itemmedicacao_set', {
+                    'medicamento': medicamento.pk, 'dose': '1 tablet daily', 'quantidade': 1,
+                }),
+            },
+        ))
+    if paciente and exame:
+        scenarios.append(Scenario(
+            'create_exames', reverse('create_exames'), 'POST',
+            lambda n: {
+                'paciente': paciente.cc, 'date': today,
+                **_new_formset_data('itemexames_set', {'exame': exame.pk, 'resultados': ''}),
+            },
+        ))
+    if numeric_exame:
+        # The route only accepts integer ids
+        scenarios += [
+            Scenario('update_exame', reverse('update_exame', args=[numeric_exame])),
+            Scenario(
+                'update_exame', reverse('update_exame', args=[numeric_exame]), 'POST',
+                lambda n: {'id_exame': numeric_exame, 'nome': f'Benchmark {n}'},
+            ),
+        ]
+
+    for scenario in scenarios:
+        if scenario.data is not None and scenario.method == 'POST':
+            factory = scenario.data
+            scenario.data = lambda n, factory=factory: factory(next(serial))
+    return scenarios
+
+
+def uncovered_routes(scenarios):
+    """Names in workshop.urls that no scenario drives."""
+    names = {pattern.name for pattern in workshop_urls.urlpatterns if pattern.name}
+    return sorted(names - {scenario.url_name for scenario in scenarios})
+
+
+# -------------------------------
+# Running
+# -------------------------------
+
+def _percentile(quantiles, p):
+    return round(quantiles[p - 1], 2) if quantiles else None
+
+
+def summarize(latencies, errors, elapsed):
+    """Throughput (requests/s) and latency percentiles (ms) of one scenario."""
+    latencies = sorted(latencies)
+    quantiles = statistics.quantiles(latencies, n=100, method='inclusive') if len(latencies) > 1 else latencies * 99
+    return {
+        'requests': len(latencies),
+        'errors': errors,
+        'throughput': round(len(latencies) / elapsed, 2) if elapsed else None,
+        'mean': round(statistics.fmean(latencies), 2) if latencies else None,
+        'p50': _percentile(quantiles, 50),
+        'p95': _percentile(quantiles, 95),
+        'p99': _percentile(quantiles, 99),
+    }
+
+
+def run_scenario(scenario, make_client, concurrency, requests, warmup=0):
+    """Drive ``scenario`` with ``concurrency`` clients, ``requests`` in total."""
+    latencies, statuses = [], {}
+    lock = threading.Lock()
+    counter = itertools.count()
+
+    def worker():
+        client = make_client()
+        try:
+            for _ in range(warmup):
+                client.request(scenario.method, scenario.path, scenario.data and scenario.data(0))
+            while (n := next(counter)) < requests:
+                data = scenario.data(n) if scenario.data else None
+                started = time.perf_counter()
+                status = client.request(scenario.method, scenario.path, data)
+                elapsed = (time.perf_counter() - started) * 1000
+                with lock:
+                    latencies.append(elapsed)
+                    statuses[status] = statuses.get(status, 0) + 1
+        finally:
+            client.close()
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(concurrency) as pool:
+        for future in [pool.submit(worker) for _ in range(concurrency)]:
+            future.result()
+    elapsed = time.perf_counter() - started
+
+    errors = sum(count for status, count in statuses.items() if status != scenario.expect)
+    result = summarize(latencies, errors, elapsed)
+    result['statuses'] = {str(status): count for status, count in sorted(statuses.items())}
+    return result
+
+
+def run_benchmark(scenarios, concurrency=8, requests=200, warmup=2, base_url=None, progress=None):
+    if base_url:
+        make_client = lambda: HttpClient(base_url)
+    else:
+        make_client = InProcessClient
+
+    results = {}
+    for scenario in scenarios:
+        result = results[scenario.name] = run_scenario(
+            scenario, make_client, concurrency, requests, warmup
+        )
+        result['path'] = scenario.path
+        if progress:
+            progress(scenario.name, result)
+    return results
+
+
+# -------------------------------
+# Baselines
+# -------------------------------
+
+def compare(results, baseline, tolerance=0.2):
+    """List regressions of ``results`` against ``baseline`` results.
+
+    A scenario regresses when its p95 latency grows, or its throughput
+    drops, by more than ``tolerance`` (a fraction), or when it starts
+    failing.
+    """
+    regressions = []
+    for name, result in results.items():
+        previous = baseline.get(name)
+        if not previous:
+            continue
+        if result['errors'] > previous.get('errors', 0):
+            regressions.append(f"{name}: {result['errors']} errors (baseline {previous.get('errors', 0)})")
+        if previous.get('p95') and result['p95'] and result['p95'] > previous['p95'] * (1 + tolerance):
+            regressions.append(f"{name}: p95 {result['p95']}ms (baseline {previous['p95']}ms)")
+        if (previous.get('throughput') and result['throughput']
+                and result['throughput'] < previous['throughput'] * (1 - tolerance)):
+            regressions.append(
+                f"{name}: {result['throughput']} req/s (baseline {previous['throughput']} req/s)"
+            )
+    return regressions
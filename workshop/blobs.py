@@ -0,0 +1,99 @@
+import time
+from datetime import timedelta
+
+from django.apps import apps as global_apps
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F
+
+from .storage import exam_image_storage
+
+# -------------------------------
+# Exam Image Reference Counts
+# -------------------------------
+# ImagemBlob.refcount is the number of ItemExames rows whose imagem names a
+# file. The signal handlers in workshop.signals adjust it inside the
+# writer's transaction; ``manage.py collect_exam_images --repair`` recounts
+# it from ItemExames.
+#
+# Garbage collection deletes content-addressed files (see workshop.storage)
+# that no row references. Files younger than the grace period are kept: they
+# may belong to a save whose transaction has not committed yet, so every
+# save, deduplicated or moved into place, sets the file's mtime to the time
+# it was stored, under a lock that garbage collection also takes to recheck
+# the mtime right before unlinking.
+
+UPLOAD_DIR = 'ImagemExames'
+GC_GRACE = timedelta(hours=1)
+
+
+def record_added(name, count=1):
+    from .models import ImagemBlob
+
+    if not name:
+        return
+    blobs = ImagemBlob.objects.filter(name=name)
+    if blobs.update(refcount=F('refcount') + count):
+        return
+    try:
+        with transaction.atomic():
+            ImagemBlob.objects.create(name=name, refcount=count)
+    except IntegrityError:
+        # Another writer created the row first
+        blobs.update(refcount=F('refcount') + count)
+
+
+def record_removed(name, count=1):
+    from .models import ImagemBlob
+
+    if name:
+        ImagemBlob.objects.filter(name=name).update(refcount=F('refcount') - count)
+
+
+def repair_refcounts(apps=global_apps):
+    """Recount every image's references from ItemExames.
+
+    Returns the number of distinct images referenced.
+    """
+    ImagemBlob = apps.get_model('workshop', 'ImagemBlob')
+    ItemExames = apps.get_model('workshop', 'ItemExames')
+
+    counts = (
+        ItemExames.objects.exclude(imagem='').exclude(imagem__isnull=True)
+        .values('imagem').annotate(total=Count('pk')).values_list('imagem', 'total').order_by()
+    )
+    with transaction.atomic():
+        ImagemBlob.objects.all().delete()
+        ImagemBlob.objects.bulk_create(
+            [ImagemBlob(name=name, refcount=total) for name, total in counts], batch_size=1000
+        )
+    return ImagemBlob.objects.count()
+
+
+def collect_garbage(grace=GC_GRACE, dry_run=False, storage=None):
+    """Delete unreferenced content-addressed images older than ``grace``.
+
+    Returns ``(files, bytes)`` removed (or that would be, with ``dry_run``).
+    """
+    from .models import ImagemBlob
+
+    storage = storage or exam_image_storage()
+    referenced = set(
+        ImagemBlob.objects.filter(refcount__gt=0).values_list('name', flat=True)
+    )
+    cutoff = time.time() - grace.total_seconds()
+    files = size = 0
+    for name, mtime in storage.blobs(UPLOAD_DIR):
+        if name in referenced or mtime > cutoff:
+            continue
+        if dry_run:
+            removed = storage.size(name)
+        else:
+            # Checks the mtime again: a save may have reused the blob since
+            removed = storage.delete_unless_newer(name, cutoff)
+            if removed is None:
+                continue
+        files += 1
+        size += removed
+    if not dry_run:
+        ImagemBlob.objects.filter(refcount__lte=0).delete()
+    return files, size
@@ -0,0 +1,126 @@
+import threading
+import uuid
+
+from django import forms
+from django.apps import apps
+from django.core.cache import cache
+from django.db import transaction
+
+# -------------------------------
+# Reference Catalog Cache
+# -------------------------------
+# Medicamento and Exame are large, rarely edited tables offered in every row
+# of the prescription formsets. Each catalog is loaded once per process and
+# shared by all rows and requests: CatalogChoiceField validates and builds
+# instances from it without queries. The rows render an AutocompleteInput
+# (workshop.forms) rather than the whole catalog as <option>s, and label
+# their current value from the cached copy too.
+#
+# The generation is a token in the default cache. The signal handlers in
+# workshop.signals delete it whenever a catalog entry is saved or deleted
+# (so every write through the administration views), and each process
+# reloads its copy when it sees a new token. Writes that bypass signals,
+# like bulk_create, must call ``invalidate()`` themselves.
+
+
+class CatalogState:
+    def __init__(self, generation, entries):
+        self.generation = generation
+        # pk -> label, in display order
+        self.entries = entries
+
+
+class Catalog:
+    def __init__(self, model_label, label_field='nome'):
+        self.model_label = model_label
+        self.label_field = label_field
+        self._state = None
+        self._lock = threading.Lock()
+
+    @property
+    def model(self):
+        return apps.get_model(self.model_label)
+
+    @property
+    def cache_key(self):
+        return f'catalog:{self.model_label}:generation'
+
+    def _generation(self):
+        generation = cache.get(self.cache_key)
+        if generation is None:
+            generation = uuid.uuid4().hex
+            if not cache.add(self.cache_key, generation, None):
+                generation = cache.get(self.cache_key, generation)
+        return generation
+
+    def state(self):
+        """The current catalog, loading it if this process's copy is stale."""
+        generation = self._generation()
+        state = self._state
+        if state is None or state.generation != generation:
+            with self._lock:
+                state = self._state
+                if state is None or state.generation != generation:
+                    model = self.model
+                    entries = dict(
+                        model._default_manager.order_by(self.label_field, 'pk')
+                        .values_list('pk', self.label_field)
+                    )
+                    state = self._state = CatalogState(generation, entries)
+        return state
+
+    def instance(self, pk):
+        """The catalog entry ``pk`` as a model instance, or None."""
+        label = self.state().entries.get(pk)
+        if label is None:
+            return None
+        model = self.model
+        return model.from_db(None, [model._meta.pk.attname, self.label_field], [pk, label])
+
+    def invalidate(self):
+        """Have every process reload the catalog, now and after commit."""
+        cache.delete(self.cache_key)
+        transaction.on_commit(lambda: cache.delete(self.cache_key))
+
+
+MEDICAMENTOS = Catalog('workshop.Medicamento')
+EXAMES = Catalog('workshop.Exame')
+CATALOGS = {'Medicamento': MEDICAMENTOS, 'Exame': EXAMES}
+
+
+class CatalogChoiceField(forms.ModelChoiceField):
+    """ModelChoiceField answered from a Catalog rather than the database.
+
+    It has no choices to list: give it an AutocompleteInput widget.
+    """
+
+    def __init__(self, catalog, **kwargs):
+        self.catalog = catalog
+        super().__init__(catalog.model._default_manager.none(), **kwargs)
+
+    def to_python(self, value):
+        if value in self.empty_values:
+            return None
+        instance = self.catalog.instance(str(value))
+        if instance is None:
+            raise forms.ValidationError(
+                self.error_messages['invalid_choice'], code='invalid_choice',
+                params={'value': value},
+            )
+        return instance
+
+
+class CatalogFormMixin:
+    """ModelForm mixin skipping the per-row foreign key check of catalog fields.
+
+    The catalog already vouched for the value, and the foreign key
+    constraint still guards the write.
+    """
+
+    def _get_validation_exclusions(self):
+        exclude = super()._get_validation_exclusions()
+        exclude.update(
+            name for name, field in self.fields.items() if isinstance(field, CatalogChoiceField)
+        )
+        return exclude
+
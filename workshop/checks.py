@@ -0,0 +1,24 @@
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.exceptions import ImproperlyConfigured
+
+# -------------------------------
+# Shared Cache
+# -------------------------------
+# Fragment versions, API generations and catalog generations are
+# invalidated by deleting or bumping a key in the default cache. A
+# LocMemCache lives in one process, so with several workers an invalidation
+# reaches only the worker that made the write and the others keep serving
+# stale fragments and ETags. Startup is refused in that configuration
+# instead of serving them.
+
+
+def check_shared_cache():
+    """Raise ImproperlyConfigured if several workers would not share the cache."""
+    workers = getattr(settings, 'WEB_CONCURRENCY', 1)
+    if workers > 1 and isinstance(caches['default'], LocMemCache):
+        raise ImproperlyConfigured(
+            f'WEB_CONCURRENCY is {workers} but the default cache is a per-process '
+            'LocMemCache; set CACHE_URL to a shared Redis server.'
+        )
@@ -0,0 +1,98 @@
+from itertools import islice
+
+from django.apps import apps as global_apps
+from django.db.models import Count, F, IntegerField, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce, Greatest
+
+# -------------------------------
+# Per-patient Activity Counters
+# -------------------------------
+# Paciente.num_consultas/num_medicacoes/num_exames and ultima_consulta are
+# adjusted in place by the signal handlers in workshop.signals, inside the
+# writer's transaction. ``manage.py repair_patient_counters`` recomputes
+# them from the source tables, then retires the dashboard fragments and API
+# ETags that may have been cached with drifted values.
+
+COUNTERS = {
+    'Consulta': 'num_consultas',
+    'Medicacao': 'num_medicacoes',
+    'Exames': 'num_exames',
+}
+INVALIDATE_BATCH = 1000
+
+
+def _pacientes(paciente_id):
+    from .models import Paciente
+    return Paciente.objects.filter(pk=paciente_id)
+
+
+def _latest_consulta(Consulta):
+    return Subquery(
+        Consulta.objects.filter(paciente=OuterRef('pk'))
+        .order_by('-data_hora').values('data_hora')[:1]
+    )
+
+
+def record_added(model_name, paciente_id, data_hora=None, count=1):
+    counter = COUNTERS[model_name]
+    changes = {counter: F(counter) + count}
+    if data_hora is not None:
+        # GREATEST skips NULLs on PostgreSQL, so a first consultation wins
+        changes['ultima_consulta'] = Greatest(F('ultima_consulta'), Value(data_hora))
+    _pacientes(paciente_id).update(**changes)
+
+
+def record_removed(model_name, paciente_id):
+    from .models import Consulta
+
+    counter = COUNTERS[model_name]
+    # Never below zero: a drifted counter must not fail the user's delete
+    changes = {counter: Greatest(F(counter) - 1, Value(0))}
+    if model_name == 'Consulta':
+        changes['ultima_consulta'] = _latest_consulta(Consulta)
+    _pacientes(paciente_id).update(**changes)
+
+
+def refresh_ultima_consulta(paciente_id):
+    from .models import Consulta
+
+    _pacientes(paciente_id).update(ultima_consulta=_latest_consulta(Consulta))
+
+
+def _count(model, field):
+    return Coalesce(Subquery(
+        model.objects.filter(**{field: OuterRef('pk')}).order_by()
+        .values(field).annotate(total=Count('pk')).values('total'),
+        output_field=IntegerField(),
+    ), 0)
+
+
+def repair_patient_counters(apps=global_apps):
+    """Recompute every patient's counters in one UPDATE.
+
+    Also retires every patient's cached fragments and the patient API
+    ETags, which may show the drifted values. Returns the number of
+    patients updated.
+    """
+    Paciente = apps.get_model('workshop', 'Paciente')
+    Consulta = apps.get_model('workshop', 'Consulta')
+    Medicacao = apps.get_model('workshop', 'Medicacao')
+    Exames = apps.get_model('workshop', 'Exames')
+
+    updated = Paciente.objects.update(
+        num_consultas=_count(Consulta, 'paciente'),
+        num_medicacoes=_count(Medicacao, 'paciente'),
+        num_exames=_count(Exames, 'paciente'),
+        ultima_consulta=_latest_consulta(Consulta),
+    )
+    _invalidate_cached(Paciente)
+    return updated
+
+
+def _invalidate_cached(Paciente):
+    from . import api, fragments
+
+    ccs = Paciente.objects.order_by().values_list('cc', flat=True).iterator(INVALIDATE_BATCH)
+    while batch := list(islice(ccs, INVALIDATE_BATCH)):
+        fragments.invalidate(*batch)
+    api.invalidate('Paciente')
@@ -0,0 +1,339 @@
+import io
+import os
+import random
+from datetime import datetime, time, timedelta, timezone as dt_timezone
+
+import django
+from django.db import connection, transaction
+
+# -------------------------------
+# Synthetic Dataset Generator
+# -------------------------------
+# Produces production-sized data for load testing (see
+# ``manage.py generate_dataset``). Patients are generated in fixed-size
+# chunks, each from its own ``random.Random`` seeded with (seed, chunk), so
+# the same seed yields the same rows however many workers share the work.
+#
+# Every id a row is referenced by is known before any worker starts: patient
+# and doctor numbers are consecutive ranges above the current maximums, and
+# consultation/prescription ids are reserved in one block from their
+# sequences. Workers therefore never probe the database for free values and
+# write each table of a chunk with a single COPY. The sequence reservation
+# is not safe against other writers running at the same time.
+#
+# Models are imported lazily: worker processes unpickle this module before
+# Django is set up in them.
+
+FIRST_NAMES = [
+    'Ana', 'Beatriz', 'Carla', 'Diana', 'Eduarda', 'Filipa', 'Gabriela', 'Helena',
+    'Inês', 'Joana', 'Leonor', 'Maria', 'Marta', 'Rita', 'Sofia', 'Teresa',
+    'André', 'Bruno', 'Carlos', 'Daniel', 'Eduardo', 'Filipe', 'Gonçalo', 'Hugo',
+    'João', 'José', 'Luís', 'Miguel', 'Nuno', 'Pedro', 'Rui', 'Tiago',
+]
+LAST_NAMES = [
+    'Silva', 'Santos', 'Ferreira', 'Pereira', 'Oliveira', 'Costa', 'Rodrigues',
+    'Martins', 'Jesus', 'Sousa', 'Fernandes', 'Gonçalves', 'Gomes', 'Lopes',
+    'Marques', 'Alves', 'Almeida', 'Ribeiro', 'Pinto', 'Carvalho', 'Teixeira',
+    'Moreira', 'Correia', 'Mendes', 'Nunes', 'Soares', 'Vieira', 'Monteiro',
+]
+STREETS = [
+    'Rua Augusta', 'Avenida da Liberdade', 'Rua de Santa Catarina', 'Rua do Carmo',
+    'Avenida dos Aliados', 'Rua Direita', 'Rua da Prata', 'Avenida da República',
+]
+CITIES = ['Lisboa', 'Porto', 'Coimbra', 'Braga', 'Faro', 'Aveiro', 'Évora', 'Viseu']
+SPECIALTIES = [
+    'Cardiology', 'Dermatology', 'Pediatrics', 'Orthopedics',
+    'Neurology', 'Psychiatry', 'General Medicine',
+]
+REASONS = [
+    'Persistent headache', 'Annual check-up', 'Back pain', 'Respiratory problems',
+    'Routine consultation', 'Medication control', 'Post-operative follow-up',
+    'Abdominal pain', 'High fever', 'Skin problems',
+]
+DOSES = ['1 tablet every 8 hours', '1 tablet daily', '2 tablets daily', '5 ml twice a day']
+RESULTS = ['', '', 'Within normal range', 'Slightly elevated', 'Below reference values']
+MEDICAMENTOS = [
+    ('PARA500', 'Paracetamol 500mg'), ('IBU400', 'Ibuprofen 400mg'),
+    ('AML05', 'Amoxicillin 500mg'), ('SERT25', 'Sertraline 25mg'),
+    ('ATOR20', 'Atorvastatin 20mg'), ('OMEP20', 'Omeprazole 20mg'),
+    ('METF850', 'Metformin 850mg'), ('LOSA50', 'Losartan 50mg'),
+]
+EXAMES = [
+    ('HEMO01', 'Complete Blood Count'), ('GLIC02', 'Fasting Blood Glucose'),
+    ('COL03', 'Total Cholesterol'), ('UREIA04', 'Urea and Creatinine'),
+    ('TSH05', 'Thyroid Stimulating Hormone'), ('RX06', 'Chest X-Ray'),
+]
+
+
+class DatasetPlan:
+    """Sizes, id ranges and seed shared by every chunk of one run."""
+
+    def __init__(self, seed, patients, doctors, consultas_per_patient,
+                 medicacoes_per_patient, exames_per_patient, chunk_size, until, years):
+        self.seed = seed
+        self.patients = patients
+        self.doctors = doctors
+        self.consultas_per_patient = consultas_per_patient
+        self.medicacoes_per_patient = medicacoes_per_patient
+        self.exames_per_patient = exames_per_patient
+        self.chunk_size = chunk_size
+        self.until = until
+        self.years = years
+
+    @property
+    def chunks(self):
+        return range((self.patients + self.chunk_size - 1) // self.chunk_size)
+
+    def chunk_patients(self, chunk):
+        return min(self.chunk_size, self.patients - chunk * self.chunk_size)
+
+    def chunk_offsets(self, chunk):
+        """Index of the chunk's first patient, consultation and prescription."""
+        first = chunk * self.chunk_size
+        prescriptions = self.medicacoes_per_patient + self.exames_per_patient
+        return first, first * self.consultas_per_patient, first * prescriptions
+
+    def allocate(self):
+        """Reserve every id range the run will write. Runs in the parent."""
+        from .models import Medico, Paciente, Consulta, Receita
+
+        self.paciente_cc = _next_value(Paciente, 'cc', 10000000)
+        self.paciente_nss = _next_value(Paciente, 'numero_seguranca_social', 200000000)
+        self.medico_cc = _next_value(Medico, 'cc', 30000000)
+        self.numero_medico = _next_value(Medico, 'numero_medico', 5000)
+        self.first_consulta = _reserve_ids(
+            Consulta, self.patients * self.consultas_per_patient
+        )
+        self.first_receita = _reserve_ids(
+            Receita, self.patients * (self.medicacoes_per_patient + self.exames_per_patient)
+        )
+
+    def rng(self, chunk):
+        return random.Random(f'{self.seed}:{chunk}')
+
+
+def _next_value(model, field, floor):
+    from django.db.models import Max
+
+    current = model.objects.aggregate(value=Max(field))['value']
+    return max(current + 1 if current is not None else floor, floor)
+
+
+def _reserve_ids(model, count):
+    """Take ``count`` consecutive ids from ``model``'s primary key sequence."""
+    if not count:
+        return None
+    with connection.cursor() as cursor:
+        cursor.execute(
+            'SELECT pg_get_serial_sequence(%s, %s)',
+            [model._meta.db_table, model._meta.pk.column],
+        )
+        sequence = cursor.fetchone()[0]
+        cursor.execute('SELECT setval(%s, nextval(%s) + %s - 1)', [sequence, sequence, count])
+        last = cursor.fetchone()[0]
+    return last - count + 1
+
+
+# -------------------------------
+# COPY
+# -------------------------------
+
+def _copy_text(value):
+    if value is None:
+        return '\\N'
+    if isinstance(value, bool):
+        return 't' if value else 'f'
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return (
+        str(value).replace('\\', '\\\\').replace('\t', '\\t')
+        .replace('\n', '\\n').replace('\r', '\\r')
+    )
+
+
+def copy_rows(cursor, table, columns, rows):
+    """Write ``rows`` into ``table`` with one ``COPY ... FROM STDIN``."""
+    sql = 'COPY {} ({}) FROM STDIN'.format(
+        connection.ops.quote_name(table),
+        ', '.join(connection.ops.quote_name(column) for column in columns),
+    )
+    raw = cursor.cursor
+    if hasattr(raw, 'copy'):
+        # psycopg 3
+        with raw.copy(sql) as copy:
+            for row in rows:
+                copy.write_row(row)
+    else:
+        # psycopg2
+        buffer = io.StringIO()
+        for row in rows:
+            buffer.write('\t'.join(_copy_text(value) for value in row))
+            buffer.write('\n')
+        buffer.seek(0)
+        raw.copy_expert(sql, buffer)
+
+
+def _table(model):
+    return model._meta.db_table
+
+
+# -------------------------------
+# Generation
+# -------------------------------
+
+def _person(rng):
+    nome = f'{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)} {rng.choice(LAST_NAMES)}'
+    morada = f'{rng.choice(STREETS)} {rng.randint(1, 400)}, {rng.choice(CITIES)}'
+    return nome, morada
+
+
+def _birth_date(rng, until, min_age, max_age):
+    return until - timedelta(days=rng.randint(min_age * 365, max_age * 365))
+
+
+def generate_doctors(plan):
+    """Insert the plan's doctors and return their ``cc`` values."""
+    from .models import Medico
+
+    rng = plan.rng('doctors')
+    rows = []
+    for i in range(plan.doctors):
+        cc = plan.medico_cc + i
+        nome, morada = _person(rng)
+        rows.append([
+            cc, nome, _birth_date(rng, plan.until, 30, 65), morada,
+            910000000 + i, f'medico{cc}@sns.example.pt',
+            plan.numero_medico + i, rng.choice(SPECIALTIES),
+        ])
+    with connection.cursor() as cursor:
+        copy_rows(cursor, _table(Medico), [
+            'cc', 'nome', 'data_nascimento', 'morada', 'telefone', 'email',
+            'numero_medico', 'especialidade',
+        ], rows)
+    return [row[0] for row in rows]
+
+
+def ensure_catalog():
+    """Make sure the medication and exam catalogs exist; return their ids."""
+    from .catalog import CATALOGS
+    from .models import Medicamento, Exame
+
+    Medicamento.objects.bulk_create(
+        [Medicamento(id_medicamento=pk, nome=nome) for pk, nome in MEDICAMENTOS],
+        ignore_conflicts=True,
+    )
+    Exame.objects.bulk_create(
+        [Exame(id_exame=pk, nome=nome) for pk, nome in EXAMES],
+        ignore_conflicts=True,
+    )
+    # bulk_create sends no signals
+    for catalog in CATALOGS.values():
+        catalog.invalidate()
+    return (
+        sorted(Medicamento.objects.values_list('pk', flat=True)),
+        sorted(Exame.objects.values_list('pk', flat=True)),
+    )
+
+
+def _instant(rng, plan):
+    day = plan.until - timedelta(days=rng.randrange(plan.years * 365))
+    at = time(rng.randint(8, 18), rng.choice((0, 15, 30, 45)))
+    return datetime.combine(day, at, tzinfo=dt_timezone.utc)
+
+
+def generate_chunk(plan, chunk, doctors, medicamentos, exames):
+    """Build and COPY every row belonging to one chunk of patients.
+
+    Returns the number of rows written.
+    """
+    from .models import (
+        Paciente, Consulta, MedicoConsulta, Receita, Medicacao, ItemMedicacao,
+        Exames, ItemExames,
+    )
+
+    rng = plan.rng(chunk)
+    size = plan.chunk_patients(chunk)
+    first_patient, first_consulta, first_receita = plan.chunk_offsets(chunk)
+    ccs = [plan.paciente_cc + first_patient + i for i in range(size)]
+
+    consultas, medico_consultas = [], []
+    counts = {cc: [0, 0, 0, None] for cc in ccs}
+    for i in range(size * plan.consultas_per_patient):
+        cc = rng.choice(ccs)
+        pk = plan.first_consulta + first_consulta + i
+        data_hora = _instant(rng, plan)
+        consultas.append([pk, cc, data_hora, rng.choice(REASONS)])
+        counts[cc][0] += 1
+        if counts[cc][3] is None or data_hora > counts[cc][3]:
+            counts[cc][3] = data_hora
+        team = rng.sample(doctors, min(len(doctors), 2 if rng.random() < 0.2 else 1))
+        for medico, role in zip(team, ('Primary Doctor', 'Assistant')):
+            medico_consultas.append([medico, pk, role])
+
+    receitas, medicacoes, exames_rows, med_items, exam_items = [], [], [], [], []
+    receita = (plan.first_receita or 0) + first_receita
+    for kind, per_patient in ((0, plan.medicacoes_per_patient), (1, plan.exames_per_patient)):
+        for _ in range(size * per_patient):
+            cc = rng.choice(ccs)
+            day = _instant(rng, plan).date()
+            receitas.append([receita])
+            if kind == 0:
+                medicacoes.append([receita, cc, day])
+                counts[cc][1] += 1
+                for medicamento in rng.sample(medicamentos, rng.randint(1, min(3, len(medicamentos)))):
+                    med_items.append([medicamento, receita, rng.choice(DOSES), rng.randint(1, 3)])
+            else:
+                exames_rows.append([receita, cc, day])
+                counts[cc][2] += 1
+                for exame in rng.sample(exames, rng.randint(1, min(3, len(exames)))):
+                    exam_items.append([exame, receita, rng.choice(RESULTS), None, ''])
+            receita += 1
+
+    pacientes = []
+    for i, cc in enumerate(ccs):
+        nome, morada = _person(rng)
+        num_consultas, num_medicacoes, num_exames, ultima = counts[cc]
+        pacientes.append([
+            cc, nome, _birth_date(rng, plan.until, 0, 95), morada,
+            920000000 + first_patient + i, f'paciente{cc}@sns.example.pt',
+            plan.paciente_nss + first_patient + i,
+            plan.until - timedelta(days=rng.randrange(plan.years * 365)),
+            num_consultas, num_medicacoes, num_exames, ultima,
+        ])
+
+    tables = [
+        (Paciente, [
+            'cc', 'nome', 'data_nascimento', 'morada', 'telefone', 'email',
+            'numero_seguranca_social', 'data_registo',
+            'num_consultas', 'num_medicacoes', 'num_exames', 'ultima_consulta',
+        ], pacientes),
+        (Consulta, ['id', 'paciente_id', 'data_hora', 'motivo'], consultas),
+        (MedicoConsulta, ['medico_id', 'consulta_id', 'role'], medico_consultas),
+        (Receita, ['id_receita'], receitas),
+        (Medicacao, ['receita_ptr_id', 'paciente_id', 'date'], medicacoes),
+        (ItemMedicacao, ['medicamento_id', 'medicacao_id', 'dose', 'quantidade'], med_items),
+        (Exames, ['receita_ptr_id', 'paciente_id', 'date'], exames_rows),
+        (ItemExames, ['exame_id', 'exames_id', 'resultados', 'imagem', 'imagem_sha256'], exam_items),
+    ]
+    with transaction.atomic(), connection.cursor() as cursor:
+        for model, columns, rows in tables:
+            if rows:
+                copy_rows(cursor, _table(model), columns, rows)
+    return sum(len(rows) for _, _, rows in tables)
+
+
+# -------------------------------
+# Worker processes
+# -------------------------------
+
+def init_worker(settings_module):
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', settings_module)
+    django.setup()
+
+
+def run_chunk(args):
+    plan, chunk, doctors, medicamentos, exames = args
+    try:
+        return chunk, generate_chunk(plan, chunk, doctors, medicamentos, exames)
+    finally:
+        connection.close()
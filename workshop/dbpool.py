@@ -0,0 +1,62 @@
+from django.db import connections
+
+try:
+    from psycopg_pool import PoolTimeout, TooManyRequests
+except ImportError:  # pooling disabled, or psycopg2
+    POOL_ERRORS = ()
+else:
+    POOL_ERRORS = (PoolTimeout, TooManyRequests)
+
+# -------------------------------
+# Connection Pool
+# -------------------------------
+# With DATABASE_POOL set (SNS/settings.py), each PostgreSQL database is
+# served from a psycopg_pool pool: a request checks a connection out on its
+# first query and hands it back when it ends, so no request pays for the
+# connection handshake. Connections are verified on checkout
+# (CONN_HEALTH_CHECKS), so one killed by the server or a failover is
+# replaced instead of failing the request, and recycled after
+# ``max_idle``/``max_lifetime``.
+#
+# The pool never grows past ``max_size``. A request waits at most
+# ``timeout`` seconds for a connection and at most ``max_waiting`` requests
+# wait at once; past either, ``ConnectionPoolMiddleware`` answers 503 with
+# Retry-After, so a burst of traffic queues briefly or is shed instead of
+# opening a connection storm against ``max_connections``.
+
+RETRY_AFTER = 1
+
+
+def pools():
+    """``{alias: pool}`` for every database served from a pool."""
+    found = {}
+    for alias in connections:
+        pool = getattr(connections[alias], 'pool', None)
+        if pool is not None:
+            found[alias] = pool
+    return found
+
+
+def pool_stats(reset=False):
+    """Current size and usage counters of every pool, keyed by alias.
+
+    Counters (requests, waits, errors, lost connections) accumulate since
+    the pool opened or since the last ``reset``.
+    """
+    return {
+        alias: {
+            'name': pool.name,
+            'open': not pool.closed,
+            **(pool.pop_stats() if reset else pool.get_stats()),
+        }
+        for alias, pool in pools().items()
+    }
+
+
+def is_pool_exhausted(exc):
+    """Whether ``exc`` means no pooled connection could be had in time."""
+    while exc is not None:
+        if isinstance(exc, POOL_ERRORS):
+            return True
+        exc = exc.__cause__
+    return False
@@ -0,0 +1,55 @@
+import asyncio
+from contextlib import ExitStack
+
+from asgiref.sync import sync_to_async
+from django.db import close_old_connections, connections
+
+from .querybudget import active_recorder
+
+# -------------------------------
+# Concurrent Reads
+# -------------------------------
+# Django's async ORM methods (``aget``, ``acount``, ...) still run every
+# query on the single thread-sensitive executor, one after another, so
+# awaiting several of them with ``asyncio.gather`` saves nothing.
+# ``gather_reads`` runs each independent read in a thread of its own, on
+# that thread's own database connection, so an async view waits for its
+# slowest query instead of the sum of them.
+#
+# Worker connections are released after every read the way a request's
+# are (``close_old_connections``), so they honour CONN_MAX_AGE and the
+# connection pool. Their queries are still counted against the request's
+# query budget.
+#
+# Inside a transaction (ATOMIC_REQUESTS, or a TestCase) other connections
+# cannot see the request's uncommitted writes, so the reads then run in
+# turn on the request's own connection.
+
+
+def _in_transaction():
+    return any(connections[alias].in_atomic_block for alias in connections)
+
+
+def _read_in_worker(read, recorder):
+    with ExitStack() as stack:
+        if recorder is not None:
+            for alias in connections:
+                stack.enter_context(connections[alias].execute_wrapper(recorder))
+        try:
+            return read()
+        finally:
+            close_old_connections()
+
+
+async def gather_reads(*reads):
+    """Run the callables ``reads`` concurrently and return their results in order.
+
+    Each callable must only read, and must not depend on the others.
+    """
+    if await sync_to_async(_in_transaction)():
+        return [await sync_to_async(read)() for read in reads]
+    recorder = active_recorder()
+    return await asyncio.gather(*(
+        sync_to_async(_read_in_worker, thread_sensitive=False)(read, recorder)
+        for read in reads
+    ))
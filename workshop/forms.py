@@ -1,10 +1,122 @@
 from django import forms
+from django.core.exceptions import ValidationError
 from django.forms import ModelForm
 from django.forms.models import inlineformset_factory
+from django.forms.utils import flatatt
+from django.urls import reverse
+from django.utils.html import format_html
 from .models import (
     Medico, Paciente, Consulta, Receita, Medicacao, ItemMedicacao,
-    Exames, ItemExames, Medicamento, Exame
+    Exames, ItemExames, Medicamento, Exame, UploadSession
 )
+from .catalog import EXAMES, MEDICAMENTOS, CatalogChoiceField, CatalogFormMixin
+from .scheduling import FREQUENCIES, SERIES_MAX_OCCURRENCES, recurrence
+from .search import catalog_typeahead, paciente_typeahead
+
+# -------------------------------
+# Autocomplete
+# -------------------------------
+# Foreign keys into large tables (patients, the medication and exam
+# catalogs) are picked with AutocompleteInput instead of a <select>: the
+# page carries only the chosen key and its label, and
+# static/js/autocomplete.js fetches matches from the ``autocomplete``
+# endpoint as the user types. Each Lookup names the indexed search serving
+# the endpoint and how to label a single key, so rendering a form costs at
+# most one primary key lookup per field whatever the table sizes.
+#
+# The posted key is still validated on the server, by AutocompleteField
+# (one primary key query) or, for catalog fields, by CatalogChoiceField.
+
+
+class Lookup:
+    def __init__(self, name, search, resolve, label):
+        self.name = name
+        # (term, limit) -> matching instances, best first
+        self.search = search
+        # key -> instance, or None
+        self.resolve = resolve
+        self.label = label
+
+    def results(self, term, limit):
+        return [{'id': obj.pk, 'label': self.label(obj)} for obj in self.search(term, limit)]
+
+    def label_for(self, value):
+        if value in (None, ''):
+            return ''
+        try:
+            obj = self.resolve(value)
+        except (TypeError, ValueError, ValidationError):
+            obj = None
+        return self.label(obj) if obj is not None else ''
+
+
+PACIENTE_LOOKUP = Lookup(
+    'paciente',
+    paciente_typeahead,
+    lambda pk: Paciente.objects.only('cc', 'nome').filter(pk=pk).first(),
+    lambda paciente: f"{paciente.nome} (CC: {paciente.cc})",
+)
+MEDICAMENTO_LOOKUP = Lookup(
+    'medicamento',
+    lambda term, limit: catalog_typeahead(Medicamento, term, 'id_medicamento', limit),
+    lambda pk: MEDICAMENTOS.instance(str(pk)),
+    lambda medicamento: f"{medicamento.nome} ({medicamento.pk})",
+)
+EXAME_LOOKUP = Lookup(
+    'exame',
+    lambda term, limit: catalog_typeahead(Exame, term, 'id_exame', limit),
+    lambda pk: EXAMES.instance(str(pk)),
+    lambda exame: f"{exame.nome} ({exame.pk})",
+)
+MEDICO_LOOKUP = Lookup(
+    'medico',
+    lambda term, limit: catalog_typeahead(Medico, term, 'especialidade', limit),
+    lambda pk: Medico.objects.only('cc', 'nome', 'especialidade').filter(pk=pk).first(),
+    lambda medico: f"{medico.nome} ({medico.especialidade})",
+)
+LOOKUPS = {
+    lookup.name: lookup
+    for lookup in (PACIENTE_LOOKUP, MEDICAMENTO_LOOKUP, EXAME_LOOKUP, MEDICO_LOOKUP)
+}
+
+
+class AutocompleteInput(forms.Widget):
+    """Hidden key input plus a search box filled from a Lookup."""
+
+    def __init__(self, lookup, attrs=None):
+        super().__init__(attrs)
+        self.lookup = lookup
+
+    def id_for_label(self, id_):
+        # Labels focus the search box
+        return f'{id_}_search' if id_ else id_
+
+    def render(self, name, value, attrs=None, renderer=None):
+        attrs = self.build_attrs(self.attrs, attrs)
+        id_ = attrs.pop('id', None) or f'id_{name}'
+        attrs.setdefault('placeholder', 'Type to search...')
+        search_attrs = flatatt({
+            'type': 'search', 'id': self.id_for_label(id_), 'class': 'form-control',
+            'autocomplete': 'off', 'value': self.lookup.label_for(value),
+            'data-autocomplete-url': reverse('autocomplete', args=[self.lookup.name]),
+            **attrs,
+        })
+        return format_html(
+            '<div class="typeahead autocomplete">'
+            '<input type="hidden" name="{}" id="{}" value="{}">'
+            '<input{}>'
+            '<ul class="typeahead-results" hidden></ul>'
+            '</div>',
+            name, id_, '' if value is None else value, search_attrs,
+        )
+
+
+class AutocompleteField(forms.ModelChoiceField):
+    """ModelChoiceField picked through a Lookup; its choices are never listed."""
+
+    def __init__(self, lookup, queryset, **kwargs):
+        kwargs.setdefault('widget', AutocompleteInput(lookup))
+        super().__init__(queryset, **kwargs)
 
 # -------------------------------
 # Basic Model Forms
@@ -49,6 +161,10 @@ class ExameForm(forms.ModelForm):
        
 
 class ConsultaForm(forms.ModelForm):
+    paciente = AutocompleteField(PACIENTE_LOOKUP, Paciente.objects.all())
+    # Booked for the consultation's slot (workshop.scheduling)
+    medico = AutocompleteField(MEDICO_LOOKUP, Medico.objects.all(), required=False)
+
     class Meta:
         model = Consulta
         fields = ['paciente', 'data_hora', 'motivo']
@@ -58,6 +174,39 @@ class ConsultaForm(forms.ModelForm):
         }
 
 
+class ConsultaSeriesForm(forms.Form):
+    """A recurring series of consultations (workshop.scheduling.book_series)."""
+    paciente = AutocompleteField(PACIENTE_LOOKUP, Paciente.objects.all())
+    medico = AutocompleteField(MEDICO_LOOKUP, Medico.objects.all())
+    assistente = AutocompleteField(MEDICO_LOOKUP, Medico.objects.all(), required=False)
+    data_hora = forms.DateTimeField(
+        label='First consultation', widget=forms.DateTimeInput(attrs={'type': 'datetime-local'}),
+    )
+    frequencia = forms.ChoiceField(label='Repeat', choices=list(FREQUENCIES.items()))
+    ocorrencias = forms.IntegerField(
+        label='Consultations', min_value=2, max_value=SERIES_MAX_OCCURRENCES, initial=4,
+    )
+    motivo = forms.CharField(widget=forms.Textarea(attrs={'rows': 4}))
+
+    def clean(self):
+        cleaned = super().clean()
+        medico, assistente = cleaned.get('medico'), cleaned.get('assistente')
+        if medico is not None and medico == assistente:
+            self.add_error('assistente', 'The assistant must be another doctor.')
+        return cleaned
+
+    def starts(self):
+        data = self.cleaned_data
+        return recurrence(data['data_hora'], data['frequencia'], data['ocorrencias'])
+
+    def medicos(self):
+        data = self.cleaned_data
+        medicos = [(data['medico'], 'Primary Doctor')]
+        if data.get('assistente') is not None:
+            medicos.append((data['assistente'], 'Assistant'))
+        return medicos
+
+
 class ReceitaForm(forms.ModelForm):
     class Meta:
         model = Receita
@@ -69,6 +218,8 @@ class ReceitaForm(forms.ModelForm):
 # -------------------------------
 
 class MedicacaoForm(ModelForm):
+    paciente = AutocompleteField(PACIENTE_LOOKUP, Paciente.objects.all())
+
     class Meta:
         model = Medicacao
         fields = ['paciente', 'date']
@@ -77,7 +228,12 @@ class MedicacaoForm(ModelForm):
         }
 
 
-class ItemMedicacaoForm(forms.ModelForm):
+class ItemMedicacaoForm(CatalogFormMixin, forms.ModelForm):
+    # Validated from the shared catalog (workshop.catalog)
+    medicamento = CatalogChoiceField(
+        MEDICAMENTOS, label='Medicamento', widget=AutocompleteInput(MEDICAMENTO_LOOKUP)
+    )
+
     class Meta:
         model = ItemMedicacao
         fields = ('medicamento', 'dose', 'quantidade')
@@ -104,6 +260,8 @@ ItemMedicacaoFormSet = inlineformset_factory(
 # -------------------------------
 
 class ExamesForm(ModelForm):
+    paciente = AutocompleteField(PACIENTE_LOOKUP, Paciente.objects.all())
+
     class Meta:
         model = Exames
         fields = ['paciente', 'date']
@@ -112,7 +270,13 @@ class ExamesForm(ModelForm):
         }
 
 
-class ItemExamesForm(forms.ModelForm):
+class ItemExamesForm(CatalogFormMixin, forms.ModelForm):
+    exame = CatalogChoiceField(EXAMES, label='Exame', widget=AutocompleteInput(EXAME_LOOKUP))
+    # Id of a finished chunked upload (workshop.uploads) to use as the image,
+    # filled in by static/js/chunked_upload.js instead of posting the file.
+    # It is claimed by save_prescriptions, in the transaction saving the item.
+    upload = forms.UUIDField(required=False, widget=forms.HiddenInput)
+
     class Meta:
         model = ItemExames
         fields = ('exame', 'resultados','imagem')
@@ -120,6 +284,15 @@ class ItemExamesForm(forms.ModelForm):
             'resultados': forms.Textarea(attrs={'rows': 3, 'placeholder': 'Resultados do exame...'}),
         }
 
+    def clean_upload(self):
+        upload_id = self.cleaned_data.get('upload')
+        if upload_id is None:
+            return None
+        session = UploadSession.objects.filter(pk=upload_id).first()
+        if session is None or session.status != UploadSession.COMPLETE:
+            raise forms.ValidationError('O envio da imagem não foi concluído.')
+        return session
+
 
 # Inline formset for Exames -> ItemExames
 ItemExamesFormSet = inlineformset_factory(
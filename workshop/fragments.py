@@ -0,0 +1,93 @@
+import uuid
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.cache.utils import make_template_fragment_key
+from django.db import transaction
+
+from .routers import retire_after_commit
+
+# -------------------------------
+# Patient Fragment Cache
+# -------------------------------
+# The patient sections of both dashboards are cached as rendered HTML with
+# the ``{% cache %}`` tag, varied on the patient's cc and a per-patient
+# version token. The version is a random token kept in the cache; the signal
+# handlers in workshop.signals delete it whenever one of the patient's
+# records is saved or deleted, so the next view draws a new token and every
+# fragment rendered before the write becomes unreachable. Nothing is ever
+# deleted fragment by fragment, and an evicted version can never resurrect
+# an old one.
+#
+# A view must read the version *before* loading the data it renders under
+# it (views pass lazy querysets, evaluated only on a cache miss), so a
+# fragment rendered from pre-write data is always stored under a
+# pre-write version.
+#
+# Versions live in the default cache, which must be shared by every worker
+# process (Redis or Memcached, not the per-process LocMemCache) for
+# invalidation to reach all of them.
+
+DEFAULT_TIMEOUT = 24 * 60 * 60
+
+
+def fragment_timeout():
+    return getattr(settings, 'PATIENT_FRAGMENT_TIMEOUT', DEFAULT_TIMEOUT)
+
+
+def version_key(cc):
+    return f'patient:{cc}:version'
+
+
+def fragment_key(fragment_name, cc, version):
+    """Cache key of the ``{% cache %}`` fragment ``fragment_name`` of patient ``cc``."""
+    # The tag keys on the name token as written, quotes included
+    return make_template_fragment_key(f"'{fragment_name}'", [cc, version])
+
+
+def patient_version(cc):
+    """The current version token of patient ``cc``'s cached fragments."""
+    key = version_key(cc)
+    version = cache.get(key)
+    if version is None:
+        version = uuid.uuid4().hex
+        if not cache.add(key, version, None):
+            # Another request drew one first
+            version = cache.get(key, version)
+    return version
+
+
+def invalidate(*ccs):
+    """Retire the cached fragments of the given patients.
+
+    Done at once, so reads later in the writer's transaction miss, and again
+    after commit, so fragments rendered by readers that raced the commit
+    (from data they read before it, or from a lagging replica) are
+    discarded too.
+    """
+    keys = [version_key(cc) for cc in set(ccs) if cc is not None]
+    if not keys:
+        return
+    cache.delete_many(keys)
+    transaction.on_commit(lambda: retire_after_commit(keys))
+
+
+def cached_patient(cc):
+    """``(paciente, version)`` for ``cc``, the patient served from the cache.
+
+    ``paciente`` is None if there is no such patient.
+    """
+    from .models import Paciente
+
+    try:
+        cc = int(cc)
+    except (TypeError, ValueError):
+        return None, None
+    version = patient_version(cc)
+    key = f'patient:{cc}:{version}:paciente'
+    paciente = cache.get(key)
+    if paciente is None:
+        paciente = Paciente.objects.filter(cc=cc).first()
+        if paciente is not None:
+            cache.set(key, paciente, fragment_timeout())
+    return paciente, version
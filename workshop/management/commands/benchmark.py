@@ -0,0 +1,93 @@
+import json
+import platform
+from datetime import datetime
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+
+from workshop.benchmark import build_scenarios, compare, run_benchmark, uncovered_routes
+
+
+class Command(BaseCommand):
+    help = 'Load-test every workshop route and report throughput and latency percentiles.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--concurrency', type=int, default=8,
+                            help='Simulated clients per route.')
+        parser.add_argument('--requests', type=int, default=200,
+                            help='Requests per route.')
+        parser.add_argument('--warmup', type=int, default=2,
+                            help='Unmeasured requests per client before timing.')
+        parser.add_argument('--base-url',
+                            help='Benchmark a running server over HTTP instead of in-process. '
+                                 'POSTs are then committed.')
+        parser.add_argument('--only', nargs='+', metavar='URL_NAME',
+                            help='Only drive these route names.')
+        parser.add_argument('--seed-patients', type=int, default=0,
+                            help='Run generate_dataset with this many patients first.')
+        parser.add_argument('--output', default='benchmark-results.json')
+        parser.add_argument('--baseline', default=str(Path(settings.BASE_DIR) / 'benchmarks' / 'baseline.json'))
+        parser.add_argument('--save-baseline', action='store_true',
+                            help='Store these results as the new baseline.')
+        parser.add_argument('--tolerance', type=float, default=0.2,
+                            help='Allowed fractional slowdown before flagging a regression.')
+        parser.add_argument('--fail-on-regression', action='store_true')
+
+    def handle(self, *args, **options):
+        if options['seed_patients']:
+            call_command('generate_dataset', patients=options['seed_patients'],
+                         verbosity=options['verbosity'])
+        if settings.DEBUG and not options['base_url']:
+            self.stderr.write(self.style.WARNING(
+                'DEBUG is on: query logging inflates in-process timings.'
+            ))
+
+        scenarios = build_scenarios()
+        for name in uncovered_routes(scenarios):
+            self.stderr.write(self.style.WARNING(f'No scenario for route {name!r}; skipped.'))
+        if options['only']:
+            scenarios = [s for s in scenarios if s.url_name in options['only']]
+
+        def progress(name, result):
+            self.stdout.write(
+                f"{name:<40} {result['throughput'] or 0:>9.1f} req/s  "
+                f"p50 {result['p50'] or 0:>8.1f}ms  p95 {result['p95'] or 0:>8.1f}ms  "
+                f"p99 {result['p99'] or 0:>8.1f}ms  errors {result['errors']}"
+            )
+
+        results = run_benchmark(
+            scenarios, options['concurrency'], options['requests'], options['warmup'],
+            options['base_url'], progress,
+        )
+        report = {
+            'meta': {
+                'date': datetime.now().isoformat(timespec='seconds'),
+                'python': platform.python_version(),
+                'concurrency': options['concurrency'],
+                'requests': options['requests'],
+                'target': options['base_url'] or 'in-process',
+            },
+            'results': results,
+        }
+        Path(options['output']).write_text(json.dumps(report, indent=2))
+        self.stdout.write(f"Results written to {options['output']}.")
+
+        baseline_path = Path(options['baseline'])
+        if options['save_baseline']:
+            baseline_path.parent.mkdir(parents=True, exist_ok=True)
+            baseline_path.write_text(json.dumps(report, indent=2))
+            self.stdout.write(f'Baseline saved to {baseline_path}.')
+            return
+        if not baseline_path.exists():
+            return
+
+        baseline = json.loads(baseline_path.read_text())['results']
+        regressions = compare(results, baseline, options['tolerance'])
+        for regression in regressions:
+            self.stdout.write(self.style.ERROR(f'REGRESSION {regression}'))
+        if not regressions:
+            self.stdout.write(self.style.SUCCESS(f'No regressions against {baseline_path}.'))
+        elif options['fail_on_regression']:
+            raise CommandError(f'{len(regressions)} regression(s) against {baseline_path}.')
@@ -0,0 +1,17 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+
+from workshop.uploads import SESSION_MAX_AGE, clear_stale_sessions
+
+
+class Command(BaseCommand):
+    help = 'Delete abandoned chunked upload sessions and their partial files.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--hours', type=float, default=SESSION_MAX_AGE.total_seconds() / 3600,
+                            help='Age, since the last chunk, after which a session is abandoned.')
+
+    def handle(self, *args, **options):
+        count = clear_stale_sessions(timedelta(hours=options['hours']))
+        self.stdout.write(self.style.SUCCESS(f'Deleted {count} upload session(s).'))
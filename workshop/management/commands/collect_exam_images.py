@@ -0,0 +1,29 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+
+from workshop.blobs import GC_GRACE, collect_garbage, repair_refcounts
+
+
+class Command(BaseCommand):
+    help = 'Delete stored exam images no longer referenced by any exam item.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--grace-hours', type=float, default=GC_GRACE.total_seconds() / 3600,
+                            help='Keep unreferenced files younger than this.')
+        parser.add_argument('--repair', action='store_true',
+                            help='Recount references from the exam items first.')
+        parser.add_argument('--dry-run', action='store_true',
+                            help='Only report what would be deleted.')
+
+    def handle(self, *args, **options):
+        if options['repair']:
+            count = repair_refcounts()
+            self.stdout.write(f'Recounted references for {count} image(s).')
+        files, size = collect_garbage(
+            timedelta(hours=options['grace_hours']), dry_run=options['dry_run']
+        )
+        verb = 'Would delete' if options['dry_run'] else 'Deleted'
+        self.stdout.write(self.style.SUCCESS(
+            f'{verb} {files} unreferenced image(s), {size / 1024 ** 2:.1f} MiB.'
+        ))
@@ -0,0 +1,73 @@
+import os
+import multiprocessing
+import time
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+from workshop import api
+from workshop.dataset import DatasetPlan, ensure_catalog, generate_doctors, init_worker, run_chunk
+from workshop.stats import rebuild_statistics
+
+
+class Command(BaseCommand):
+    help = 'Generate a large, reproducible synthetic dataset for load testing.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--patients', type=int, default=100000)
+        parser.add_argument('--doctors', type=int, default=None,
+                            help='Defaults to one doctor per 500 patients.')
+        parser.add_argument('--consultas-per-patient', type=int, default=4)
+        parser.add_argument('--medicacoes-per-patient', type=int, default=2)
+        parser.add_argument('--exames-per-patient', type=int, default=1)
+        parser.add_argument('--seed', default='sns')
+        parser.add_argument('--until', type=date.fromisoformat, default=None,
+                            help='Latest date generated (YYYY-MM-DD). Defaults to today.')
+        parser.add_argument('--years', type=int, default=5,
+                            help='Length of the generated history.')
+        parser.add_argument('--chunk-size', type=int, default=5000,
+                            help='Patients generated per COPY transaction.')
+        parser.add_argument('--workers', type=int, default=os.cpu_count() or 1)
+
+    def handle(self, *args, **options):
+        if options['patients'] < 1 or options['chunk_size'] < 1 or options['workers'] < 1:
+            raise CommandError('--patients, --chunk-size and --workers must be positive.')
+
+        plan = DatasetPlan(
+            seed=options['seed'],
+            patients=options['patients'],
+            doctors=options['doctors'] or max(1, options['patients'] // 500),
+            consultas_per_patient=options['consultas_per_patient'],
+            medicacoes_per_patient=options['medicacoes_per_patient'],
+            exames_per_patient=options['exames_per_patient'],
+            chunk_size=options['chunk_size'],
+            until=options['until'] or date.today(),
+            years=options['years'],
+        )
+        started = time.monotonic()
+        plan.allocate()
+        medicamentos, exames = ensure_catalog()
+        doctors = generate_doctors(plan)
+        # Workers must open their own connections
+        connections.close_all()
+
+        total = len(doctors)
+        tasks = [(plan, chunk, doctors, medicamentos, exames) for chunk in plan.chunks]
+        settings_module = os.environ['DJANGO_SETTINGS_MODULE']
+        with multiprocessing.Pool(options['workers'], init_worker, (settings_module,)) as pool:
+            for done, (chunk, rows) in enumerate(pool.imap_unordered(run_chunk, tasks), 1):
+                total += rows
+                if options['verbosity'] > 1:
+                    self.stdout.write(f'  chunk {chunk}: {rows} rows ({done}/{len(tasks)})')
+
+        # COPY bypasses the signal handlers that maintain the daily rollup
+        # and the API's ETags. Patient counters are written with the rows
+        # themselves.
+        rebuild_statistics()
+        api.invalidate(*api.TRACKED_MODELS)
+
+        elapsed = time.monotonic() - started
+        self.stdout.write(self.style.SUCCESS(
+            f'Generated {total} rows in {elapsed:.1f}s ({total / elapsed:.0f} rows/s).'
+        ))
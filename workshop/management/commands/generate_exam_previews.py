@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand
+
+from workshop.models import ItemExames
+from workshop.previews import generate_previews
+
+
+class Command(BaseCommand):
+    help = 'Generate missing thumbnails and previews for exam images.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--all', action='store_true',
+                            help='Re-check every image, not only those without previews.')
+
+    def handle(self, *args, **options):
+        items = ItemExames.objects.exclude(imagem='').exclude(imagem__isnull=True)
+        if not options['all']:
+            items = items.filter(imagem_sha256='')
+
+        done = failed = 0
+        for item in items.iterator():
+            try:
+                generate_previews(item)
+                done += 1
+            except Exception as exc:
+                failed += 1
+                self.stderr.write(f'ItemExames {item.pk}: {exc}')
+        self.stdout.write(self.style.SUCCESS(f'Generated previews for {done} image(s), {failed} failed.'))
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from workshop.stats import rebuild_statistics
+
+
+class Command(BaseCommand):
+    help = 'Recompute the daily statistics rollup from the source tables.'
+
+    def handle(self, *args, **options):
+        days = rebuild_statistics()
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt statistics for {days} day(s).'))
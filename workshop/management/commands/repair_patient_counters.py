@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from workshop.counters import repair_patient_counters
+
+
+class Command(BaseCommand):
+    help = 'Recompute the per-patient consultation and prescription counters.'
+
+    def handle(self, *args, **options):
+        updated = repair_patient_counters()
+        self.stdout.write(self.style.SUCCESS(f'Repaired counters for {updated} patient(s).'))
@@ -0,0 +1,191 @@
+import mimetypes
+import os
+import re
+import stat
+from urllib.parse import quote
+
+from django.conf import settings
+from django.core.exceptions import SuspiciousFileOperation
+from django.core.files.storage import FileSystemStorage, default_storage
+from django.http import FileResponse, Http404, HttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, parse_http_date_safe
+
+from .previews import PREVIEW_DIR
+
+# -------------------------------
+# Media Serving
+# -------------------------------
+# Serves MEDIA_URL (exam images and their previews) in production, with
+# what ``django.views.static.serve`` lacks:
+#
+# * a strong ETag and Last-Modified from the file's stat, so a repeat view
+#   is answered 304 without opening the file;
+# * single byte-range requests (206, honouring If-Range), so a viewer can
+#   fetch part of a large scan or resume a download;
+# * zero-copy transfer: full and partial bodies are handed to the WSGI
+#   server's file wrapper, which uses sendfile(2) where available, or, with
+#   MEDIA_OFFLOAD, the whole transfer is left to the front-end server via
+#   X-Accel-Redirect (nginx) or X-Sendfile (Apache).
+#
+# Previews are named after their content digest and never change, so they
+# are cached for a year; originals are revalidated on every use.
+
+IMMUTABLE_PREFIXES = (f'{PREVIEW_DIR}/',)
+IMMUTABLE_CACHE_CONTROL = 'private, max-age=31536000, immutable'
+REVALIDATE_CACHE_CONTROL = 'private, no-cache'
+
+_RANGE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+
+class RangeNotSatisfiable(Exception):
+    pass
+
+
+class FileRange:
+    """``length`` bytes of ``file`` from ``start``, read like a file.
+
+    Keeps ``fileno()`` so servers with sendfile still send the range without
+    copying it through Python; they stop at the response's Content-Length.
+    """
+
+    def __init__(self, file, start, length):
+        file.seek(start)
+        self.file = file
+        self.remaining = length
+
+    def read(self, size=-1):
+        if size < 0 or size > self.remaining:
+            size = self.remaining
+        data = self.file.read(size)
+        self.remaining -= len(data)
+        return data
+
+    def fileno(self):
+        return self.file.fileno()
+
+    def close(self):
+        self.file.close()
+
+
+def parse_range(header, size):
+    """The inclusive ``(start, end)`` of a single-range ``Range`` header.
+
+    Returns None when the whole file should be sent instead: no header,
+    malformed or multi-range requests (which servers may ignore).
+    """
+    match = _RANGE.match(header.strip()) if header else None
+    if not match or match.group(1) == match.group(2) == '':
+        return None
+    first, last = match.groups()
+    if first == '':
+        # Suffix range: the last N bytes
+        if int(last) == 0:
+            raise RangeNotSatisfiable
+        return max(size - int(last), 0), size - 1
+    start = int(first)
+    end = min(int(last), size - 1) if last else size - 1
+    if start >= size:
+        raise RangeNotSatisfiable
+    if end < start:
+        return None
+    return start, end
+
+
+def if_range_matches(request, etag, last_modified):
+    """Whether a ranged request's If-Range (if any) still holds."""
+    value = request.headers.get('If-Range')
+    if not value:
+        return True
+    if value.startswith(('"', 'W/')):
+        return value == etag
+    return parse_http_date_safe(value) == last_modified
+
+
+def file_stat(storage, name):
+    """``(size, mtime, etag)`` of a stored file; Http404 if it is missing."""
+    try:
+        if isinstance(storage, FileSystemStorage):
+            info = os.stat(storage.path(name))
+            if not stat.S_ISREG(info.st_mode):
+                raise Http404
+            size, mtime_ns = info.st_size, info.st_mtime_ns
+        else:
+            size = storage.size(name)
+            mtime_ns = int(storage.get_modified_time(name).timestamp() * 1e9)
+    except (FileNotFoundError, NotADirectoryError, SuspiciousFileOperation):
+        raise Http404
+    return size, mtime_ns // 10**9, f'"{size:x}-{mtime_ns:x}"'
+
+
+def offload(storage, name):
+    """A response handing the transfer to the front-end server, or None."""
+    mode = getattr(settings, 'MEDIA_OFFLOAD', None)
+    if mode == 'x-accel-redirect':
+        response = HttpResponse()
+        prefix = getattr(settings, 'MEDIA_ACCEL_REDIRECT_PREFIX', '/protected-media/')
+        response['X-Accel-Redirect'] = prefix + quote(name)
+        return response
+    if mode == 'x-sendfile' and isinstance(storage, FileSystemStorage):
+        response = HttpResponse()
+        response['X-Sendfile'] = storage.path(name)
+        return response
+    return None
+
+
+def is_private(storage, name):
+    """Partial chunked uploads and files being spooled by a storage (in
+    dot-directories) share MEDIA_ROOT but are not media."""
+    from .uploads import upload_dir
+
+    if any(part.startswith('.') for part in name.split('/')):
+        return True
+    partial = os.path.abspath(upload_dir())
+    try:
+        path = os.path.abspath(storage.path(name))
+    except (NotImplementedError, SuspiciousFileOperation):
+        return False
+    return path == partial or path.startswith(partial + os.sep)
+
+
+def serve(request, name, storage=default_storage):
+    """Respond with stored file ``name``, honouring validators and Range."""
+    if is_private(storage, name):
+        raise Http404
+    size, last_modified, etag = file_stat(storage, name)
+    content_type = mimetypes.guess_type(name)[0] or 'application/octet-stream'
+
+    response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if response is None:
+        response = offload(storage, name)
+    if response is None:
+        byte_range = None
+        if request.method in ('GET', 'HEAD') and if_range_matches(request, etag, last_modified):
+            try:
+                byte_range = parse_range(request.headers.get('Range'), size)
+            except RangeNotSatisfiable:
+                response = HttpResponse(status=416)
+                response['Content-Range'] = f'bytes */{size}'
+                return response
+        file = storage.open(name, 'rb')
+        if byte_range:
+            start, end = byte_range
+            response = FileResponse(FileRange(file, start, end - start + 1), status=206)
+            response['Content-Length'] = end - start + 1
+            response['Content-Range'] = f'bytes {start}-{end}/{size}'
+        else:
+            response = FileResponse(file)
+            response['Content-Length'] = size
+
+    if response.status_code == 412:
+        return response
+    if response.status_code != 304:
+        response['Content-Type'] = content_type
+        response['Accept-Ranges'] = 'bytes'
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(last_modified)
+    response['Cache-Control'] = (
+        IMMUTABLE_CACHE_CONTROL if name.startswith(IMMUTABLE_PREFIXES)
+        else REVALIDATE_CACHE_CONTROL
+    )
+    return response
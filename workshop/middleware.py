@@ -0,0 +1,93 @@
+import logging
+
+from django.conf import settings
+from django.http import HttpResponse
+
+from .dbpool import RETRY_AFTER, is_pool_exhausted
+from .querybudget import QueryRecorder, query_stats, view_query_budget
+from .routers import STICKY_COOKIE, may_read_replicas, replica_aliases, replica_lag, replica_reads
+
+logger = logging.getLogger('workshop.querybudget')
+pool_logger = logging.getLogger('workshop.dbpool')
+
+
+class QueryBudgetMiddleware:
+    """Record the queries of every request, keyed by URL name.
+
+    Statistics are served by ``QueryReportView``. With
+    ``QUERY_BUDGET_HEADERS`` (on by default when ``DEBUG``), responses also
+    carry ``X-Query-Count`` and a ``Server-Timing`` entry for the database.
+    Requests over their view's ``query_budget`` are logged as warnings.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.headers = getattr(settings, 'QUERY_BUDGET_HEADERS', settings.DEBUG)
+
+    def __call__(self, request):
+        with QueryRecorder() as recorder:
+            response = self.get_response(request)
+
+        match = request.resolver_match
+        url_name = match.view_name if match else '<unresolved>'
+        budget = view_query_budget(match)
+        query_stats.record(url_name, recorder, budget)
+
+        if budget is not None and recorder.count > budget:
+            logger.warning(
+                '%s ran %d queries, over its budget of %d (%s)',
+                url_name, recorder.count, budget, request.path,
+            )
+        if self.headers:
+            response['X-Query-Count'] = str(recorder.count)
+            response['Server-Timing'] = (
+                f'db;dur={recorder.duration * 1000:.2f};desc="{recorder.count} queries"'
+            )
+        return response
+
+
+class ConnectionPoolMiddleware:
+    """Answer 503 when no pooled database connection is free in time.
+
+    The client is told to retry shortly, instead of the request failing
+    with a 500 (see workshop.dbpool).
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        return self.get_response(request)
+
+    def process_exception(self, request, exception):
+        if not is_pool_exhausted(exception):
+            return None
+        pool_logger.warning('No database connection free for %s', request.path)
+        response = HttpResponse('Service temporarily overloaded, retry shortly.', status=503)
+        response['Retry-After'] = str(RETRY_AFTER)
+        return response
+
+
+class ReplicaMiddleware:
+    """Serve views declaring ``read_replica = True`` from the read replicas.
+
+    A response to a request that wrote sets a cookie keeping that client's
+    reads on the primary while the replicas may lag (see workshop.routers).
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        with replica_reads(enabled=False) as routing:
+            request._replica_routing = routing
+            response = self.get_response(request)
+        lag = replica_lag()
+        if routing.wrote and lag:
+            response.set_cookie(STICKY_COOKIE, '1', max_age=lag, httponly=True, samesite='Lax')
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        view = getattr(view_func, 'view_class', view_func)
+        if getattr(view, 'read_replica', False) and may_read_replicas(request):
+            request._replica_routing.replicas = replica_aliases()
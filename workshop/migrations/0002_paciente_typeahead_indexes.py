@@ -0,0 +1,35 @@
+# Generated by Django 6.0 on 2026-10-18 19:05
+
+import django.contrib.postgres.indexes
+import django.db.models.functions.comparison
+import django.db.models.functions.text
+from django.contrib.postgres.operations import TrigramExtension
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('workshop', '0001_initial'),
+    ]
+
+    operations = [
+        TrigramExtension(),
+        migrations.AddField(
+            model_name='itemexames',
+            name='imagem',
+            field=models.ImageField(blank=True, null=True, upload_to='ImagemExames/'),
+        ),
+        migrations.AddIndex(
+            model_name='paciente',
+            index=django.contrib.postgres.indexes.GinIndex(django.contrib.postgres.indexes.OpClass(django.db.models.functions.text.Upper('nome'), name='gin_trgm_ops'), name='paciente_nome_trgm_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='paciente',
+            index=models.Index(django.contrib.postgres.indexes.OpClass(django.db.models.functions.comparison.Cast('cc', models.TextField()), name='text_pattern_ops'), name='paciente_cc_prefix_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='paciente',
+            index=models.Index(django.contrib.postgres.indexes.OpClass(django.db.models.functions.comparison.Cast('numero_seguranca_social', models.TextField()), name='text_pattern_ops'), name='paciente_nss_prefix_idx'),
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 6.0 on 2026-10-18 19:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('workshop', '0002_paciente_typeahead_indexes'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='exame',
+            index=models.Index(fields=['nome', 'id_exame'], name='exame_nome_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='medicamento',
+            index=models.Index(fields=['nome', 'id_medicamento'], name='medicamento_nome_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='medico',
+            index=models.Index(fields=['nome', 'cc'], name='medico_nome_cc_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='paciente',
+            index=models.Index(fields=['nome', 'cc'], name='paciente_nome_cc_idx'),
+        ),
+    ]
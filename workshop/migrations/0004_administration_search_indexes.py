@@ -0,0 +1,73 @@
+# Generated by Django 6.0 on 2026-10-18 20:10
+
+import django.contrib.postgres.indexes
+import django.contrib.postgres.search
+import django.db.models.functions.comparison
+import django.db.models.functions.text
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('workshop', '0003_keyset_pagination_indexes'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='exame',
+            index=django.contrib.postgres.indexes.GinIndex(django.contrib.postgres.search.SearchVector('nome', config='simple'), name='exame_search_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='exame',
+            index=django.contrib.postgres.indexes.GinIndex(django.contrib.postgres.indexes.OpClass(django.db.models.functions.text.Upper('nome'), name='gin_trgm_ops'), name='exame_nome_trgm_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='exame',
+            index=django.contrib.postgres.indexes.GinIndex(django.contrib.postgres.indexes.OpClass(django.db.models.functions.text.Upper('id_exame'), name='gin_trgm_ops'), name='exame_id_trgm_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='medicamento',
+            index=django.contrib.postgres.indexes.GinIndex(django.contrib.postgres.search.SearchVector('nome', config='simple'), name='medicamento_search_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='medicamento',
+            index=django.contrib.postgres.indexes.GinIndex(django.contrib.postgres.indexes.OpClass(django.db.models.functions.text.Upper('nome'), name='gin_trgm_ops'), name='medicamento_nome_trgm_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='medicamento',
+            index=django.contrib.postgres.indexes.GinIndex(django.contrib.postgres.indexes.OpClass(django.db.models.functions.text.Upper('id_medicamento'), name='gin_trgm_ops'), name='medicamento_id_trgm_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='medico',
+            index=django.contrib.postgres.indexes.GinIndex(django.contrib.postgres.search.SearchVector('nome', 'especialidade', 'email', config='simple'), name='medico_search_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='medico',
+            index=django.contrib.postgres.indexes.GinIndex(django.contrib.postgres.indexes.OpClass(django.db.models.functions.text.Upper('nome'), name='gin_trgm_ops'), name='medico_nome_trgm_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='medico',
+            index=django.contrib.postgres.indexes.GinIndex(django.contrib.postgres.indexes.OpClass(django.db.models.functions.text.Upper('especialidade'), name='gin_trgm_ops'), name='medico_especialidade_trgm_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='medico',
+            index=django.contrib.postgres.indexes.GinIndex(django.contrib.postgres.indexes.OpClass(django.db.models.functions.text.Upper('email'), name='gin_trgm_ops'), name='medico_email_trgm_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='medico',
+            index=models.Index(django.contrib.postgres.indexes.OpClass(django.db.models.functions.comparison.Cast('cc', models.TextField()), name='text_pattern_ops'), name='medico_cc_prefix_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='medico',
+            index=models.Index(django.contrib.postgres.indexes.OpClass(django.db.models.functions.comparison.Cast('numero_medico', models.TextField()), name='text_pattern_ops'), name='medico_numero_prefix_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='paciente',
+            index=django.contrib.postgres.indexes.GinIndex(django.contrib.postgres.search.SearchVector('nome', 'email', config='simple'), name='paciente_search_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='paciente',
+            index=django.contrib.postgres.indexes.GinIndex(django.contrib.postgres.indexes.OpClass(django.db.models.functions.text.Upper('email'), name='gin_trgm_ops'), name='paciente_email_trgm_idx'),
+        ),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 6.0 on 2026-10-18 20:45
+
+from django.db import migrations, models
+
+
+def backfill_statistics(apps, schema_editor):
+    from workshop.stats import rebuild_statistics
+    rebuild_statistics(apps)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('workshop', '0004_administration_search_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EstatisticaDiaria',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('data', models.DateField(unique=True)),
+                ('consultas', models.IntegerField(default=0)),
+                ('pacientes', models.IntegerField(default=0)),
+                ('medicacoes', models.IntegerField(default=0)),
+                ('exames', models.IntegerField(default=0)),
+            ],
+            options={
+                'verbose_name': 'Estatística Diária',
+                'verbose_name_plural': 'Estatísticas Diárias',
+                'ordering': ['-data'],
+            },
+        ),
+        migrations.RunPython(backfill_statistics, migrations.RunPython.noop),
+    ]
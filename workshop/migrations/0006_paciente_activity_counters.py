@@ -0,0 +1,39 @@
+# Generated by Django 6.0 on 2026-10-18 21:15
+
+from django.db import migrations, models
+
+
+def backfill_counters(apps, schema_editor):
+    from workshop.counters import repair_patient_counters
+    repair_patient_counters(apps)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('workshop', '0005_estatisticadiaria'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='paciente',
+            name='num_consultas',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='paciente',
+            name='num_exames',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='paciente',
+            name='num_medicacoes',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='paciente',
+            name='ultima_consulta',
+            field=models.DateTimeField(blank=True, editable=False, null=True),
+        ),
+        migrations.RunPython(backfill_counters, migrations.RunPython.noop),
+    ]
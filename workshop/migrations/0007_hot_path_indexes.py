@@ -0,0 +1,29 @@
+# Generated by Django 6.0 on 2026-10-18 21:40
+
+from django.contrib.postgres.operations import AddIndexConcurrently
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    # CREATE INDEX CONCURRENTLY cannot run inside a transaction; building
+    # concurrently keeps these tables writable while the indexes build.
+    atomic = False
+
+    dependencies = [
+        ('workshop', '0006_paciente_activity_counters'),
+    ]
+
+    operations = [
+        AddIndexConcurrently(
+            model_name='consulta',
+            index=models.Index(fields=['paciente', '-data_hora', '-id'], name='consulta_paciente_data_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='exames',
+            index=models.Index(fields=['paciente', '-date', '-receita_ptr'], name='exames_paciente_date_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='medicacao',
+            index=models.Index(fields=['paciente', '-date', '-receita_ptr'], name='medicacao_paciente_date_idx'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 6.0 on 2026-10-18 22:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('workshop', '0007_hot_path_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='itemexames',
+            name='imagem_sha256',
+            field=models.CharField(blank=True, editable=False, max_length=64),
+        ),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 6.0 on 2026-10-18 22:30
+
+import uuid
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('workshop', '0008_itemexames_imagem_sha256'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UploadSession',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('filename', models.CharField(max_length=255)),
+                ('size', models.BigIntegerField()),
+                ('received', models.BigIntegerField(default=0)),
+                ('sha256', models.CharField(blank=True, max_length=64)),
+                ('status', models.CharField(choices=[('pending', 'Em andamento'), ('complete', 'Concluído'), ('failed', 'Falhou')], default='pending', max_length=10)),
+                ('created', models.DateTimeField(auto_now_add=True)),
+                ('updated', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name': 'Sessão de Upload',
+                'verbose_name_plural': 'Sessões de Upload',
+            },
+        ),
+    ]
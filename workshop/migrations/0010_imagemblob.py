@@ -0,0 +1,37 @@
+# Generated by Django 6.0 on 2026-10-18 22:55
+
+import workshop.storage
+from django.db import migrations, models
+
+
+def backfill_refcounts(apps, schema_editor):
+    from workshop.blobs import repair_refcounts
+    repair_refcounts(apps)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('workshop', '0009_uploadsession'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ImagemBlob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=255, unique=True)),
+                ('refcount', models.IntegerField(default=0)),
+            ],
+            options={
+                'verbose_name': 'Ficheiro de Imagem',
+                'verbose_name_plural': 'Ficheiros de Imagem',
+            },
+        ),
+        migrations.AlterField(
+            model_name='itemexames',
+            name='imagem',
+            field=models.ImageField(blank=True, null=True, storage=workshop.storage.exam_image_storage, upload_to='ImagemExames/'),
+        ),
+        migrations.RunPython(backfill_refcounts, migrations.RunPython.noop),
+    ]
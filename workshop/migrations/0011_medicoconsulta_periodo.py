@@ -0,0 +1,26 @@
+# Generated by Django 6.0 on 2026-10-18 23:20
+
+import django.contrib.postgres.constraints
+import django.contrib.postgres.fields.ranges
+from django.contrib.postgres.operations import BtreeGistExtension
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('workshop', '0010_imagemblob'),
+    ]
+
+    operations = [
+        BtreeGistExtension(),
+        migrations.AddField(
+            model_name='medicoconsulta',
+            name='periodo',
+            field=django.contrib.postgres.fields.ranges.DateTimeRangeField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddConstraint(
+            model_name='medicoconsulta',
+            constraint=django.contrib.postgres.constraints.ExclusionConstraint(expressions=[('medico', '='), ('periodo', '&&')], name='medicoconsulta_no_overlap'),
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 6.0 on 2026-10-19 09:10
+
+from django.db import migrations, models
+
+
+def backfill_totals(apps, schema_editor):
+    from workshop.stats import rebuild_totals
+    rebuild_totals(apps)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('workshop', '0011_medicoconsulta_periodo'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EstatisticaTotal',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('consultas', models.IntegerField(default=0)),
+                ('pacientes', models.IntegerField(default=0)),
+                ('medicacoes', models.IntegerField(default=0)),
+                ('exames', models.IntegerField(default=0)),
+            ],
+            options={
+                'verbose_name': 'Estatística Total',
+                'verbose_name_plural': 'Estatísticas Totais',
+            },
+        ),
+        migrations.RunPython(backfill_totals, migrations.RunPython.noop),
+    ]
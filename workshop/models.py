@@ -1,4 +1,20 @@
+import uuid
+
+from django.contrib.postgres.constraints import ExclusionConstraint
+from django.contrib.postgres.fields import DateTimeRangeField, RangeOperators
+from django.contrib.postgres.indexes import GinIndex, OpClass
+from django.contrib.postgres.search import SearchVector
 from django.db import models
+from django.db.models.functions import Cast, Upper
+
+from .storage import exam_image_storage
+
+# Full-text documents for the administration search. The GIN indexes below
+# and workshop.search must use the very same expressions.
+MEDICO_SEARCH_VECTOR = SearchVector('nome', 'especialidade', 'email', config='simple')
+PACIENTE_SEARCH_VECTOR = SearchVector('nome', 'email', config='simple')
+MEDICAMENTO_SEARCH_VECTOR = SearchVector('nome', config='simple')
+EXAME_SEARCH_VECTOR = SearchVector('nome', config='simple')
 
 class Pessoa(models.Model):
     cc = models.BigIntegerField(primary_key=True)
@@ -27,6 +43,22 @@ class Medico(Pessoa):
     class Meta:
         verbose_name = 'Médico'
         verbose_name_plural = 'Médicos'
+        indexes = [
+            models.Index(fields=['nome', 'cc'], name='medico_nome_cc_idx'),
+            # Administration search
+            GinIndex(MEDICO_SEARCH_VECTOR, name='medico_search_idx'),
+            GinIndex(OpClass(Upper('nome'), name='gin_trgm_ops'), name='medico_nome_trgm_idx'),
+            GinIndex(OpClass(Upper('especialidade'), name='gin_trgm_ops'), name='medico_especialidade_trgm_idx'),
+            GinIndex(OpClass(Upper('email'), name='gin_trgm_ops'), name='medico_email_trgm_idx'),
+            models.Index(
+                OpClass(Cast('cc', models.TextField()), name='text_pattern_ops'),
+                name='medico_cc_prefix_idx',
+            ),
+            models.Index(
+                OpClass(Cast('numero_medico', models.TextField()), name='text_pattern_ops'),
+                name='medico_numero_prefix_idx',
+            ),
+        ]
 
     def __str__(self):
         return f"Dr. {self.nome} - {self.especialidade}"
@@ -36,9 +68,34 @@ class Paciente(Pessoa):
     numero_seguranca_social = models.BigIntegerField(unique=True)
     data_registo = models.DateField(auto_now_add=True)
 
+    # Activity counters, maintained by workshop.counters
+    num_consultas = models.PositiveIntegerField(default=0, editable=False)
+    num_medicacoes = models.PositiveIntegerField(default=0, editable=False)
+    num_exames = models.PositiveIntegerField(default=0, editable=False)
+    ultima_consulta = models.DateTimeField(null=True, blank=True, editable=False)
+
     class Meta:
         verbose_name = 'Paciente'
         verbose_name_plural = 'Pacientes'
+        indexes = [
+            models.Index(fields=['nome', 'cc'], name='paciente_nome_cc_idx'),
+            # Typeahead: prefix + fuzzy name lookup, prefix lookup on the ids
+            GinIndex(
+                OpClass(Upper('nome'), name='gin_trgm_ops'),
+                name='paciente_nome_trgm_idx',
+            ),
+            models.Index(
+                OpClass(Cast('cc', models.TextField()), name='text_pattern_ops'),
+                name='paciente_cc_prefix_idx',
+            ),
+            models.Index(
+                OpClass(Cast('numero_seguranca_social', models.TextField()), name='text_pattern_ops'),
+                name='paciente_nss_prefix_idx',
+            ),
+            # Administration search
+            GinIndex(PACIENTE_SEARCH_VECTOR, name='paciente_search_idx'),
+            GinIndex(OpClass(Upper('email'), name='gin_trgm_ops'), name='paciente_email_trgm_idx'),
+        ]
 
     def __str__(self):
         return f"{self.nome} (NSS: {self.numero_seguranca_social})"
@@ -58,6 +115,9 @@ class Consulta(models.Model):
         verbose_name = 'Consulta'
         verbose_name_plural = 'Consultas'
         ordering = ['-data_hora']
+        indexes = [
+            models.Index(fields=['paciente', '-data_hora', '-id'], name='consulta_paciente_data_idx'),
+        ]
 
     def __str__(self):
         return f"Consulta - {self.paciente.nome} em {self.data_hora.strftime('%d/%m/%Y %H:%M')}"
@@ -67,11 +127,22 @@ class MedicoConsulta(models.Model):
     medico = models.ForeignKey(Medico, on_delete=models.CASCADE)
     consulta = models.ForeignKey(Consulta, on_delete=models.CASCADE)
     role = models.CharField(max_length=50, blank=True)
+    # The interval the doctor is booked for, set for consultations booked
+    # through workshop.scheduling; None for records entered after the fact
+    periodo = DateTimeRangeField(null=True, blank=True, editable=False)
 
     class Meta:
         verbose_name = 'Médico na Consulta'
         verbose_name_plural = 'Médicos nas Consultas'
         unique_together = ['medico', 'consulta']
+        constraints = [
+            # No doctor is booked twice at once; its GiST index also serves
+            # the free-slot search
+            ExclusionConstraint(
+                name='medicoconsulta_no_overlap',
+                expressions=[('medico', RangeOperators.EQUAL), ('periodo', RangeOperators.OVERLAPS)],
+            ),
+        ]
 
     def __str__(self):
         return f"{self.medico.nome} - {self.consulta} ({self.role})"
@@ -98,6 +169,13 @@ class Medicamento(models.Model):
         verbose_name = 'Medicamento'
         verbose_name_plural = 'Medicamentos'
         ordering = ['nome']
+        indexes = [
+            models.Index(fields=['nome', 'id_medicamento'], name='medicamento_nome_id_idx'),
+            # Administration search
+            GinIndex(MEDICAMENTO_SEARCH_VECTOR, name='medicamento_search_idx'),
+            GinIndex(OpClass(Upper('nome'), name='gin_trgm_ops'), name='medicamento_nome_trgm_idx'),
+            GinIndex(OpClass(Upper('id_medicamento'), name='gin_trgm_ops'), name='medicamento_id_trgm_idx'),
+        ]
 
     def __str__(self):
         return self.nome
@@ -116,6 +194,9 @@ class Medicacao(Receita):
         verbose_name = 'Medicação'
         verbose_name_plural = 'Medicações'
         ordering = ['-date']
+        indexes = [
+            models.Index(fields=['paciente', '-date', '-receita_ptr'], name='medicacao_paciente_date_idx'),
+        ]
 
     def __str__(self):
         return f"Medicação {self.id_receita} - {self.paciente.nome} ({self.date})"
@@ -143,6 +224,13 @@ class Exame(models.Model):
         verbose_name = 'Exame'
         verbose_name_plural = 'Exames'
         ordering = ['nome']
+        indexes = [
+            models.Index(fields=['nome', 'id_exame'], name='exame_nome_id_idx'),
+            # Administration search
+            GinIndex(EXAME_SEARCH_VECTOR, name='exame_search_idx'),
+            GinIndex(OpClass(Upper('nome'), name='gin_trgm_ops'), name='exame_nome_trgm_idx'),
+            GinIndex(OpClass(Upper('id_exame'), name='gin_trgm_ops'), name='exame_id_trgm_idx'),
+        ]
 
     def __str__(self):
         return self.nome
@@ -162,6 +250,9 @@ class Exames(Receita):
         verbose_name = 'Prescrição de Exames'
         verbose_name_plural = 'Prescrições de Exames'
         ordering = ['-date']
+        indexes = [
+            models.Index(fields=['paciente', '-date', '-receita_ptr'], name='exames_paciente_date_idx'),
+        ]
 
     def __str__(self):
         return f"Exames {self.id_receita} - {self.paciente.nome} ({self.date})"
@@ -171,11 +262,98 @@ class ItemExames(models.Model):
     exame = models.ForeignKey(Exame, on_delete=models.CASCADE)
     exames = models.ForeignKey(Exames, on_delete=models.CASCADE)
     resultados = models.TextField(blank=True)
-    imagem = models.ImageField(upload_to='ImagemExames/', blank=True,null=True)
+    imagem = models.ImageField(upload_to='ImagemExames/', storage=exam_image_storage, blank=True,null=True)
+    # Content hash naming the thumbnail/preview files, set by workshop.previews
+    imagem_sha256 = models.CharField(max_length=64, blank=True, editable=False)
 
     class Meta:
         verbose_name = 'Item de Exame'
         verbose_name_plural = 'Itens de Exames'
 
     def __str__(self):
-        return f"{self.exame.nome} - {self.exames}"
\ No newline at end of file
+        return f"{self.exame.nome} - {self.exames}"
+
+    @property
+    def thumbnail_url(self):
+        from .previews import derivative_url
+        return derivative_url(self.imagem_sha256, 'thumb')
+
+    @property
+    def preview_url(self):
+        from .previews import derivative_url
+        return derivative_url(self.imagem_sha256, 'preview')
+
+
+class EstatisticaDiaria(models.Model):
+    """Per-day activity rollup, maintained by workshop.stats."""
+    data = models.DateField(unique=True)
+    consultas = models.IntegerField(default=0)
+    pacientes = models.IntegerField(default=0)
+    medicacoes = models.IntegerField(default=0)
+    exames = models.IntegerField(default=0)
+
+    class Meta:
+        verbose_name = 'Estatística Diária'
+        verbose_name_plural = 'Estatísticas Diárias'
+        ordering = ['-data']
+
+    def __str__(self):
+        return f"Estatísticas de {self.data}"
+
+
+class EstatisticaTotal(models.Model):
+    """All-time totals of the EstatisticaDiaria rows, in a single row kept
+    by workshop.stats alongside them."""
+    consultas = models.IntegerField(default=0)
+    pacientes = models.IntegerField(default=0)
+    medicacoes = models.IntegerField(default=0)
+    exames = models.IntegerField(default=0)
+
+    class Meta:
+        verbose_name = 'Estatística Total'
+        verbose_name_plural = 'Estatísticas Totais'
+
+    def __str__(self):
+        return "Estatísticas totais"
+
+
+class ImagemBlob(models.Model):
+    """How many ItemExames share an image file, kept by workshop.blobs."""
+    name = models.CharField(max_length=255, unique=True)
+    refcount = models.IntegerField(default=0)
+
+    class Meta:
+        verbose_name = 'Ficheiro de Imagem'
+        verbose_name_plural = 'Ficheiros de Imagem'
+
+    def __str__(self):
+        return f"{self.name} ({self.refcount})"
+
+
+class UploadSession(models.Model):
+    """A resumable chunked upload, written to by workshop.uploads."""
+    PENDING = 'pending'
+    COMPLETE = 'complete'
+    FAILED = 'failed'
+    STATUS_CHOICES = [
+        (PENDING, 'Em andamento'),
+        (COMPLETE, 'Concluído'),
+        (FAILED, 'Falhou'),
+    ]
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    filename = models.CharField(max_length=255)
+    size = models.BigIntegerField()
+    received = models.BigIntegerField(default=0)
+    # Expected digest if the client sent one, the actual digest once complete
+    sha256 = models.CharField(max_length=64, blank=True)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=PENDING)
+    created = models.DateTimeField(auto_now_add=True)
+    updated = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name = 'Sessão de Upload'
+        verbose_name_plural = 'Sessões de Upload'
+
+    def __str__(self):
+        return f"{self.filename} ({self.received}/{self.size})"
@@ -0,0 +1,218 @@
+import json
+
+from django.core import signing
+from django.core.exceptions import FieldDoesNotExist, ValidationError
+from django.db import models
+from django.db.models import F, Func, Value
+from django.db.models.lookups import GreaterThan, LessThan
+from django.http import Http404
+
+# -------------------------------
+# Keyset (cursor) Pagination
+# -------------------------------
+# Pages are addressed by the ordering key of their first/last row instead
+# of an OFFSET, so fetching page 10 000 costs the same index range scan as
+# fetching page 1. Cursors are signed so clients cannot forge positions; a
+# cursor that does not decode to a position in the listing (tampered,
+# truncated, or taken from another listing) starts over at the first page.
+
+CURSOR_SALT = 'workshop.pagination'
+FORWARD = 'n'
+BACKWARD = 'p'
+
+
+class Row(Func):
+    """SQL row constructor, compared lexicographically by PostgreSQL."""
+    function = 'ROW'
+    output_field = models.Field()
+
+
+class InvalidCursor(Http404):
+    pass
+
+
+def encode_cursor(direction, keys):
+    return signing.dumps([direction, keys], salt=CURSOR_SALT, compress=True)
+
+
+def decode_cursor(cursor):
+    try:
+        direction, keys = signing.loads(cursor, salt=CURSOR_SALT)
+    except (signing.BadSignature, TypeError, ValueError):
+        raise InvalidCursor('Invalid cursor.')
+    if direction not in (FORWARD, BACKWARD) or not (keys is None or isinstance(keys, list)):
+        raise InvalidCursor('Invalid cursor.')
+    return direction, keys
+
+
+class KeysetPage:
+    """A window of rows plus the cursors needed to move around it.
+
+    Mirrors the parts of ``django.core.paginator.Page`` the templates use.
+    """
+
+    def __init__(self, object_list, ordering, has_next, has_previous):
+        self.object_list = object_list
+        self.ordering = ordering
+        self.has_next_page = has_next
+        self.has_previous_page = has_previous
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def has_next(self):
+        return self.has_next_page
+
+    def has_previous(self):
+        return self.has_previous_page
+
+    def has_other_pages(self):
+        return self.has_next_page or self.has_previous_page
+
+    def _keys(self, obj):
+        keys = []
+        for name in self.ordering:
+            name = name.lstrip('-')
+            if isinstance(obj, dict):
+                # A values() row
+                value = obj[name]
+                keys.append(value.isoformat() if hasattr(value, 'isoformat') else value)
+                continue
+            try:
+                keys.append(obj._meta.get_field(name).value_to_string(obj))
+            except FieldDoesNotExist:
+                # Annotations (e.g. a search rank) are stored as-is
+                keys.append(getattr(obj, name))
+        return keys
+
+    @property
+    def next_cursor(self):
+        if not self.has_next_page:
+            return None
+        return encode_cursor(FORWARD, self._keys(self.object_list[-1]))
+
+    @property
+    def previous_cursor(self):
+        if not self.has_previous_page:
+            return None
+        return encode_cursor(BACKWARD, self._keys(self.object_list[0]))
+
+    @property
+    def last_cursor(self):
+        return encode_cursor(BACKWARD, None)
+
+
+def _key_value(queryset, name, key):
+    try:
+        field = queryset.model._meta.get_field(name)
+    except FieldDoesNotExist:
+        field = queryset.query.annotations[name].output_field
+    try:
+        return Value(field.to_python(key), output_field=field)
+    except (ValidationError, TypeError, ValueError):
+        raise InvalidCursor('Invalid cursor.')
+
+
+def _position(queryset, names, cursor):
+    """``(direction, key values)`` of ``cursor``; raises InvalidCursor."""
+    direction, keys = decode_cursor(cursor)
+    if keys is None:
+        return direction, None
+    if len(keys) != len(names):
+        raise InvalidCursor('Invalid cursor.')
+    return direction, [_key_value(queryset, name, key) for name, key in zip(names, keys)]
+
+
+def keyset_paginate(queryset, ordering, per_page, cursor=None):
+    """Return the ``KeysetPage`` of ``queryset`` addressed by ``cursor``.
+
+    ``ordering`` must list fields (or annotations) that all sort in the
+    same direction and together identify a row, e.g. ``('nome', 'cc')``.
+    It should be backed by a composite index in the same order.
+    """
+    descending = ordering[0].startswith('-')
+    if any(name.startswith('-') != descending for name in ordering):
+        raise ValueError('Keyset ordering fields must share one direction.')
+
+    names = [name.lstrip('-') for name in ordering]
+    try:
+        direction, values = _position(queryset, names, cursor) if cursor else (FORWARD, None)
+    except InvalidCursor:
+        direction, values = FORWARD, None
+    backward = direction == BACKWARD
+
+    if values is not None:
+        after = LessThan if descending != backward else GreaterThan
+        queryset = queryset.filter(after(Row(*[F(name) for name in names]), Row(*values)))
+
+    if backward:
+        queryset = queryset.order_by(*[
+            name if descending else f'-{name}' for name in names
+        ])
+    else:
+        queryset = queryset.order_by(*ordering)
+
+    rows = list(queryset[:per_page + 1])
+    has_more = len(rows) > per_page
+    rows = rows[:per_page]
+
+    if backward:
+        rows.reverse()
+        return KeysetPage(rows, ordering, has_next=values is not None, has_previous=has_more)
+    return KeysetPage(rows, ordering, has_next=has_more, has_previous=values is not None)
+
+
+# -------------------------------
+# Counting
+# -------------------------------
+EXACT_COUNT_THRESHOLD = 10000
+
+
+def estimate_count(queryset, exact_below=EXACT_COUNT_THRESHOLD):
+    """Return ``(count, is_estimate)`` for ``queryset``.
+
+    Asks the planner for its row estimate first and only runs ``COUNT(*)``
+    when that estimate is small enough for an exact count to be cheap.
+    """
+    plan = json.loads(queryset.order_by().explain(format='json'))
+    # A list holding the plan, or the plan itself, depending on the driver
+    plan = plan[0] if isinstance(plan, list) else plan
+    estimate = int(plan['Plan']['Plan Rows'])
+    if estimate < exact_below:
+        return queryset.count(), False
+    return estimate, True
+
+
+class KeysetPaginationMixin:
+    """Drop-in replacement for ``ListView`` pagination using keyset cursors.
+
+    Set ``keyset_ordering`` and ``paginate_by`` on the view. The template
+    receives ``page_obj`` with ``next_cursor``/``previous_cursor`` instead
+    of page numbers, and ``total_count`` for the whole queryset (estimated
+    past ``exact_count_threshold``, see ``estimate_count``).
+    """
+    keyset_ordering = None
+    cursor_kwarg = 'cursor'
+    exact_count_threshold = EXACT_COUNT_THRESHOLD
+
+    def get_ordering(self):
+        return self.keyset_ordering
+
+    def get_keyset_ordering(self):
+        return self.keyset_ordering
+
+    def paginate_queryset(self, queryset, page_size):
+        cursor = self.request.GET.get(self.cursor_kwarg)
+        page = keyset_paginate(queryset, self.get_keyset_ordering(), page_size, cursor)
+        return (None, page, page.object_list, page.has_other_pages())
+
+    def get_total_count(self):
+        return estimate_count(self.object_list, self.exact_count_threshold)
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context['total_count'], context['total_count_is_estimate'] = self.get_total_count()
+        return context
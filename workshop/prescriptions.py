@@ -0,0 +1,205 @@
+from collections import Counter, defaultdict
+
+from django.db import transaction
+from django.db.models import FileField
+
+from . import api, blobs, fragments, previews, uploads
+
+# -------------------------------
+# Prescription Writes
+# -------------------------------
+# Creates and edits Medicacao/Exames prescriptions together with their
+# items in one transaction, whether one prescription comes from the doctor
+# views or many arrive in a batch from a pharmacy or laboratory system.
+#
+# Headers are saved one by one (Medicacao and Exames inherit from Receita,
+# and multi-table models cannot be bulk inserted), so their signal handlers
+# keep the statistics and patient counters as usual. Items are written in
+# bulk: one INSERT per item table for every new row, and one UPDATE for the
+# rows whose stored values actually differ from the instance, restricted to
+# the fields that differ. Bulk writes skip the item signal handlers, so the
+# image reference counts, previews, fragment invalidation and API ETag
+# retirement they would have done are done here instead, and deleted items
+# are removed with one DELETE per item table the same way. Finished chunked uploads are claimed in the same
+# transaction, so a failed write leaves them attachable.
+
+
+class Prescription:
+    """A Medicacao or Exames header and the item rows to write under it.
+
+    ``items`` are new rows or edited existing ones (rows passed unchanged
+    are not written); ``deleted`` are existing rows to remove; ``uploads``
+    are ``(item, session)`` pairs of finished chunked uploads to attach as
+    the items' images.
+    """
+
+    def __init__(self, header, items=(), deleted=(), uploads=()):
+        self.header = header
+        self.items = list(items)
+        self.deleted = list(deleted)
+        self.uploads = list(uploads)
+
+    @classmethod
+    def from_forms(cls, form, formset):
+        """The prescription described by a valid header form and item formset."""
+        items = formset.save(commit=False)
+        attached = [
+            (item_form.instance, item_form.cleaned_data['upload'])
+            for item_form in formset.forms
+            if item_form.cleaned_data.get('upload') and item_form not in formset.deleted_forms
+        ]
+        return cls(form.save(commit=False), items, formset.deleted_objects, attached)
+
+
+def _item_relations():
+    from .models import Exames, ItemExames, ItemMedicacao, Medicacao
+
+    return {Medicacao: (ItemMedicacao, 'medicacao'), Exames: (ItemExames, 'exames')}
+
+
+def _compared_fields(model):
+    return [field for field in model._meta.concrete_fields if not field.primary_key]
+
+
+def _prep(field, value):
+    value = field.get_prep_value(value)
+    if isinstance(field, FileField):
+        # An empty FieldFile and a NULL column are both "no file"
+        value = value or ''
+    return value
+
+
+def changed_fields(model, objs):
+    """``{obj: [field, ...]}`` for the existing ``objs`` that differ from their rows.
+
+    Compares every stored column in a single query.
+    """
+    objs = [obj for obj in objs if not obj._state.adding]
+    if not objs:
+        return {}
+    fields = _compared_fields(model)
+    stored = {
+        row['pk']: row
+        for row in model._base_manager.filter(pk__in=[obj.pk for obj in objs])
+        .values('pk', *(field.attname for field in fields))
+    }
+    changed = {}
+    for obj in objs:
+        row = stored.get(obj.pk)
+        if row is None:
+            continue
+        differing = [
+            field for field in fields
+            if _prep(field, getattr(obj, field.attname)) != _prep(field, row[field.attname])
+        ]
+        if differing:
+            obj._stored = row
+            changed[obj] = differing
+    return changed
+
+
+def _save_header(header):
+    if header._state.adding:
+        header.save()
+        return
+    differing = changed_fields(type(header), [header]).get(header)
+    if differing:
+        header.save(update_fields=[field.name for field in differing])
+
+
+def _write_items(model, items):
+    """Bulk insert the new ``items`` and bulk update the changed ones.
+
+    Returns ``(created, updated)``, the latter as ``{item: [field, ...]}``.
+    """
+    created = [item for item in items if item._state.adding]
+    updated = changed_fields(model, items)
+    if created:
+        model.objects.bulk_create(created)
+    if updated:
+        names = set()
+        for item, differing in updated.items():
+            for field in differing:
+                # Stores uncommitted files, like Model.save() does
+                setattr(item, field.attname, field.pre_save(item, False))
+                names.add(field.name)
+        model.objects.bulk_update(list(updated), sorted(names))
+    return created, updated
+
+
+def _clear_stale_digests(items):
+    for item in items:
+        # A newly assigned upload is stored (and named) by this write
+        if not item.imagem or not item.imagem._committed:
+            item.imagem_sha256 = ''
+
+
+def _record_images(created, updated):
+    added, removed = Counter(), Counter()
+    for item in created:
+        added[item.imagem.name] += 1
+    for item, differing in updated.items():
+        if any(field.name == 'imagem' for field in differing):
+            removed[item._stored['imagem']] += 1
+            added[item.imagem.name] += 1
+    for name, count in removed.items():
+        blobs.record_removed(name, count)
+    for name, count in added.items():
+        blobs.record_added(name, count)
+
+    for item in [*created, *updated]:
+        if item.imagem and not item.imagem_sha256:
+            previews.schedule(item.pk)
+
+
+def _delete_items(model, pks):
+    """Delete the ``model`` rows ``pks`` in one statement.
+
+    Skips the delete handlers, which would query once per row; the image
+    references they would drop are dropped here, one UPDATE per image.
+    """
+    from .models import ItemExames
+
+    rows = model._base_manager.filter(pk__in=pks)
+    removed = Counter(rows.values_list('imagem', flat=True)) if model is ItemExames else {}
+    rows._raw_delete(rows.db)
+    for name, count in removed.items():
+        blobs.record_removed(name, count)
+
+
+def save_prescriptions(prescriptions):
+    """Write ``prescriptions`` and their items in one transaction.
+
+    Returns the prescriptions, with every header and item saved.
+    """
+    from .models import ItemExames
+
+    prescriptions = list(prescriptions)
+    relations = _item_relations()
+    items, deleted = defaultdict(list), defaultdict(list)
+
+    with transaction.atomic():
+        for prescription in prescriptions:
+            _save_header(prescription.header)
+            item_model, fk_name = relations[type(prescription.header)]
+            for item, session in prescription.uploads:
+                uploads.claim(session, item.imagem)
+            for item in prescription.items:
+                setattr(item, fk_name, prescription.header)
+                items[item_model].append(item)
+            deleted[item_model].extend(item.pk for item in prescription.deleted if item.pk)
+
+        for item_model, pks in deleted.items():
+            _delete_items(item_model, pks)
+
+        for item_model, model_items in items.items():
+            if item_model is ItemExames:
+                _clear_stale_digests(model_items)
+            created, updated = _write_items(item_model, model_items)
+            if item_model is ItemExames:
+                _record_images(created, updated)
+
+        fragments.invalidate(*(prescription.header.paciente_id for prescription in prescriptions))
+        api.invalidate(*(item_model.__name__ for item_model in [*items, *deleted]))
+
+    return prescriptions
@@ -0,0 +1,138 @@
+import hashlib
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import connection, transaction
+
+from .storage import blob_digest, exam_preview_storage
+
+logger = logging.getLogger('workshop.previews')
+
+# -------------------------------
+# Exam Image Previews
+# -------------------------------
+# Every exam image gets a small thumbnail for the detail page and a
+# web-sized preview for the full view; the original is only fetched on
+# download. Derivatives are named after the SHA-256 of the original's
+# content, so identical uploads share them and an existing file never needs
+# regenerating. The digest is stored on ItemExames.imagem_sha256 once every
+# derivative is on disk.
+#
+# Generation is scheduled by workshop.signals when a new image is saved and
+# runs after the transaction commits, on a small thread pool
+# (EXAM_PREVIEWS_ASYNC = False runs it inline instead).
+# ``manage.py generate_exam_previews`` fills in anything missing.
+
+PREVIEW_DIR = 'previews'
+SIZES = {
+    'thumb': (240, 240),
+    'preview': (1280, 1280),
+}
+FORMAT = 'WEBP'
+EXTENSION = 'webp'
+QUALITY = 80
+
+_executor = None
+
+
+def derivative_name(digest, size):
+    return f'{PREVIEW_DIR}/{digest[:2]}/{digest}_{size}.{EXTENSION}'
+
+
+def derivative_url(digest, size):
+    if not digest:
+        return None
+    return exam_preview_storage().url(derivative_name(digest, size))
+
+
+def file_digest(field_file):
+    digest = hashlib.sha256()
+    field_file.open('rb')
+    try:
+        for chunk in field_file.chunks():
+            digest.update(chunk)
+    finally:
+        field_file.close()
+    return digest.hexdigest()
+
+
+def render(image, box):
+    """Downsize ``image`` to fit ``box`` and encode it."""
+    from PIL import ImageOps
+
+    image = ImageOps.exif_transpose(image)
+    image.thumbnail(box)
+    if image.mode not in ('RGB', 'RGBA'):
+        image = image.convert('RGBA' if 'A' in image.getbands() else 'RGB')
+    output = BytesIO()
+    image.save(output, FORMAT, quality=QUALITY, method=4)
+    return output.getvalue()
+
+
+def generate_previews(item):
+    """Write any missing derivatives of ``item.imagem`` and record its digest.
+
+    Returns the digest, or None if the item has no image.
+    """
+    from PIL import Image
+    from .models import ItemExames
+
+    if not item.imagem:
+        return None
+    # Content-addressed names already carry the digest (workshop.storage)
+    digest = blob_digest(item.imagem.name) or file_digest(item.imagem)
+    storage = exam_preview_storage()
+    missing = [
+        (size, box) for size, box in SIZES.items()
+        if not storage.exists(derivative_name(digest, size))
+    ]
+    if missing:
+        item.imagem.open('rb')
+        try:
+            with Image.open(item.imagem) as image:
+                image.load()
+                for size, box in missing:
+                    # Replaces a copy another worker rendered meanwhile
+                    storage.save(
+                        derivative_name(digest, size), ContentFile(render(image.copy(), box))
+                    )
+        finally:
+            item.imagem.close()
+
+    # Skip the update if the image was replaced meanwhile
+    ItemExames.objects.filter(pk=item.pk, imagem=item.imagem.name).update(imagem_sha256=digest)
+    item.imagem_sha256 = digest
+    return digest
+
+
+def _generate(item_id):
+    from .models import ItemExames
+
+    try:
+        item = ItemExames.objects.filter(pk=item_id).first()
+        if item is not None:
+            generate_previews(item)
+    except Exception:
+        logger.exception('Could not generate previews for ItemExames %s', item_id)
+    finally:
+        if getattr(settings, 'EXAM_PREVIEWS_ASYNC', True):
+            connection.close()
+
+
+def schedule(item_id):
+    """Generate previews for an item once the current transaction commits."""
+    def run():
+        global _executor
+        if not getattr(settings, 'EXAM_PREVIEWS_ASYNC', True):
+            _generate(item_id)
+            return
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                getattr(settings, 'EXAM_PREVIEW_WORKERS', 2), thread_name_prefix='exam-previews'
+            )
+        _executor.submit(_generate, item_id)
+
+    transaction.on_commit(run)
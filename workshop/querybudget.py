@@ -0,0 +1,169 @@
+import contextvars
+import re
+import threading
+import time
+from collections import Counter
+from contextlib import ExitStack
+
+from django.db import connections
+
+# -------------------------------
+# Query Budgets
+# -------------------------------
+# Every request is run under a database execute wrapper that records each
+# query's SQL and duration (see workshop.middleware). Queries are grouped by
+# fingerprint -- the SQL with parameters left as placeholders -- so an N+1
+# shows up as one fingerprint executed N times.
+#
+# Views declare ``query_budget``, the most queries one request to them may
+# run. Budgets are reported by the middleware and enforced in the test suite
+# with ``QueryBudgetTestMixin``.
+
+# The recorder of the request being served, for queries it hands to other
+# threads (see workshop.fanout)
+_active_recorder = contextvars.ContextVar('query_recorder', default=None)
+
+_IN_LIST = re.compile(r'%s(, %s)+')
+_WHITESPACE = re.compile(r'\s+')
+
+
+def fingerprint(sql):
+    """``sql`` with IN-lists collapsed, so batches of any size compare equal."""
+    return _WHITESPACE.sub(' ', _IN_LIST.sub('%s, ...', sql)).strip()
+
+
+class QueryRecorder:
+    """Execute wrapper collecting ``(sql, seconds)`` for every query."""
+
+    def __init__(self):
+        self.queries = []
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries.append((sql, time.perf_counter() - started))
+
+    def __enter__(self):
+        self._stack = ExitStack()
+        for alias in connections:
+            self._stack.enter_context(connections[alias].execute_wrapper(self))
+        self._token = _active_recorder.set(self)
+        return self
+
+    def __exit__(self, *exc_info):
+        _active_recorder.reset(self._token)
+        self._stack.close()
+
+    @property
+    def count(self):
+        return len(self.queries)
+
+    @property
+    def duration(self):
+        return sum(seconds for _, seconds in self.queries)
+
+    def duplicates(self):
+        """Fingerprints run more than once, with how many times they ran."""
+        counts = Counter(fingerprint(sql) for sql, _ in self.queries)
+        return {sql: count for sql, count in counts.items() if count > 1}
+
+
+def view_query_budget(resolver_match):
+    """The ``query_budget`` declared by the view behind ``resolver_match``."""
+    if resolver_match is None:
+        return None
+    view = getattr(resolver_match.func, 'view_class', resolver_match.func)
+    return getattr(view, 'query_budget', None)
+
+
+# -------------------------------
+# Per-view statistics
+# -------------------------------
+
+def active_recorder():
+    """The QueryRecorder of the current request, if any."""
+    return _active_recorder.get()
+
+
+class QueryStats:
+    """Aggregated query statistics per URL name, for this process."""
+    max_duplicates = 10
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._views = {}
+
+    def record(self, url_name, recorder, budget=None):
+        duplicates = recorder.duplicates()
+        with self._lock:
+            view = self._views.setdefault(url_name, {
+                'requests': 0, 'queries': 0, 'max_queries': 0,
+                'db_time': 0.0, 'max_db_time': 0.0,
+                'budget': budget, 'over_budget': 0, 'duplicates': Counter(),
+            })
+            view['requests'] += 1
+            view['queries'] += recorder.count
+            view['max_queries'] = max(view['max_queries'], recorder.count)
+            view['db_time'] += recorder.duration
+            view['max_db_time'] = max(view['max_db_time'], recorder.duration)
+            view['budget'] = budget
+            if budget is not None and recorder.count > budget:
+                view['over_budget'] += 1
+            view['duplicates'].update(duplicates)
+
+    def report(self):
+        with self._lock:
+            return {
+                url_name: {
+                    'requests': view['requests'],
+                    'queries': {
+                        'mean': round(view['queries'] / view['requests'], 2),
+                        'max': view['max_queries'],
+                    },
+                    'db_time_ms': {
+                        'mean': round(view['db_time'] * 1000 / view['requests'], 2),
+                        'max': round(view['max_db_time'] * 1000, 2),
+                    },
+                    'budget': view['budget'],
+                    'over_budget': view['over_budget'],
+                    'duplicates': [
+                        {'sql': sql, 'count': count}
+                        for sql, count in view['duplicates'].most_common(self.max_duplicates)
+                    ],
+                }
+                for url_name, view in sorted(self._views.items())
+            }
+
+    def reset(self):
+        with self._lock:
+            self._views.clear()
+
+
+query_stats = QueryStats()
+
+
+# -------------------------------
+# Test helper
+# -------------------------------
+
+class QueryBudgetTestMixin:
+    """``TestCase`` mixin checking requests against their view's budget."""
+
+    def assertWithinQueryBudget(self, url, data=None, method='get'):
+        with QueryRecorder() as recorder:
+            response = getattr(self.client, method)(url, data)
+        budget = view_query_budget(response.resolver_match)
+        if budget is None:
+            self.fail(f'The view serving {url} declares no query_budget.')
+        if recorder.count > budget:
+            duplicates = ''.join(
+                f'\n  {count}x {sql}' for sql, count in recorder.duplicates().items()
+            )
+            queries = ''.join(f'\n  {sql}' for sql, _ in recorder.queries)
+            self.fail(
+                f'{url} ran {recorder.count} queries, over its budget of {budget}.'
+                f'\nRepeated:{duplicates or " none"}\nQueries:{queries}'
+            )
+        return response
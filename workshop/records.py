@@ -0,0 +1,25 @@
+from django.db.models import Count
+
+from .models import Consulta, Medicacao, Exames
+
+# -------------------------------
+# Patient Record
+# -------------------------------
+
+
+def patient_consultas(paciente):
+    return Consulta.objects.filter(paciente=paciente).order_by('-data_hora', '-id')
+
+
+def patient_medicacoes(paciente):
+    """Medication prescriptions, newest first, with ``item_count`` annotated."""
+    return Medicacao.objects.filter(paciente=paciente).annotate(
+        item_count=Count('itemmedicacao')
+    ).order_by('-date', '-pk')
+
+
+def patient_exames(paciente):
+    """Exam prescriptions, newest first, with ``item_count`` annotated."""
+    return Exames.objects.filter(paciente=paciente).annotate(
+        item_count=Count('itemexames')
+    ).order_by('-date', '-pk')
@@ -0,0 +1,132 @@
+import contextvars
+import random
+import uuid
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.core.cache import cache
+
+# -------------------------------
+# Read Replicas
+# -------------------------------
+# With DATABASE_REPLICAS set (SNS/settings.py), each entry adds a streaming
+# replica of ``default`` as ``replica1``, ``replica2``, ... Only reads made
+# inside ``replica_reads()`` go to a replica (picked at random per query);
+# everything else, and every write, uses the primary. ReplicaMiddleware
+# opens that block around views declaring ``read_replica = True`` (the
+# dashboards, detail and list views) and the admin changelists use
+# ``ReplicaChangeListMixin``.
+#
+# Replicas lag behind the primary by up to DATABASE_REPLICA_LAG seconds:
+#
+# * a request that writes sets a short-lived cookie, and while it is
+#   present that client's reads stay on the primary, so users always see
+#   their own saves;
+# * cache tokens retired by a write (fragment versions, API generations)
+#   are replaced after commit by tokens that only live for the lag window
+#   (``retire_after_commit``), so what other clients render from a replica
+#   that has not replayed the write yet is dropped once it has.
+
+PRIMARY = 'default'
+STICKY_COOKIE = 'read_primary'
+
+
+class _Routing:
+    def __init__(self):
+        self.replicas = []
+        self.wrote = False
+
+
+_routing = contextvars.ContextVar('replica_routing', default=None)
+
+
+def replica_aliases():
+    """Database aliases of the configured replicas."""
+    return [f'replica{i}' for i in range(1, len(getattr(settings, 'DATABASE_REPLICAS', ())) + 1)]
+
+
+def replica_lag():
+    """Seconds a replica may trail the primary; 0 without replicas."""
+    if not replica_aliases():
+        return 0
+    return getattr(settings, 'DATABASE_REPLICA_LAG', 5)
+
+
+def may_read_replicas(request):
+    """Whether ``request`` may be served from a replica.
+
+    Only safe requests from clients that have not written recently may.
+    """
+    return request.method in ('GET', 'HEAD') and STICKY_COOKIE not in request.COOKIES
+
+
+@contextmanager
+def replica_reads(enabled=True):
+    """Route the reads made inside the block to the replicas, if ``enabled``.
+
+    Yields the request's routing state, shared with any enclosing block;
+    its ``wrote`` tells whether anything was written. Once something is,
+    reads return to the primary.
+    """
+    state = _routing.get()
+    token = None
+    if state is None:
+        state = _Routing()
+        token = _routing.set(state)
+    previous = state.replicas
+    state.replicas = replica_aliases() if enabled else []
+    try:
+        yield state
+    finally:
+        state.replicas = previous
+        if token is not None:
+            _routing.reset(token)
+
+
+def retire_after_commit(keys):
+    """After-commit retirement of the cache tokens ``keys``.
+
+    Without replicas they are deleted. With replicas each is replaced by a
+    new token lasting only ``replica_lag()`` seconds, so anything cached
+    under it from not yet replicated data is retired again once the
+    replicas have caught up.
+    """
+    lag = replica_lag()
+    if lag:
+        cache.set_many({key: uuid.uuid4().hex for key in keys}, lag)
+    else:
+        cache.delete_many(keys)
+
+
+class ReplicaRouter:
+    """Database router sending ``replica_reads()`` reads to the replicas."""
+
+    def db_for_read(self, model, **hints):
+        state = _routing.get()
+        if state is None or not state.replicas or state.wrote:
+            return PRIMARY
+        return random.choice(state.replicas)
+
+    def db_for_write(self, model, **hints):
+        state = _routing.get()
+        if state is not None:
+            # Later reads in the request must see this write
+            state.wrote = True
+        return PRIMARY
+
+    def allow_relation(self, obj1, obj2, **hints):
+        databases = {PRIMARY, *replica_aliases()}
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db == PRIMARY
+
+
+class ReplicaChangeListMixin:
+    """ModelAdmin mixin serving changelist pages from the replicas."""
+
+    def changelist_view(self, request, extra_context=None):
+        with replica_reads(enabled=may_read_replicas(request)):
+            return super().changelist_view(request, extra_context)
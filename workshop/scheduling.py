@@ -0,0 +1,317 @@
+from bisect import bisect_left
+from calendar import monthrange
+from collections import Counter, defaultdict, namedtuple
+from contextlib import contextmanager
+from datetime import datetime, time, timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, connection, transaction
+from django.db.backends.postgresql.psycopg_any import DateTimeTZRange
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+
+from . import api, counters, fragments, stats
+from .models import Consulta, Medico, MedicoConsulta, Paciente
+
+# -------------------------------
+# Scheduling
+# -------------------------------
+# Consultations last one slot (SCHEDULE_SLOT_MINUTES) and are offered on
+# weekdays within SCHEDULE_HOURS, in the current time zone. Booking a doctor
+# stores the interval on the MedicoConsulta row (``periodo``), and an
+# exclusion constraint over (medico, periodo) makes PostgreSQL reject any
+# second booking overlapping it, however many requests race for the slot.
+# The constraint's GiST index also answers "what is booked for these
+# doctors in this window", so ``free_slots`` reads the doctors and their
+# bookings in two indexed queries and fills the free slots in memory.
+#
+# Patients are kept from double booking by locking their row while the
+# consultation is checked and written. MedicoConsulta rows without a
+# ``periodo`` (records entered after the fact, generated data) take no
+# place in the agenda.
+
+DEFAULT_SLOT_MINUTES = 30
+# Opening and closing hour
+DEFAULT_HOURS = (8, 19)
+FREE_SLOTS_DEFAULT_LIMIT = 10
+FREE_SLOTS_MAX_LIMIT = 100
+SEARCH_MAX_DAYS = 31
+OVERLAP_CONSTRAINT = 'medicoconsulta_no_overlap'
+
+Slot = namedtuple('Slot', ['start', 'end', 'medico'])
+
+
+class SlotUnavailable(Exception):
+    pass
+
+
+def slot_length():
+    return timedelta(minutes=getattr(settings, 'SCHEDULE_SLOT_MINUTES', DEFAULT_SLOT_MINUTES))
+
+
+def period(start):
+    """The interval booked by a consultation starting at ``start``."""
+    return DateTimeTZRange(start, start + slot_length())
+
+
+def opening_slots(start, end):
+    """Start times of the slots beginning in [start, end), in order."""
+    opening, closing = getattr(settings, 'SCHEDULE_HOURS', DEFAULT_HOURS)
+    length = slot_length()
+    day, last = timezone.localdate(start), timezone.localdate(end)
+    while day <= last:
+        if day.weekday() < 5:
+            at = timezone.make_aware(datetime.combine(day, time(opening)))
+            closes = timezone.make_aware(datetime.combine(day, time(closing)))
+            while at + length <= closes:
+                if start <= at < end:
+                    yield at
+                at += length
+        day += timedelta(days=1)
+
+
+def parse_instant(value):
+    """An ISO date or datetime as an aware datetime; None if ``value`` is empty.
+
+    Dates stand for their midnight. Raises ValueError if invalid.
+    """
+    if not value:
+        return None
+    parsed = parse_datetime(value)
+    if parsed is None:
+        day = parse_date(value)
+        if day is None:
+            raise ValueError(value)
+        parsed = datetime.combine(day, time.min)
+    return parsed if timezone.is_aware(parsed) else timezone.make_aware(parsed)
+
+
+def free_slots(medicos, start, end, limit=FREE_SLOTS_DEFAULT_LIMIT):
+    """The first ``limit`` free Slots of the doctors ``medicos`` (a queryset).
+
+    Slots begin in [start, end), never in the past and at most
+    SEARCH_MAX_DAYS after ``start``; they are ordered by time, then doctor.
+    """
+    start = max(start, timezone.now())
+    end = min(end, start + timedelta(days=SEARCH_MAX_DAYS))
+    if start >= end:
+        return []
+    medicos = medicos.order_by('nome', 'cc').only('cc', 'nome', 'especialidade')
+    doctors = list(medicos)
+    if not doctors:
+        return []
+
+    length = slot_length()
+    busy = defaultdict(lambda: ([], []))
+    bookings = (
+        MedicoConsulta.objects
+        .filter(medico__in=medicos.values('cc'), periodo__overlap=DateTimeTZRange(start, end + length))
+        .order_by('medico', 'periodo').values_list('medico_id', 'periodo')
+    )
+    for medico_id, booked in bookings:
+        starts, ends = busy[medico_id]
+        starts.append(booked.lower)
+        ends.append(booked.upper)
+
+    slots = []
+    for at in opening_slots(start, end):
+        for medico in doctors:
+            # A doctor's bookings never overlap, so only the last one
+            # starting before the slot ends can overlap it
+            starts, ends = busy.get(medico.cc, ((), ()))
+            i = bisect_left(starts, at + length) - 1
+            if i >= 0 and ends[i] > at:
+                continue
+            slots.append(Slot(at, at + length, medico))
+            if len(slots) >= limit:
+                return slots
+    return slots
+
+
+def doctors_for(medico=None, especialidade=None):
+    """The doctors a free-slot search covers: one doctor, or a specialty."""
+    medicos = Medico.objects.all()
+    if medico is not None:
+        medicos = medicos.filter(cc=medico)
+    if especialidade:
+        medicos = medicos.filter(especialidade__iexact=especialidade)
+    return medicos
+
+
+def _lock_patient(paciente_id):
+    # Concurrent bookings for one patient then run one at a time
+    list(Paciente.objects.select_for_update().filter(pk=paciente_id).values_list('pk'))
+
+
+def _check_patient(consulta):
+    _lock_patient(consulta.paciente_id)
+    length = slot_length()
+    clash = Consulta.objects.filter(
+        paciente_id=consulta.paciente_id,
+        data_hora__gt=consulta.data_hora - length,
+        data_hora__lt=consulta.data_hora + length,
+    ).exclude(pk=consulta.pk)
+    if clash.exists():
+        raise SlotUnavailable('The patient already has a consultation at that time.')
+
+
+@contextmanager
+def _booking(message=None):
+    # ``message`` explains a doctor's overlapping booking; without one no
+    # doctor is booked and the constraint cannot be violated
+    try:
+        with transaction.atomic():
+            yield
+    except IntegrityError as exc:
+        if message is not None and OVERLAP_CONSTRAINT in str(exc):
+            raise SlotUnavailable(message) from exc
+        raise
+
+
+def book_consulta(consulta, medico=None, role='Primary Doctor'):
+    """Save the new ``consulta``, booking ``medico`` for it if given.
+
+    Raises SlotUnavailable, saving nothing, if the patient or the doctor is
+    already booked at that time.
+    """
+    message = f'{medico} is already booked at that time.' if medico is not None else None
+    with _booking(message):
+        _check_patient(consulta)
+        consulta.save()
+        if medico is not None:
+            MedicoConsulta.objects.create(
+                medico=medico, consulta=consulta, role=role, periodo=period(consulta.data_hora),
+            )
+    return consulta
+
+
+def reschedule_consulta(consulta):
+    """Save the edited ``consulta``, moving its doctors' bookings with it.
+
+    Raises SlotUnavailable, saving nothing, if the patient or one of the
+    doctors is already booked at the new time.
+    """
+    with _booking('A doctor of this consultation is already booked at that time.'):
+        _check_patient(consulta)
+        consulta.save()
+    return consulta
+
+
+def move_bookings(consulta):
+    """Move the bookings of ``consulta``'s doctors to its current time."""
+    MedicoConsulta.objects.filter(consulta=consulta, periodo__isnull=False).update(
+        periodo=period(consulta.data_hora),
+    )
+
+
+# -------------------------------
+# Recurring Series
+# -------------------------------
+# Follow-up care books the same patient and doctors at regular intervals.
+# A series is expanded from its rule up front, checked against the
+# patient's consultations and the doctors' bookings in one query over the
+# whole list of intervals, and written with one INSERT per table. Bulk
+# inserts skip the Consulta signal handlers, so the statistics, patient
+# counters, fragment versions and API ETags they maintain are updated here
+# instead, once for the whole series.
+
+SERIES_MAX_OCCURRENCES = 52
+FREQUENCIES = {
+    'weekdays': 'Every weekday',
+    'weekly': 'Every week',
+    'biweekly': 'Every two weeks',
+    'monthly': 'Every month',
+}
+
+
+def _add_months(day, months):
+    month = day.month - 1 + months
+    year, month = day.year + month // 12, month % 12 + 1
+    return day.replace(year=year, month=month, day=min(day.day, monthrange(year, month)[1]))
+
+
+def recurrence(first, frequency, occurrences):
+    """The start times of a series beginning at ``first``.
+
+    Occurrences keep the wall-clock time of ``first``; monthly ones falling
+    on a weekend move to the following Monday.
+    """
+    if frequency not in FREQUENCIES:
+        raise ValueError(f'Unknown frequency {frequency!r}.')
+    local = timezone.localtime(first).replace(tzinfo=None)
+    starts, at, n = [], local, 0
+    while len(starts) < occurrences:
+        if frequency == 'monthly':
+            at = _add_months(local, n)
+            if at.weekday() >= 5:
+                at += timedelta(days=7 - at.weekday())
+        if frequency != 'weekdays' or at.weekday() < 5:
+            starts.append(timezone.make_aware(at))
+        n += 1
+        if frequency == 'weekdays':
+            at += timedelta(days=1)
+        elif frequency != 'monthly':
+            at += timedelta(weeks=1 if frequency == 'weekly' else 2)
+    return starts
+
+
+def series_conflicts(paciente_id, medico_ids, starts):
+    """The ``starts`` at which the patient or one of the doctors is booked.
+
+    A single query for the whole series.
+    """
+    consultas = Consulta._meta.db_table
+    bookings = MedicoConsulta._meta.db_table
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"""
+            SELECT lower(slot.periodo)
+            FROM unnest(%s::tstzrange[]) AS slot(periodo)
+            WHERE EXISTS (
+                SELECT 1 FROM {bookings} booking
+                WHERE booking.medico_id = ANY(%s) AND booking.periodo && slot.periodo
+            ) OR EXISTS (
+                SELECT 1 FROM {consultas} consulta
+                WHERE consulta.paciente_id = %s
+                AND consulta.data_hora > lower(slot.periodo) - %s
+                AND consulta.data_hora < upper(slot.periodo)
+            )
+            ORDER BY 1
+            """,
+            [[period(start) for start in starts], list(medico_ids), paciente_id, slot_length()],
+        )
+        return [row[0] for row in cursor.fetchall()]
+
+
+def book_series(paciente, starts, motivo, medicos=()):
+    """Book ``paciente`` at every one of ``starts``, with the same doctors.
+
+    ``medicos`` are ``(medico, role)`` pairs booked for each consultation.
+    Returns the new consultations; raises SlotUnavailable, saving nothing,
+    if any of them clashes with an existing booking.
+    """
+    starts = sorted(starts)
+    if not starts:
+        return []
+    with _booking('A doctor of this series is already booked at one of its times.'):
+        _lock_patient(paciente.pk)
+        clashes = series_conflicts(paciente.pk, [medico.pk for medico, _ in medicos], starts)
+        if clashes:
+            raise SlotUnavailable('Already booked at {}.'.format(', '.join(
+                timezone.localtime(clash).strftime('%d/%m/%Y %H:%M') for clash in clashes
+            )))
+
+        consultas = Consulta.objects.bulk_create([
+            Consulta(paciente=paciente, data_hora=start, motivo=motivo) for start in starts
+        ])
+        MedicoConsulta.objects.bulk_create([
+            MedicoConsulta(medico=medico, consulta=consulta, role=role, periodo=period(consulta.data_hora))
+            for consulta in consultas
+            for medico, role in medicos
+        ])
+
+        stats.record_many('consultas', Counter(stats.consulta_day(consulta) for consulta in consultas))
+        counters.record_added('Consulta', paciente.pk, starts[-1], count=len(starts))
+        fragments.invalidate(paciente.pk)
+        api.invalidate('Consulta', 'MedicoConsulta')
+    return consultas
@@ -0,0 +1,153 @@
+from django.contrib.postgres.search import SearchQuery, SearchRank, TrigramSimilarity
+from django.db.models import Case, F, FloatField, IntegerField, Q, TextField, Value, When
+from django.db.models.functions import Cast, Upper
+
+from .models import Paciente
+
+# -------------------------------
+# Patient Typeahead
+# -------------------------------
+TYPEAHEAD_DEFAULT_LIMIT = 10
+TYPEAHEAD_MAX_LIMIT = 50
+
+
+def paciente_typeahead(term, limit=TYPEAHEAD_DEFAULT_LIMIT):
+    """Return the top ``limit`` patients matching ``term``.
+
+    Numeric terms are matched as prefixes of ``cc`` and
+    ``numero_seguranca_social``; anything else is matched against ``nome``
+    by prefix or trigram similarity. Every branch is served by one of the
+    indexes declared on ``Paciente.Meta``.
+    """
+    term = (term or '').strip()
+    if not term:
+        return []
+    limit = max(1, min(limit, TYPEAHEAD_MAX_LIMIT))
+
+    pacientes = Paciente.objects.only('cc', 'nome', 'numero_seguranca_social')
+
+    if term.isdigit():
+        pacientes = pacientes.annotate(
+            cc_text=Cast('cc', TextField()),
+            nss_text=Cast('numero_seguranca_social', TextField()),
+        ).filter(
+            Q(cc_text__startswith=term) | Q(nss_text__startswith=term)
+        ).order_by('nome', 'cc')
+    else:
+        term = term.upper()
+        pacientes = pacientes.annotate(
+            nome_upper=Upper('nome'),
+            similarity=TrigramSimilarity(Upper('nome'), term),
+        ).filter(
+            Q(nome_upper__startswith=term) | Q(nome_upper__trigram_similar=term)
+        ).annotate(
+            # Prefix hits always outrank fuzzy ones
+            prefix_rank=Case(
+                When(nome_upper__startswith=term, then=Value(0)),
+                default=Value(1),
+                output_field=IntegerField(),
+            ),
+        ).order_by('prefix_rank', '-similarity', 'nome', 'cc')
+
+    return list(pacientes[:limit])
+
+
+def catalog_typeahead(model, term, code_field, limit=TYPEAHEAD_DEFAULT_LIMIT):
+    """Return the top ``limit`` Medicamento, Exame or Medico rows matching ``term``.
+
+    ``nome`` is matched by prefix or trigram similarity and ``code_field``
+    by prefix, all through the GIN trigram indexes on their upper-cased
+    values.
+    """
+    term = (term or '').strip().upper()
+    if not term:
+        return []
+    limit = max(1, min(limit, TYPEAHEAD_MAX_LIMIT))
+
+    entries = model._default_manager.only(code_field, 'nome').annotate(
+        nome_upper=Upper('nome'),
+        code_upper=Upper(code_field),
+        similarity=TrigramSimilarity(Upper('nome'), term),
+    ).filter(
+        Q(nome_upper__startswith=term)
+        | Q(code_upper__startswith=term)
+        | Q(nome_upper__trigram_similar=term)
+    ).annotate(
+        prefix_rank=Case(
+            When(Q(nome_upper__startswith=term) | Q(code_upper__startswith=term), then=Value(0)),
+            default=Value(1),
+            output_field=IntegerField(),
+        ),
+    ).order_by('prefix_rank', '-similarity', 'nome', code_field)
+
+    return list(entries[:limit])
+
+
+# -------------------------------
+# Administration Search
+# -------------------------------
+
+
+def search_queryset(queryset, term, vector, trigram_fields=(), prefix_fields=()):
+    """Filter ``queryset`` to rows matching ``term`` and annotate ``rank``.
+
+    A row matches when its full-text ``vector`` matches the query, when one
+    of ``trigram_fields`` contains the term (or, for the first of them, is
+    similar to it), or, for numeric terms, when one of ``prefix_fields``
+    starts with it. ``vector`` must be the expression indexed on the model
+    and every other branch has a matching GIN trigram or ``text_pattern_ops``
+    index, so the planner can combine index scans instead of reading the
+    table.
+    """
+    query = SearchQuery(term, config='simple', search_type='websearch')
+    upper = term.upper()
+
+    aliases = {'document': vector}
+    matches = Q(document=query)
+    rank = SearchRank(F('document'), query)
+
+    for name in trigram_fields:
+        aliases[f'{name}_upper'] = Upper(name)
+        matches |= Q(**{f'{name}_upper__contains': upper})
+    if trigram_fields:
+        first = trigram_fields[0]
+        matches |= Q(**{f'{first}_upper__trigram_similar': upper})
+        rank = rank + TrigramSimilarity(Upper(first), upper)
+
+    if term.isdigit():
+        for name in prefix_fields:
+            aliases[f'{name}_text'] = Cast(name, TextField())
+            matches |= Q(**{f'{name}_text__startswith': term})
+
+    # Double precision so the rank survives a round trip through a cursor
+    return queryset.alias(**aliases).filter(matches).annotate(rank=Cast(rank, FloatField()))
+
+
+class SearchMixin:
+    """Ranked ``?search=`` support for the administration ``ListView``s.
+
+    Meant to sit in front of ``KeysetPaginationMixin``: while a search is
+    active, results are paginated by rank instead of ``keyset_ordering``.
+    """
+    search_kwarg = 'search'
+    search_vector = None
+    search_trigram_fields = ()
+    search_prefix_fields = ()
+
+    def get_search_term(self):
+        return self.request.GET.get(self.search_kwarg, '').strip()
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        term = self.get_search_term()
+        if term:
+            queryset = search_queryset(
+                queryset, term, self.search_vector,
+                self.search_trigram_fields, self.search_prefix_fields,
+            )
+        return queryset
+
+    def get_keyset_ordering(self):
+        if self.get_search_term():
+            return ('-rank', f'-{self.model._meta.pk.name}')
+        return super().get_keyset_ordering()
@@ -0,0 +1,212 @@
+from django.apps import apps
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+from django.utils import timezone
+
+from .models import (
+    Consulta, Paciente, Medicacao, ItemMedicacao, Exames, ItemExames, Medicamento, Exame
+)
+from . import api, blobs, catalog, counters, fragments, previews, scheduling, stats
+
+# -------------------------------
+# Denormalized Data Maintenance
+# -------------------------------
+# Keeps the daily statistics rollup (workshop.stats) and the per-patient
+# counters (workshop.counters) in step with the records they summarize, and
+# retires cached dashboard fragments (workshop.fragments) as records change.
+# The handlers run inside the caller's transaction, so the summaries
+# commit or roll back together with the record itself.
+
+METRICS = {Medicacao: 'medicacoes', Exames: 'exames'}
+
+
+def _previous(sender, instance, *fields):
+    """The stored values of ``fields`` before this save, or None if new."""
+    if instance._state.adding or instance.pk is None:
+        return None
+    return sender.objects.filter(pk=instance.pk).values(*fields).first()
+
+
+@receiver(pre_save, sender=Consulta)
+def consulta_pre_save(sender, instance, **kwargs):
+    instance._previous = _previous(sender, instance, 'paciente_id', 'data_hora')
+
+
+@receiver(post_save, sender=Consulta)
+def consulta_saved(sender, instance, created, **kwargs):
+    previous = getattr(instance, '_previous', None)
+    if previous is None:
+        if created:
+            stats.record('consultas', stats.consulta_day(instance))
+            counters.record_added('Consulta', instance.paciente_id, instance.data_hora)
+        return
+
+    old_day = timezone.localdate(previous['data_hora'])
+    if old_day != stats.consulta_day(instance):
+        stats.record('consultas', old_day, -1)
+        stats.record('consultas', stats.consulta_day(instance))
+
+    if previous['paciente_id'] != instance.paciente_id:
+        counters.record_removed('Consulta', previous['paciente_id'])
+        counters.record_added('Consulta', instance.paciente_id, instance.data_hora)
+    elif previous['data_hora'] != instance.data_hora:
+        counters.refresh_ultima_consulta(instance.paciente_id)
+
+    if previous['data_hora'] != instance.data_hora:
+        # The doctors' bookings move with the consultation
+        scheduling.move_bookings(instance)
+
+
+@receiver(post_delete, sender=Consulta)
+def consulta_deleted(sender, instance, **kwargs):
+    stats.record('consultas', stats.consulta_day(instance), -1)
+    counters.record_removed('Consulta', instance.paciente_id)
+
+
+@receiver(post_save, sender=Paciente)
+def paciente_saved(sender, instance, created, **kwargs):
+    if created:
+        stats.record('pacientes', instance.data_registo)
+
+
+@receiver(post_delete, sender=Paciente)
+def paciente_deleted(sender, instance, **kwargs):
+    stats.record('pacientes', instance.data_registo, -1)
+
+
+@receiver(pre_save, sender=Medicacao)
+@receiver(pre_save, sender=Exames)
+def receita_pre_save(sender, instance, **kwargs):
+    instance._previous = _previous(sender, instance, 'paciente_id', 'date')
+
+
+@receiver(post_save, sender=Medicacao)
+@receiver(post_save, sender=Exames)
+def receita_saved(sender, instance, created, **kwargs):
+    metric = METRICS[sender]
+    previous = getattr(instance, '_previous', None)
+    if previous is None:
+        if created:
+            stats.record(metric, instance.date)
+            counters.record_added(sender.__name__, instance.paciente_id)
+        return
+
+    if previous['date'] != instance.date:
+        stats.record(metric, previous['date'], -1)
+        stats.record(metric, instance.date)
+
+    if previous['paciente_id'] != instance.paciente_id:
+        counters.record_removed(sender.__name__, previous['paciente_id'])
+        counters.record_added(sender.__name__, instance.paciente_id)
+
+
+@receiver(post_delete, sender=Medicacao)
+@receiver(post_delete, sender=Exames)
+def receita_deleted(sender, instance, **kwargs):
+    stats.record(METRICS[sender], instance.date, -1)
+    counters.record_removed(sender.__name__, instance.paciente_id)
+
+
+# -------------------------------
+# Exam Images: reference counts and previews
+# -------------------------------
+
+@receiver(pre_save, sender=ItemExames)
+def item_exames_pre_save(sender, instance, update_fields=None, **kwargs):
+    if update_fields is None or 'imagem' in update_fields:
+        instance._previous = _previous(sender, instance, 'imagem')
+
+    # A newly assigned upload is not committed to storage until this save
+    new_upload = bool(instance.imagem) and not instance.imagem._committed
+    if new_upload or not instance.imagem:
+        instance.imagem_sha256 = ''
+    # Also covers images attached from a chunked upload, which arrive
+    # already in storage with their digest cleared by workshop.uploads
+    instance._schedule_previews = bool(instance.imagem) and not instance.imagem_sha256
+
+
+@receiver(post_save, sender=ItemExames)
+def item_exames_saved(sender, instance, created, **kwargs):
+    previous = getattr(instance, '_previous', None)
+    name = instance.imagem.name or ''
+    if created:
+        blobs.record_added(name)
+    elif previous is not None and (previous['imagem'] or '') != name:
+        blobs.record_removed(previous['imagem'])
+        blobs.record_added(name)
+
+    if getattr(instance, '_schedule_previews', False):
+        previews.schedule(instance.pk)
+
+
+@receiver(post_delete, sender=ItemExames)
+def item_exames_deleted(sender, instance, **kwargs):
+    blobs.record_removed(instance.imagem.name)
+
+
+# -------------------------------
+# Patient Fragment Cache
+# -------------------------------
+
+def _parent_paciente_id(instance, field_name):
+    field = instance._meta.get_field(field_name)
+    if field.is_cached(instance):
+        return getattr(instance, field_name).paciente_id
+    return field.related_model.objects.filter(
+        pk=getattr(instance, field.attname)
+    ).values_list('paciente_id', flat=True).first()
+
+
+@receiver(post_save, sender=Paciente)
+@receiver(post_delete, sender=Paciente)
+def paciente_changed(sender, instance, **kwargs):
+    fragments.invalidate(instance.cc)
+
+
+@receiver(post_save, sender=Consulta)
+@receiver(post_save, sender=Medicacao)
+@receiver(post_save, sender=Exames)
+@receiver(post_delete, sender=Consulta)
+@receiver(post_delete, sender=Medicacao)
+@receiver(post_delete, sender=Exames)
+def record_changed(sender, instance, **kwargs):
+    previous = getattr(instance, '_previous', None) or {}
+    fragments.invalidate(instance.paciente_id, previous.get('paciente_id'))
+
+
+@receiver(post_save, sender=ItemMedicacao)
+@receiver(post_delete, sender=ItemMedicacao)
+def item_medicacao_changed(sender, instance, **kwargs):
+    fragments.invalidate(_parent_paciente_id(instance, 'medicacao'))
+
+
+@receiver(post_save, sender=ItemExames)
+@receiver(post_delete, sender=ItemExames)
+def item_exames_changed(sender, instance, **kwargs):
+    fragments.invalidate(_parent_paciente_id(instance, 'exames'))
+
+
+# -------------------------------
+# Reference Catalogs
+# -------------------------------
+
+@receiver(post_save, sender=Medicamento)
+@receiver(post_save, sender=Exame)
+@receiver(post_delete, sender=Medicamento)
+@receiver(post_delete, sender=Exame)
+def catalog_changed(sender, instance, **kwargs):
+    catalog.CATALOGS[sender.__name__].invalidate()
+
+
+# -------------------------------
+# JSON API ETags
+# -------------------------------
+
+def api_model_changed(sender, **kwargs):
+    api.invalidate(sender.__name__)
+
+
+for model_name in api.TRACKED_MODELS:
+    model = apps.get_model('workshop', model_name)
+    post_save.connect(api_model_changed, sender=model, dispatch_uid=f'api-{model_name}-saved')
+    post_delete.connect(api_model_changed, sender=model, dispatch_uid=f'api-{model_name}-deleted')
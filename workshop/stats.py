@@ -0,0 +1,146 @@
+from django.apps import apps as global_apps
+from django.db import IntegrityError, connection, transaction
+from django.db.models import Count, F, Q, Subquery, Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+# -------------------------------
+# Daily Statistics Rollup
+# -------------------------------
+# EstatisticaDiaria keeps one row per day with the number of consultations,
+# new patients and prescriptions dated that day. Rows are adjusted by the
+# signal handlers in workshop.signals as records are written, and can be
+# rebuilt from scratch with ``manage.py rebuild_statistics``.
+#
+# Every adjustment is also added to the single EstatisticaTotal row, so
+# all-time totals are read from one row instead of summing every day. If
+# that row is missing it is recreated from the daily rows.
+
+METRICS = ('consultas', 'pacientes', 'medicacoes', 'exames')
+TOTALS_PK = 1
+
+
+def consulta_day(consulta):
+    return timezone.localdate(consulta.data_hora)
+
+
+def record(metric, day, delta=1):
+    """Add ``delta`` to ``metric`` of the rollup row for ``day``."""
+    record_many(metric, {day: delta})
+
+
+def record_many(metric, deltas):
+    """Add each ``{day: delta}`` of ``deltas`` to ``metric``, and their sum
+    to the totals row, in one statement."""
+    from .models import EstatisticaDiaria, EstatisticaTotal
+
+    if not deltas:
+        return
+    qn = connection.ops.quote_name
+    table = qn(EstatisticaDiaria._meta.db_table)
+    column = qn(metric)
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"""
+            WITH days AS (
+                INSERT INTO {table} ({qn('data')}, {', '.join(qn(name) for name in METRICS)})
+                SELECT delta.day, {', '.join('delta.n' if name == metric else '0' for name in METRICS)}
+                FROM unnest(%s::date[], %s::integer[]) AS delta(day, n)
+                ON CONFLICT ({qn('data')}) DO UPDATE
+                SET {column} = {table}.{column} + EXCLUDED.{column}
+            )
+            UPDATE {qn(EstatisticaTotal._meta.db_table)} SET {column} = {column} + %s
+            WHERE {qn(EstatisticaTotal._meta.pk.column)} = %s
+            """,
+            [list(deltas), list(deltas.values()), sum(deltas.values()), TOTALS_PK],
+        )
+        if cursor.rowcount:
+            return
+    try:
+        with transaction.atomic():
+            # Recreated from the daily rows, which now include ``deltas``
+            rebuild_totals()
+    except IntegrityError:
+        # Another writer recreated it first, without ``deltas``
+        EstatisticaTotal.objects.filter(pk=TOTALS_PK).update(**{metric: F(metric) + sum(deltas.values())})
+
+
+def rebuild_statistics(apps=global_apps):
+    """Recompute every rollup row from the source tables.
+
+    Returns the number of days written.
+    """
+    EstatisticaDiaria = apps.get_model('workshop', 'EstatisticaDiaria')
+    Consulta = apps.get_model('workshop', 'Consulta')
+    Paciente = apps.get_model('workshop', 'Paciente')
+    Medicacao = apps.get_model('workshop', 'Medicacao')
+    Exames = apps.get_model('workshop', 'Exames')
+
+    days = {}
+
+    def add(metric, rows):
+        for day, total in rows:
+            days.setdefault(day, {})[metric] = total
+
+    tz = timezone.get_current_timezone()
+    add('consultas', Consulta.objects.annotate(
+        day=TruncDate('data_hora', tzinfo=tz)
+    ).values('day').annotate(total=Count('id')).values_list('day', 'total').order_by())
+    add('pacientes', Paciente.objects.values('data_registo').annotate(
+        total=Count('cc')
+    ).values_list('data_registo', 'total').order_by())
+    add('medicacoes', Medicacao.objects.values('date').annotate(
+        total=Count('pk')
+    ).values_list('date', 'total').order_by())
+    add('exames', Exames.objects.values('date').annotate(
+        total=Count('pk')
+    ).values_list('date', 'total').order_by())
+
+    with transaction.atomic():
+        EstatisticaDiaria.objects.all().delete()
+        EstatisticaDiaria.objects.bulk_create(
+            [EstatisticaDiaria(data=day, **totals) for day, totals in days.items()],
+            batch_size=1000,
+        )
+        try:
+            apps.get_model('workshop', 'EstatisticaTotal')
+        except LookupError:  # migrating, before the totals row existed
+            pass
+        else:
+            rebuild_totals(apps)
+    return len(days)
+
+
+def rebuild_totals(apps=global_apps):
+    """Rewrite the totals row as the sum of the daily rows."""
+    EstatisticaDiaria = apps.get_model('workshop', 'EstatisticaDiaria')
+    EstatisticaTotal = apps.get_model('workshop', 'EstatisticaTotal')
+
+    totals = EstatisticaDiaria.objects.aggregate(**{metric: Sum(metric) for metric in METRICS})
+    EstatisticaTotal.objects.update_or_create(
+        pk=TOTALS_PK, defaults={metric: totals[metric] or 0 for metric in METRICS},
+    )
+
+
+def dashboard_statistics(today=None):
+    """Total patients and today's consultations in a single query.
+
+    Reads the totals row and today's row, however many days are stored.
+    """
+    from .models import EstatisticaDiaria, EstatisticaTotal
+
+    today = today or timezone.localdate()
+    totals = EstatisticaTotal.objects.filter(pk=TOTALS_PK).values(
+        total_patients=F('pacientes'),
+        consultas_today=Subquery(EstatisticaDiaria.objects.filter(data=today).values('consultas')[:1]),
+    ).first()
+    if totals is None:
+        # Not recreated yet since the table was emptied
+        totals = EstatisticaDiaria.objects.aggregate(
+            total_patients=Sum('pacientes'),
+            consultas_today=Sum('consultas', filter=Q(data=today)),
+        )
+    return {
+        'total_patients': totals['total_patients'] or 0,
+        'consultas_today': totals['consultas_today'] or 0,
+    }
@@ -0,0 +1,184 @@
+import fcntl
+import hashlib
+import os
+import re
+import tempfile
+from contextlib import contextmanager
+
+from django.core.files.move import file_move_safe
+from django.core.files.storage import FileSystemStorage, storages
+
+# -------------------------------
+# Content-addressed Exam Image Storage
+# -------------------------------
+# Files are named after the SHA-256 of their content, sharded two levels
+# deep under the field's upload_to directory:
+#
+#     ImagemExames/3f/a2/3fa2...e9.png
+#
+# so saving a scan that is already stored writes nothing and returns the
+# existing name. Several ItemExames rows then share one file; how many is
+# kept in ImagemBlob.refcount (workshop.blobs) and a file is only removed by
+# ``manage.py collect_exam_images`` once nothing references it.
+#
+# Saves hold a shared lock on the storage's lock file while they look up,
+# touch or move a blob into place; garbage collection holds it exclusively
+# while it checks a blob's mtime and unlinks it, so a save that reuses a
+# blob cannot land between the two.
+
+BLOB_NAME = re.compile(r'(?:^|/)[0-9a-f]{2}/[0-9a-f]{2}/(?P<digest>[0-9a-f]{64})(?:\.\w+)?$')
+READ_SIZE = 64 * 1024
+LOCK_NAME = '.blobs.lock'
+
+
+def blob_digest(name):
+    """The content digest a content-addressed ``name`` embeds, or None."""
+    match = BLOB_NAME.search(name or '')
+    return match.group('digest') if match else None
+
+
+class ContentAddressedStorage(FileSystemStorage):
+    """FileSystemStorage naming every file by its content hash.
+
+    Files saved with a ``sha256`` attribute (as chunked uploads are) are not
+    hashed again.
+    """
+
+    def blob_name(self, directory, digest, extension):
+        return os.path.join(directory, digest[:2], digest[2:4], digest + extension)
+
+    def get_available_name(self, name, max_length=None):
+        # Identical content maps to the same name, which is never "taken"
+        return name
+
+    def _save(self, name, content):
+        directory, filename = os.path.split(name)
+        extension = os.path.splitext(filename)[1].lower()
+        digest = getattr(content, 'sha256', None)
+
+        if hasattr(content, 'temporary_file_path'):
+            source = content.temporary_file_path()
+            if not digest:
+                digest = _file_sha256(source)
+        else:
+            source, digest = self._spool(content)
+
+        final = self.blob_name(directory, digest, extension)
+        full_path = self.path(final)
+        with self._locked(fcntl.LOCK_SH):
+            if os.path.exists(full_path):
+                if not hasattr(content, 'temporary_file_path'):
+                    os.remove(source)
+            else:
+                os.makedirs(os.path.dirname(full_path), exist_ok=True)
+                file_move_safe(source, full_path, allow_overwrite=True)
+                if self.file_permissions_mode is not None:
+                    os.chmod(full_path, self.file_permissions_mode)
+            # A deduplicated blob, or one moved in with the source's old mtime
+            # (a claimed upload keeps the time of its last chunk), would
+            # otherwise look old to a garbage collection running before the
+            # saving transaction commits
+            os.utime(full_path)
+        return final.replace('\\', '/')
+
+    @contextmanager
+    def _locked(self, operation):
+        path = self.path(LOCK_NAME)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'a') as lock:
+            fcntl.flock(lock, operation)
+            yield
+
+    def delete_unless_newer(self, name, cutoff):
+        """Delete blob ``name`` unless it was stored after ``cutoff``.
+
+        Returns the size of the deleted file, or None if it was kept.
+        """
+        path = self.path(name)
+        with self._locked(fcntl.LOCK_EX):
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                return None
+            if stat.st_mtime > cutoff:
+                return None
+            os.remove(path)
+        return stat.st_size
+
+    def _spool(self, content):
+        """Copy ``content`` next to the blobs while hashing it."""
+        incoming = self.path('.incoming')
+        os.makedirs(incoming, exist_ok=True)
+        digest = hashlib.sha256()
+        fd, path = tempfile.mkstemp(dir=incoming)
+        try:
+            with os.fdopen(fd, 'wb') as spool:
+                for chunk in content.chunks():
+                    digest.update(chunk)
+                    spool.write(chunk)
+        except BaseException:
+            os.remove(path)
+            raise
+        return path, digest.hexdigest()
+
+    def blobs(self, directory):
+        """``(name, mtime)`` of every content-addressed file under ``directory``."""
+        root = self.path(directory)
+        for dirpath, _, filenames in os.walk(root):
+            for filename in filenames:
+                path = os.path.join(dirpath, filename)
+                name = os.path.relpath(path, self.location).replace(os.sep, '/')
+                if blob_digest(name):
+                    yield name, os.stat(path).st_mtime
+
+
+def _file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as source:
+        while chunk := source.read(READ_SIZE):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+# -------------------------------
+# Derived File Storage
+# -------------------------------
+# Files whose name is derived from their content, such as the previews of
+# workshop.previews, are saved under that exact name: two workers rendering
+# the same derivative both write the canonical file, each replacing it
+# whole with an atomic rename, instead of the second one landing under a
+# random suffix that nothing references.
+
+
+class DerivedFileStorage(FileSystemStorage):
+    """FileSystemStorage that replaces an existing file instead of renaming."""
+
+    def get_available_name(self, name, max_length=None):
+        return name
+
+    def _save(self, name, content):
+        full_path = self.path(name)
+        directory = os.path.dirname(full_path)
+        os.makedirs(directory, exist_ok=True)
+        fd, temporary = tempfile.mkstemp(dir=directory, prefix='.incoming-')
+        try:
+            with os.fdopen(fd, 'wb') as output:
+                for chunk in content.chunks():
+                    output.write(chunk)
+            if self.file_permissions_mode is not None:
+                os.chmod(temporary, self.file_permissions_mode)
+            os.replace(temporary, full_path)
+        except BaseException:
+            os.remove(temporary)
+            raise
+        return name.replace('\\', '/')
+
+
+def exam_image_storage():
+    """Storage of ItemExames.imagem, the ``exam_images`` entry of STORAGES."""
+    return storages['exam_images']
+
+
+def exam_preview_storage():
+    """Storage of the exam image derivatives, the ``exam_previews`` entry of STORAGES."""
+    return storages['exam_previews']
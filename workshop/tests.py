@@ -1,3 +1,1710 @@
-from django.test import TestCase
+import hashlib
+import io
+import json
+import os
+import shutil
+import tempfile
+import time
+from datetime import date, datetime, timedelta
+from functools import partial
+from unittest import mock
 
-# Create your tests here.
+from asgiref.sync import async_to_sync
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.exceptions import ImproperlyConfigured
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import OperationalError, connection, transaction
+from django.test import RequestFactory, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from psycopg_pool import PoolTimeout
+
+from .models import (
+    Medico, Paciente, Consulta, MedicoConsulta, Medicamento, Medicacao, ItemMedicacao,
+    Exame, Exames, ItemExames, EstatisticaDiaria, EstatisticaTotal, ImagemBlob, UploadSession
+)
+from .benchmark import InProcessClient, build_scenarios, compare, uncovered_routes
+from .blobs import GC_GRACE, collect_garbage, repair_refcounts
+from .catalog import MEDICAMENTOS
+from .checks import check_shared_cache
+from .fanout import gather_reads
+from .fragments import cached_patient, patient_version, version_key
+from .dataset import DatasetPlan, ensure_catalog, generate_chunk, generate_doctors
+from . import stats
+from .pagination import FORWARD, encode_cursor, estimate_count
+from .stats import dashboard_statistics
+from .forms import ConsultaForm, ItemMedicacaoForm, ItemMedicacaoFormSet
+from .middleware import ConnectionPoolMiddleware
+from .prescriptions import Prescription, save_prescriptions
+from .previews import derivative_name, generate_previews
+from .querybudget import QueryBudgetTestMixin, QueryRecorder, fingerprint, query_stats
+from .routers import STICKY_COOKIE, ReplicaRouter, replica_reads
+from .scheduling import (
+    SlotUnavailable, book_consulta, book_series, doctors_for, free_slots, recurrence,
+)
+from .storage import blob_digest, exam_image_storage, exam_preview_storage
+from .timeline import patient_timeline
+from .uploads import append_chunk, claim, part_path
+from .views import PacienteListView, UploadSessionView
+
+
+def seed_clinic(pacientes=40, medicos=5, per_patient=3):
+    """Create a small but fully linked dataset for view-level tests."""
+    medicamentos = Medicamento.objects.bulk_create([
+        Medicamento(id_medicamento=f'MED{i}', nome=f'Medicamento {i}') for i in range(5)
+    ])
+    exames = Exame.objects.bulk_create([
+        Exame(id_exame=f'{i}', nome=f'Exame {i}') for i in range(5)
+    ])
+    medicos = Medico.objects.bulk_create([
+        Medico(
+            cc=20000000 + i, nome=f'Medico {i}', data_nascimento=date(1970, 1, 1),
+            morada='Rua', telefone=910000000 + i, email=f'medico{i}@sns.pt',
+            numero_medico=5000 + i, especialidade='General Medicine',
+        )
+        for i in range(medicos)
+    ])
+    now = timezone.now()
+    for i in range(pacientes):
+        paciente = Paciente.objects.create(
+            cc=10000000 + i, nome=f'Paciente {i:03d}', data_nascimento=date(1980, 1, 1),
+            morada='Rua', telefone=920000000 + i, email=f'paciente{i}@sns.pt',
+            numero_seguranca_social=30000000 + i,
+        )
+        for j in range(per_patient):
+            consulta = Consulta.objects.create(
+                paciente=paciente, data_hora=now - timedelta(days=j), motivo='Routine check-up',
+            )
+            MedicoConsulta.objects.create(medico=medicos[j % len(medicos)], consulta=consulta)
+            medicacao = Medicacao.objects.create(paciente=paciente, date=date.today() - timedelta(days=j))
+            ItemMedicacao.objects.create(medicacao=medicacao, medicamento=medicamentos[j % 5])
+            exame = Exames.objects.create(paciente=paciente, date=date.today() - timedelta(days=j))
+            ItemExames.objects.create(exames=exame, exame=exames[j % 5])
+
+
+# -------------------------------
+# Query Plan Regression Tests
+# -------------------------------
+
+# Tables small enough by design that reading them whole is the right plan
+SEQ_SCAN_ALLOWED = {'workshop_estatisticadiaria'}
+
+
+def seq_scanned_relations(plan):
+    """Names of every relation read by a Seq Scan node in an EXPLAIN plan."""
+    relations = set()
+    if plan.get('Node Type') == 'Seq Scan':
+        relations.add(plan['Relation Name'])
+    for child in plan.get('Plans', []):
+        relations |= seq_scanned_relations(child)
+    return relations
+
+
+class QueryPlanTests(TestCase):
+    """EXPLAIN every query a view runs and fail on sequential scans.
+
+    Sequential scans are priced out with ``enable_seqscan = off``, so a
+    plan that still contains one has no usable index: it is a scan that
+    will grow with the table in production.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        seed_clinic()
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+        cls.paciente = Paciente.objects.order_by('cc').first()
+        cls.consulta = Consulta.objects.filter(paciente=cls.paciente).first()
+        cls.medicacao = Medicacao.objects.filter(paciente=cls.paciente).first()
+        cls.exames = Exames.objects.filter(paciente=cls.paciente).first()
+
+    def assertIndexedQueries(self, url, params=None):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(url, params)
+        self.assertEqual(response.status_code, 200)
+
+        with connection.cursor() as cursor:
+            cursor.execute('SET LOCAL enable_seqscan = off')
+            for query in ctx.captured_queries:
+                sql = query['sql']
+                if not sql.startswith('SELECT'):
+                    continue
+                cursor.execute(f'EXPLAIN (FORMAT JSON) {sql}')
+                plan = cursor.fetchone()[0]
+                if isinstance(plan, str):
+                    plan = json.loads(plan)
+                scanned = seq_scanned_relations(plan[0]['Plan']) - SEQ_SCAN_ALLOWED
+                self.assertFalse(scanned, f'Sequential scan on {sorted(scanned)} for:\n{sql}')
+        return response
+
+    def test_patient_dashboard(self):
+        self.assertIndexedQueries(reverse('patient_dashboard'), {'patient_cc': self.paciente.cc})
+
+    def test_doctor_dashboard(self):
+        self.assertIndexedQueries(reverse('doctor_dashboard'))
+        self.assertIndexedQueries(reverse('doctor_dashboard'), {'patient_cc': self.paciente.cc})
+
+    def test_doctor_dashboard_next_page(self):
+        response = self.client.get(reverse('doctor_dashboard'))
+        cursor = response.context['page_obj'].next_cursor
+        self.assertIndexedQueries(reverse('doctor_dashboard'), {'cursor': cursor})
+
+    def test_paciente_typeahead(self):
+        self.assertIndexedQueries(reverse('paciente_typeahead'), {'q': '1000001'})
+        self.assertIndexedQueries(reverse('paciente_typeahead'), {'q': 'Pacien'})
+
+    def test_autocomplete(self):
+        for lookup, term in [('paciente', '1000001'), ('medicamento', 'Medic'), ('exame', 'Exa')]:
+            with self.subTest(lookup=lookup):
+                self.assertIndexedQueries(reverse('autocomplete', args=[lookup]), {'q': term})
+
+    def test_api(self):
+        self.assertIndexedQueries(reverse('api_list', args=['pacientes']), {'fields': 'nome'})
+        self.assertIndexedQueries(
+            reverse('api_list', args=['consultas']),
+            {'paciente': self.paciente.cc, 'include': 'paciente,medicos'},
+        )
+        self.assertIndexedQueries(
+            reverse('api_detail', args=['exames', self.exames.pk]), {'include': 'items'}
+        )
+
+    def test_patient_timeline(self):
+        url = reverse('patient_timeline', args=[self.paciente.cc])
+        response = self.assertIndexedQueries(url, {'limit': 2})
+        self.assertIndexedQueries(url, {'limit': 2, 'cursor': response.context['timeline'].next_cursor})
+        self.assertIndexedQueries(url, {'type': 'exames'})
+
+    def test_detail_views(self):
+        self.assertIndexedQueries(reverse('consulta_detail', args=[self.consulta.pk]))
+        self.assertIndexedQueries(reverse('medicacao_detail', args=[self.medicacao.pk]))
+        self.assertIndexedQueries(reverse('exames_detail', args=[self.exames.pk]))
+
+    def test_list_views(self):
+        for name in ['list_pacientes', 'list_medicos', 'list_medicamento', 'list_exame']:
+            with self.subTest(name=name):
+                self.assertIndexedQueries(reverse(name))
+
+    def test_list_views_search(self):
+        for name, term in [
+            ('list_pacientes', 'Paciente'), ('list_pacientes', '1000'),
+            ('list_medicos', 'General'), ('list_medicamento', 'Medicamento'),
+        ]:
+            with self.subTest(name=name, term=term):
+                self.assertIndexedQueries(reverse(name), {'search': term})
+
+
+# -------------------------------
+# Keyset Pagination
+# -------------------------------
+
+class KeysetPaginationTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        # Three names shared by every patient, so pages split inside ties
+        Paciente.objects.bulk_create([
+            Paciente(
+                cc=10000000 + i, nome=f'Paciente {i % 3}', data_nascimento=date(1980, 1, 1),
+                morada='Rua', telefone=920000000 + i, email=f'paciente{i}@sns.pt',
+                numero_seguranca_social=30000000 + i,
+            )
+            for i in range(60)
+        ])
+        cls.expected = list(Paciente.objects.order_by('nome', 'cc').values_list('cc', flat=True))
+
+    def page(self, url, cursor=None):
+        response = self.client.get(url, {'cursor': cursor} if cursor else {})
+        self.assertEqual(response.status_code, 200)
+        return response.context['page_obj']
+
+    def assertWalksEveryRow(self, url):
+        pages = [self.page(url)]
+        while pages[-1].has_next():
+            pages.append(self.page(url, pages[-1].next_cursor))
+        self.assertGreater(len(pages), 2)
+        self.assertEqual([p.cc for page in pages for p in page], self.expected)
+
+        backward = [pages[-1]]
+        while backward[-1].has_previous():
+            backward.append(self.page(url, backward[-1].previous_cursor))
+        self.assertEqual([p.cc for page in reversed(backward) for p in page], self.expected)
+
+        # "Last" shows a full page ending at the last row
+        last = self.page(url, pages[0].last_cursor)
+        self.assertEqual([p.cc for p in last], self.expected[-len(pages[0]):])
+
+    def test_list_walks_every_row(self):
+        self.assertWalksEveryRow(reverse('list_pacientes'))
+
+    def test_dashboard_walks_every_row(self):
+        self.assertWalksEveryRow(reverse('doctor_dashboard'))
+
+    def test_invalid_cursor_shows_first_page(self):
+        url = reverse('list_pacientes')
+        first = [p.cc for p in self.page(url)]
+        for cursor in ['garbage', encode_cursor(FORWARD, 5), encode_cursor(FORWARD, ['Paciente 0']),
+                       encode_cursor(FORWARD, ['Paciente 0', 'not a cc']), encode_cursor('x', None)]:
+            with self.subTest(cursor=cursor):
+                self.assertEqual([p.cc for p in self.page(url, cursor)], first)
+                self.assertEqual(
+                    [p.cc for p in self.page(reverse('doctor_dashboard'), cursor)], first[:24])
+
+
+# -------------------------------
+# Dataset Generator
+# -------------------------------
+
+class DatasetGeneratorTests(TestCase):
+
+    def test_generate_chunks(self):
+        plan = DatasetPlan(
+            seed='test', patients=6, doctors=2, consultas_per_patient=2, medicacoes_per_patient=1,
+            exames_per_patient=1, chunk_size=4, until=date(2026, 1, 1), years=1,
+        )
+        plan.allocate()
+        medicamentos, exames = ensure_catalog()
+        doctors = generate_doctors(plan)
+        for chunk in plan.chunks:
+            generate_chunk(plan, chunk, doctors, medicamentos, exames)
+
+        self.assertEqual(Paciente.objects.count(), 6)
+        self.assertEqual(Consulta.objects.count(), 12)
+        self.assertEqual(Exames.objects.count(), 6)
+        self.assertTrue(ItemExames.objects.exists())
+        self.assertFalse(ItemExames.objects.exclude(imagem_sha256='').exists())
+        self.assertEqual(sum(Paciente.objects.values_list('num_consultas', flat=True)), 12)
+
+
+# -------------------------------
+# Daily Statistics
+# -------------------------------
+
+class StatisticsTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        seed_clinic(pacientes=3, per_patient=2)
+
+    def test_dashboard_reads_totals_row(self):
+        EstatisticaDiaria.objects.create(data=date(2000, 1, 1), pacientes=7)
+        stats.rebuild_totals()
+        with self.assertNumQueries(1):
+            totals = dashboard_statistics()
+        self.assertEqual(totals, {'total_patients': 10, 'consultas_today': 3})
+
+        stats.record('pacientes', date(2001, 1, 1))
+        stats.record_many('consultas', {date.today(): 2, date(2001, 1, 1): 1})
+        self.assertEqual(dashboard_statistics(), {'total_patients': 11, 'consultas_today': 5})
+        self.assertEqual(EstatisticaTotal.objects.get().consultas, 3 * 2 + 3)
+
+    def test_missing_totals_row_recreated(self):
+        EstatisticaTotal.objects.all().delete()
+        self.assertEqual(dashboard_statistics()['total_patients'], 3)
+        stats.record('pacientes', date.today())
+        self.assertEqual(EstatisticaTotal.objects.get().pacientes, 4)
+        self.assertEqual(dashboard_statistics()['total_patients'], 4)
+
+        # Recounted from the patients themselves
+        stats.rebuild_statistics()
+        self.assertEqual(EstatisticaTotal.objects.get().pacientes, 3)
+
+
+# -------------------------------
+# Per-patient Activity Counters
+# -------------------------------
+
+class PatientCounterTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        seed_clinic(pacientes=1, per_patient=2)
+        cls.paciente = Paciente.objects.get()
+
+    def setUp(self):
+        cache.clear()
+
+    def counters(self):
+        return Paciente.objects.filter(pk=self.paciente.pk).values(
+            'num_consultas', 'num_medicacoes', 'num_exames', 'ultima_consulta').get()
+
+    def test_counters_follow_writes(self):
+        before = self.counters()
+        latest = Consulta.objects.create(
+            paciente=self.paciente, data_hora=before['ultima_consulta'] + timedelta(days=1))
+        Medicacao.objects.create(paciente=self.paciente, date=date.today())
+        Exames.objects.filter(paciente=self.paciente).first().delete()
+        self.assertEqual(self.counters(), {
+            'num_consultas': 3, 'num_medicacoes': 3, 'num_exames': 1,
+            'ultima_consulta': latest.data_hora,
+        })
+
+        latest.delete()
+        self.assertEqual(self.counters()['ultima_consulta'], before['ultima_consulta'])
+        self.assertEqual(self.counters()['num_consultas'], 2)
+
+    def test_delete_with_drifted_counter(self):
+        Paciente.objects.filter(pk=self.paciente.pk).update(num_exames=0)
+        Exames.objects.filter(paciente=self.paciente).first().delete()
+        self.assertEqual(self.counters()['num_exames'], 0)
+
+    def test_repair_command(self):
+        expected = self.counters()
+        Paciente.objects.filter(pk=self.paciente.pk).update(
+            num_consultas=9, num_medicacoes=0, ultima_consulta=None)
+        self.assertEqual(cached_patient(self.paciente.cc)[0].num_consultas, 9)
+
+        out = io.StringIO()
+        with self.captureOnCommitCallbacks(execute=True):
+            call_command('repair_patient_counters', stdout=out)
+        self.assertIn('1 patient(s)', out.getvalue())
+        self.assertEqual(self.counters(), expected)
+        # The drifted row cached for the dashboards is retired
+        self.assertEqual(cached_patient(self.paciente.cc)[0].num_consultas, 2)
+
+
+# -------------------------------
+# Total Counts
+# -------------------------------
+
+class TotalCountTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        seed_clinic(pacientes=3, per_patient=1)
+
+    def test_list_views_report_total_count(self):
+        for name, model in [
+            ('list_pacientes', Paciente), ('list_medicos', Medico),
+            ('list_medicamento', Medicamento), ('list_exame', Exame),
+        ]:
+            with self.subTest(name=name):
+                response = self.client.get(reverse(name))
+                self.assertEqual(response.status_code, 200)
+                self.assertIs(response.context['total_count_is_estimate'], False)
+                self.assertEqual(response.context['total_count'], model.objects.count())
+
+    def test_estimate_from_either_plan_shape(self):
+        plan = {'Plan': {'Node Type': 'Seq Scan', 'Plan Rows': 25000}}
+        for explained in [json.dumps([plan]), json.dumps(plan)]:
+            with self.subTest(explained=explained[:1]):
+                with mock.patch('django.db.models.QuerySet.explain', return_value=explained):
+                    self.assertEqual(estimate_count(Paciente.objects.all()), (25000, True))
+        self.assertEqual(estimate_count(Paciente.objects.all()), (3, False))
+
+
+    def test_estimate_used_above_threshold(self):
+        with mock.patch.object(PacienteListView, 'exact_count_threshold', 1), \
+                CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('list_pacientes'))
+        self.assertIs(response.context['total_count_is_estimate'], True)
+        self.assertFalse([q for q in queries if 'COUNT(' in q['sql']])
+
+
+# -------------------------------
+# Ranked Search
+# -------------------------------
+
+def person(model, cc, nome, email, **fields):
+    return model(
+        cc=cc, nome=nome, data_nascimento=date(1980, 1, 1), morada='Rua', telefone=cc,
+        email=email, **fields,
+    )
+
+
+class RankedSearchTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        Paciente.objects.bulk_create([
+            person(Paciente, 11110001, 'Mariana Costa', 'mcosta@sns.pt', numero_seguranca_social=1),
+            person(Paciente, 11110002, 'Ana Silva', 'asilva@sns.pt', numero_seguranca_social=2),
+            person(Paciente, 22220003, 'Rui Sousa', 'rsousa@sns.pt', numero_seguranca_social=3),
+        ])
+        Medico.objects.bulk_create([
+            person(Medico, 33330001, 'Joana Reis', 'jreis@sns.pt',
+                   numero_medico=1, especialidade='Cardiology'),
+            person(Medico, 33330002, 'Pedro Lima', 'plima@sns.pt',
+                   numero_medico=2, especialidade='Dermatology'),
+        ])
+
+    def search(self, name, term):
+        response = self.client.get(reverse(name), {'search': term})
+        self.assertEqual(response.status_code, 200)
+        return [row.nome for row in response.context['page_obj']]
+
+    def test_search_pacientes(self):
+        # A whole-word match outranks a match inside a word
+        self.assertEqual(self.search('list_pacientes', 'Ana'), ['Ana Silva', 'Mariana Costa'])
+        self.assertEqual(self.search('list_pacientes', 'sousa'), ['Rui Sousa'])
+        self.assertEqual(self.search('list_pacientes', 'mcosta'), ['Mariana Costa'])
+        self.assertEqual(self.search('list_pacientes', '1111'), ['Ana Silva', 'Mariana Costa'])
+        self.assertEqual(self.search('list_pacientes', 'Nobody'), [])
+
+    def test_search_medicos(self):
+        self.assertEqual(self.search('list_medicos', 'cardio'), ['Joana Reis'])
+        self.assertEqual(self.search('list_medicos', 'plima'), ['Pedro Lima'])
+        self.assertEqual(self.search('list_medicos', '33330001'), ['Joana Reis'])
+
+
+# -------------------------------
+# Patient Timeline
+# -------------------------------
+
+class PatientTimelineTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        seed_clinic(pacientes=2, per_patient=4)
+        cls.paciente = Paciente.objects.order_by('cc').first()
+
+    def walk(self, **kwargs):
+        entries, cursor = [], None
+        while True:
+            page = patient_timeline(self.paciente, limit=3, cursor=cursor, **kwargs)
+            entries += [(entry.kind, entry.object.pk, entry.at) for entry in page]
+            cursor = page.next_cursor
+            if cursor is None:
+                return entries
+
+    def test_pages_cover_history_once_in_order(self):
+        entries = self.walk()
+        self.assertEqual(len(entries), 12)
+        self.assertEqual(len(set(entries)), 12)
+        keys = [(at, kind, pk) for kind, pk, at in entries]
+        self.assertEqual(keys, sorted(keys, reverse=True))
+
+    def test_type_filter(self):
+        entries = self.walk(kinds=['medicacao', 'exames'])
+        self.assertEqual(len(entries), 8)
+        self.assertEqual({kind for kind, _, _ in entries}, {'medicacao', 'exames'})
+
+    def test_json_endpoint(self):
+        url = reverse('patient_timeline_json', args=[self.paciente.cc])
+        data = self.client.get(url, {'type': 'consulta', 'limit': 3}).json()
+        self.assertEqual([result['type'] for result in data['results']], ['consulta'] * 3)
+        data = self.client.get(url, {'type': 'consulta', 'cursor': data['next_cursor']}).json()
+        self.assertEqual(len(data['results']), 1)
+        self.assertIsNone(data['next_cursor'])
+
+
+# -------------------------------
+# Benchmark Scenarios
+# -------------------------------
+
+# Routes broken independently of the benchmark (missing templates); the
+# benchmark reports them as errors.
+BROKEN_SCENARIOS = {'patient_exames', 'update_medicacao', 'update_medicamento'}
+
+
+class BenchmarkScenarioTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        seed_clinic(pacientes=3, per_patient=1)
+
+    def test_every_route_has_a_scenario(self):
+        self.assertEqual(uncovered_routes(build_scenarios()), [])
+
+    def test_scenarios_get_expected_status(self):
+        client = InProcessClient()
+        for scenario in build_scenarios():
+            if scenario.name in BROKEN_SCENARIOS:
+                continue
+            with self.subTest(scenario.name):
+                data = scenario.data(0) if scenario.data else None
+                self.assertEqual(client.request(scenario.method, scenario.path, data), scenario.expect)
+
+    def test_compare_flags_regressions(self):
+        baseline = {'home': {'p95': 10.0, 'throughput': 100.0, 'errors': 0}}
+        self.assertEqual(compare({'home': {'p95': 11.0, 'throughput': 95.0, 'errors': 0}}, baseline), [])
+        regressions = compare({'home': {'p95': 15.0, 'throughput': 50.0, 'errors': 1}}, baseline)
+        self.assertEqual(len(regressions), 3)
+
+
+# -------------------------------
+# Query Budgets
+# -------------------------------
+
+class QueryBudgetTests(QueryBudgetTestMixin, TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        seed_clinic(pacientes=30, per_patient=5)
+
+    def test_views_within_budget(self):
+        for scenario in build_scenarios():
+            if scenario.name in BROKEN_SCENARIOS:
+                continue
+            with self.subTest(scenario.name):
+                data = scenario.data(0) if scenario.data else None
+                self.assertWithinQueryBudget(scenario.path, data, scenario.method.lower())
+
+    def test_middleware_records_per_view(self):
+        query_stats.reset()
+        consulta = Consulta.objects.first()
+        with self.settings(DEBUG=True):
+            self.client.get(reverse('consulta_detail', args=[consulta.pk]))
+            report = self.client.get(reverse('query_report')).json()['views']
+        self.assertEqual(report['consulta_detail']['requests'], 1)
+        self.assertEqual(report['consulta_detail']['queries']['max'], 1)
+        self.assertEqual(report['consulta_detail']['budget'], 1)
+
+    def test_report_hidden_without_debug(self):
+        self.assertEqual(self.client.get(reverse('query_report')).status_code, 404)
+
+    def test_fingerprint_collapses_in_lists(self):
+        self.assertEqual(
+            fingerprint('SELECT 1 WHERE id IN (%s, %s, %s)'),
+            fingerprint('SELECT 1 WHERE id IN (%s, %s)'),
+        )
+
+
+# -------------------------------
+# Exam Image Previews
+# -------------------------------
+
+def png_upload(name='scan.png', size=(2000, 1500)):
+    from io import BytesIO
+    from PIL import Image
+
+    output = BytesIO()
+    Image.new('RGB', size, 'white').save(output, 'PNG')
+    return SimpleUploadedFile(name, output.getvalue(), content_type='image/png')
+
+
+class ExamPreviewTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        seed_clinic(pacientes=1, per_patient=1)
+        cls.item = ItemExames.objects.get()
+
+    def setUp(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        settings = self.settings(MEDIA_ROOT=media_root, EXAM_PREVIEWS_ASYNC=False)
+        settings.enable()
+        self.addCleanup(settings.disable)
+
+    def test_upload_generates_derivatives_after_commit(self):
+        from PIL import Image
+
+        self.item.imagem = png_upload()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.item.save()
+
+        self.item.refresh_from_db()
+        self.assertEqual(len(self.item.imagem_sha256), 64)
+        name = derivative_name(self.item.imagem_sha256, 'thumb')
+        with default_storage.open(name) as thumb, Image.open(thumb) as image:
+            self.assertLessEqual(max(image.size), 240)
+
+    def test_detail_page_serves_lazy_thumbnails(self):
+        self.item.imagem = png_upload()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.item.save()
+        self.item.refresh_from_db()
+
+        response = self.client.get(reverse('exames_detail', args=[self.item.exames_id]))
+        self.assertContains(response, f'src="{self.item.thumbnail_url}"')
+        self.assertContains(response, 'loading="lazy"')
+        self.assertNotContains(response, f'src="{self.item.imagem.url}"')
+
+    def test_identical_uploads_share_derivatives(self):
+        other = ItemExames.objects.create(exames=self.item.exames, exame=self.item.exame)
+        for item in (self.item, other):
+            item.imagem = png_upload()
+            with self.captureOnCommitCallbacks(execute=True):
+                item.save()
+            item.refresh_from_db()
+        self.assertEqual(self.item.imagem.name, other.imagem.name)
+        self.assertEqual(self.item.imagem_sha256, other.imagem_sha256)
+
+    def test_concurrent_generation_keeps_canonical_names(self):
+        self.item.imagem = png_upload()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.item.save()
+        self.item.refresh_from_db()
+        thumb = derivative_name(self.item.imagem_sha256, 'thumb')
+        directory = os.path.dirname(default_storage.path(thumb))
+        before = sorted(os.listdir(directory))
+
+        storage = exam_preview_storage()
+        exists, checked = storage.exists, set()
+
+        def exists_after_check(name):
+            # Missing when generate_previews looks, written by another worker since
+            if name in checked:
+                return exists(name)
+            checked.add(name)
+            return False
+
+        with mock.patch.object(storage, 'exists', side_effect=exists_after_check):
+            generate_previews(self.item)
+        self.assertEqual(sorted(os.listdir(directory)), before)
+
+
+# -------------------------------
+# Chunked Uploads
+# -------------------------------
+
+class ChunkedUploadTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        seed_clinic(pacientes=1, per_patient=1)
+
+    def setUp(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        settings = self.settings(
+            MEDIA_ROOT=media_root, CHUNKED_UPLOAD_DIR=os.path.join(media_root, 'partial'),
+            EXAM_PREVIEWS_ASYNC=False,
+        )
+        settings.enable()
+        self.addCleanup(settings.disable)
+        self.content = png_upload().read()
+
+    def start(self, **data):
+        data = {'filename': 'scan.png', 'size': len(self.content), **data}
+        response = self.client.post(reverse('upload_create'), data)
+        self.assertEqual(response.status_code, 201)
+        return response.json()
+
+    def send(self, session, offset, chunk):
+        return self.client.patch(
+            session['url'], chunk, content_type='application/offset+octet-stream',
+            headers={'Upload-Offset': str(offset)},
+        )
+
+    def upload(self):
+        session = self.start(sha256=hashlib.sha256(self.content).hexdigest())
+        response = self.send(session, 0, self.content)
+        self.assertEqual(response.json()['status'], UploadSession.COMPLETE)
+        return session
+
+    def test_resumes_from_server_offset(self):
+        session = self.start()
+        half = len(self.content) // 2
+        self.assertEqual(self.send(session, 0, self.content[:half]).json()['offset'], half)
+
+        # A retried first chunk is refused with the offset to resume from
+        response = self.send(session, 0, self.content[:half])
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response['Upload-Offset'], str(half))
+        self.assertEqual(self.client.get(session['url']).json()['offset'], half)
+
+        response = self.send(session, half, self.content[half:])
+        self.assertEqual(response.json()['status'], UploadSession.COMPLETE)
+        self.assertEqual(response.json()['sha256'], hashlib.sha256(self.content).hexdigest())
+
+    def test_checksum_mismatch_fails_upload(self):
+        session = self.start(sha256='0' * 64)
+        response = self.send(session, 0, self.content)
+        self.assertEqual(response.status_code, 422)
+        self.assertEqual(UploadSession.objects.get(pk=session['id']).status, UploadSession.FAILED)
+
+    def test_chunks_within_query_budget(self):
+        session = self.start()
+        with CaptureQueriesContext(connection) as queries:
+            self.send(session, 0, self.content)
+        self.assertLessEqual(len(queries), UploadSessionView.query_budget)
+
+    def test_no_lock_while_reading_or_hashing(self):
+        session = self.start()
+        content = self.content
+
+        with CaptureQueriesContext(connection) as queries:
+            def statements(fragment):
+                return sum(fragment in q['sql'] for q in queries.captured_queries)
+
+            class Body(io.BytesIO):
+                def read(self, size=-1):
+                    # The row is not locked before the body is spooled
+                    assert not statements('FOR UPDATE')
+                    return super().read(size)
+
+            def hash_file(path):
+                # Hashed once the new size is recorded
+                assert statements('UPDATE "workshop_uploadsession"') == 1
+                return hashlib.sha256(content).hexdigest()
+
+            with mock.patch('workshop.uploads.file_sha256', side_effect=hash_file):
+                finished = append_chunk(session['id'], 0, Body(content), len(content))
+        self.assertEqual(finished.status, UploadSession.COMPLETE)
+        self.assertEqual(statements('FOR UPDATE'), 1)
+        self.assertEqual(os.listdir(os.path.dirname(part_path(finished))), [f'{finished.pk}.part'])
+
+    def test_formset_attaches_finished_upload(self):
+        session = self.upload()
+        item = ItemExames.objects.first()
+        data = {
+            'paciente': item.exames.paciente_id, 'date': date.today().isoformat(),
+            'itemexames_set-TOTAL_FORMS': 1, 'itemexames_set-INITIAL_FORMS': 0,
+            'itemexames_set-MIN_NUM_FORMS': 1, 'itemexames_set-MAX_NUM_FORMS': 1000,
+            'itemexames_set-0-exame': item.exame_id, 'itemexames_set-0-resultados': '',
+            'itemexames_set-0-upload': session['id'],
+        }
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(reverse('create_exames'), data)
+        self.assertEqual(response.status_code, 302)
+
+        attached = ItemExames.objects.exclude(imagem='').get()
+        with attached.imagem.open('rb') as image:
+            self.assertEqual(image.read(), self.content)
+        self.assertEqual(attached.imagem_sha256, hashlib.sha256(self.content).hexdigest())
+        self.assertFalse(UploadSession.objects.exists())
+
+        # An upload is attached once only
+        response = self.client.post(reverse('create_exames'), data)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(ItemExames.objects.exclude(imagem='').count(), 1)
+
+    def test_failed_write_keeps_upload(self):
+        session = UploadSession.objects.get(pk=self.upload()['id'])
+        exames = Exames.objects.get()
+        item = ItemExames(exame_id='1')
+        prescription = Prescription(exames, [item], uploads=[(item, session)])
+        with mock.patch('workshop.prescriptions._write_items', side_effect=OSError('disk full')):
+            with self.captureOnCommitCallbacks(execute=True), self.assertRaises(OSError):
+                save_prescriptions([prescription])
+        self.assertEqual(UploadSession.objects.get(pk=session.pk).status, UploadSession.COMPLETE)
+        self.assertTrue(os.path.exists(part_path(session)))
+
+        item = ItemExames(exame_id='1')
+        with self.captureOnCommitCallbacks(execute=True):
+            save_prescriptions([Prescription(exames, [item], uploads=[(item, session)])])
+        item.refresh_from_db()
+        self.assertEqual(item.imagem_sha256, hashlib.sha256(self.content).hexdigest())
+        self.assertFalse(os.path.exists(part_path(session)))
+        self.assertEqual(os.listdir(os.path.dirname(part_path(session))), [])
+
+    def test_claimed_upload_survives_garbage_collection(self):
+        session = UploadSession.objects.get(pk=self.upload()['id'])
+        stale = time.time() - 2 * GC_GRACE.total_seconds()
+        os.utime(part_path(session), (stale, stale))
+
+        # Claimed but not yet referenced: the prescription has not committed
+        item = ItemExames(exame_id='1')
+        name = claim(session, item.imagem)
+        self.assertEqual(collect_garbage()[0], 0)
+        self.assertTrue(exam_image_storage().exists(name))
+
+
+# -------------------------------
+# Media Serving
+# -------------------------------
+
+class MediaServingTests(TestCase):
+
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root)
+        settings = self.settings(
+            MEDIA_ROOT=self.media_root,
+            CHUNKED_UPLOAD_DIR=os.path.join(self.media_root, 'partial'),
+        )
+        settings.enable()
+        self.addCleanup(settings.disable)
+        self.content = bytes(range(256)) * 40
+        self.name = default_storage.save('ImagemExames/scan.png', ContentFile(self.content))
+        self.url = default_storage.url(self.name)
+
+    def get(self, **headers):
+        response = self.client.get(self.url, headers=headers)
+        if response.streaming:
+            return response, b''.join(response.streaming_content)
+        return response, response.content
+
+    def test_full_response_carries_validators(self):
+        response, body = self.get()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(body, self.content)
+        self.assertEqual(response['Content-Type'], 'image/png')
+        self.assertEqual(response['Accept-Ranges'], 'bytes')
+        self.assertTrue(response['ETag'].startswith('"'))
+        self.assertIn('Last-Modified', response)
+
+    def test_repeat_view_not_modified(self):
+        etag = self.get()[0]['ETag']
+        response, body = self.get(**{'If-None-Match': etag})
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(body, b'')
+
+    def test_byte_ranges(self):
+        response, body = self.get(Range='bytes=100-199')
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(body, self.content[100:200])
+        self.assertEqual(response['Content-Range'], f'bytes 100-199/{len(self.content)}')
+        self.assertEqual(response['Content-Length'], '100')
+
+        response, body = self.get(Range='bytes=-10')
+        self.assertEqual(body, self.content[-10:])
+
+        response, _ = self.get(Range=f'bytes={len(self.content)}-')
+        self.assertEqual(response.status_code, 416)
+        self.assertEqual(response['Content-Range'], f'bytes */{len(self.content)}')
+
+    def test_stale_if_range_sends_whole_file(self):
+        response, body = self.get(Range='bytes=0-9', **{'If-Range': '"stale"'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(body, self.content)
+
+    def test_accel_redirect_offload(self):
+        with self.settings(MEDIA_OFFLOAD='x-accel-redirect'):
+            response, body = self.get()
+        self.assertEqual(response['X-Accel-Redirect'], f'/protected-media/{self.name}')
+        self.assertEqual(body, b'')
+
+    def test_partial_uploads_and_traversal_hidden(self):
+        os.makedirs(os.path.join(self.media_root, 'partial'))
+        with open(os.path.join(self.media_root, 'partial', 'x.part'), 'wb') as part:
+            part.write(b'secret')
+        for path in ('partial/x.part', '../etc/passwd', 'ImagemExames/'):
+            with self.subTest(path):
+                response = self.client.get(reverse('media', args=[path]))
+                self.assertEqual(response.status_code, 404)
+
+
+# -------------------------------
+# Content-addressed Exam Images
+# -------------------------------
+
+class ExamImageStorageTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        seed_clinic(pacientes=1, per_patient=2)
+
+    def setUp(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        settings = self.settings(MEDIA_ROOT=media_root, EXAM_PREVIEWS_ASYNC=False)
+        settings.enable()
+        self.addCleanup(settings.disable)
+        self.storage = exam_image_storage()
+        self.first, self.second = ItemExames.objects.order_by('pk')
+
+    def attach(self, item, upload):
+        item.imagem = upload
+        with self.captureOnCommitCallbacks(execute=True):
+            item.save()
+
+    def refcount(self, name):
+        return ImagemBlob.objects.get(name=name).refcount
+
+    def test_identical_content_stored_once(self):
+        self.attach(self.first, png_upload('a.PNG'))
+        self.attach(self.second, png_upload('b.png'))
+
+        name = self.first.imagem.name
+        self.assertEqual(self.second.imagem.name, name)
+        self.first.refresh_from_db()
+        digest = self.first.imagem_sha256
+        self.assertEqual(name, f'ImagemExames/{digest[:2]}/{digest[2:4]}/{digest}.png')
+        self.assertEqual(blob_digest(name), digest)
+        self.assertEqual(len(list(self.storage.blobs('ImagemExames'))), 1)
+        self.assertEqual(self.refcount(name), 2)
+
+    def test_refcounts_follow_rows(self):
+        self.attach(self.first, png_upload())
+        self.attach(self.second, png_upload())
+        name = self.first.imagem.name
+
+        self.first.delete()
+        self.assertEqual(self.refcount(name), 1)
+        self.attach(self.second, png_upload(size=(10, 10)))
+        self.assertEqual(self.refcount(name), 0)
+        self.assertEqual(self.refcount(self.second.imagem.name), 1)
+
+        ImagemBlob.objects.update(refcount=7)
+        repair_refcounts()
+        self.assertEqual(
+            dict(ImagemBlob.objects.values_list('name', 'refcount')),
+            {self.second.imagem.name: 1},
+        )
+
+    def test_garbage_collection_removes_orphans_only(self):
+        self.attach(self.first, png_upload())
+        self.attach(self.second, png_upload(size=(10, 10)))
+        orphan = self.first.imagem.name
+        self.first.delete()
+
+        self.assertEqual(collect_garbage()[0], 0)  # still within the grace period
+        self.assertEqual(collect_garbage(timedelta(0), dry_run=True)[0], 1)
+        self.assertTrue(self.storage.exists(orphan))
+
+        files, size = collect_garbage(timedelta(0))
+        self.assertEqual(files, 1)
+        self.assertGreater(size, 0)
+        self.assertFalse(self.storage.exists(orphan))
+        self.assertTrue(self.storage.exists(self.second.imagem.name))
+        self.assertFalse(ImagemBlob.objects.filter(name=orphan).exists())
+
+    def test_garbage_collection_rechecks_reused_blobs(self):
+        self.attach(self.first, png_upload())
+        orphan = self.first.imagem.name
+        self.first.delete()
+        stale = time.time() - 2 * GC_GRACE.total_seconds()
+        os.utime(self.storage.path(orphan), (stale, stale))
+        listed = list(self.storage.blobs('ImagemExames'))
+
+        # The same scan is saved again after the collector listed the blobs
+        self.assertEqual(self.storage.save('ImagemExames/c.png', png_upload()), orphan)
+        with mock.patch.object(type(self.storage), 'blobs', return_value=listed):
+            self.assertEqual(collect_garbage(), (0, 0))
+        self.assertTrue(self.storage.exists(orphan))
+
+
+# -------------------------------
+# Patient Fragment Cache
+# -------------------------------
+
+class PatientFragmentCacheTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        seed_clinic(pacientes=2, per_patient=2)
+        cls.paciente, cls.other = Paciente.objects.order_by('cc')
+
+    def setUp(self):
+        cache.clear()
+
+    def dashboard(self, paciente=None):
+        paciente = paciente or self.paciente
+        return self.client.get(reverse('patient_dashboard'), {'patient_cc': paciente.cc})
+
+    def write(self, action):
+        with self.captureOnCommitCallbacks(execute=True):
+            action()
+
+    def test_repeat_view_skips_database(self):
+        first = self.dashboard().content
+        with self.assertNumQueries(0):
+            self.assertEqual(self.dashboard().content, first)
+
+    def test_writes_retire_fragments(self):
+        medicacao = Medicacao.objects.filter(paciente=self.paciente).first()
+        exames = Exames.objects.filter(paciente=self.paciente).first()
+        writes = {
+            'Follow-up visit': lambda: Consulta.objects.create(
+                paciente=self.paciente, data_hora=timezone.now(), motivo='Follow-up visit'),
+            '(2 medications)': lambda: ItemMedicacao.objects.create(
+                medicacao=medicacao, medicamento=Medicamento.objects.first()),
+            '(0 exams)': lambda: ItemExames.objects.filter(exames=exames).delete(),
+        }
+        for text, action in writes.items():
+            with self.subTest(text):
+                self.assertNotContains(self.dashboard(), text)
+                self.write(action)
+                self.assertContains(self.dashboard(), text)
+
+        paciente = Paciente.objects.get(pk=self.paciente.pk)
+        paciente.nome = 'Renamed Patient'
+        self.write(paciente.save)
+        self.assertContains(self.dashboard(), 'Renamed Patient')
+
+    def test_moved_record_retires_both_patients(self):
+        consulta = Consulta.objects.filter(paciente=self.paciente).first()
+        consulta.motivo = 'Moved visit'
+        self.write(consulta.save)
+        self.assertContains(self.dashboard(), 'Moved visit')
+        self.assertNotContains(self.dashboard(self.other), 'Moved visit')
+
+        consulta.paciente = self.other
+        self.write(consulta.save)
+        self.assertNotContains(self.dashboard(), 'Moved visit')
+        self.assertContains(self.dashboard(self.other), 'Moved visit')
+
+    def test_doctor_dashboard_recent_consultas(self):
+        url = reverse('doctor_dashboard')
+        self.assertNotContains(self.client.get(url, {'patient_cc': self.paciente.cc}), 'Urgent')
+        self.write(lambda: Consulta.objects.create(
+            paciente=self.paciente, data_hora=timezone.now(), motivo='Urgent'))
+        self.assertContains(self.client.get(url, {'patient_cc': self.paciente.cc}), 'Urgent')
+
+    def test_several_workers_need_a_shared_cache(self):
+        check_shared_cache()
+        with override_settings(WEB_CONCURRENCY=4), self.assertRaises(ImproperlyConfigured):
+            check_shared_cache()
+        shared = {'default': {'BACKEND': 'django.core.cache.backends.dummy.DummyCache'}}
+        with override_settings(WEB_CONCURRENCY=4, CACHES=shared):
+            check_shared_cache()
+
+
+# -------------------------------
+# Reference Catalog Cache
+# -------------------------------
+
+class CatalogCacheTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        seed_clinic(pacientes=1, per_patient=1)
+        cls.paciente = Paciente.objects.get()
+
+    def setUp(self):
+        cache.clear()
+
+    def catalog_queries(self, queries):
+        return [q['sql'] for q in queries if 'FROM "workshop_medicamento"' in q['sql']]
+
+    def prescription(self, *medicamentos):
+        data = {
+            'paciente': self.paciente.cc, 'date': date.today().isoformat(),
+            'itemmedicacao_set-TOTAL_FORMS': len(medicamentos),
+            'itemmedicacao_set-INITIAL_FORMS': 0,
+            'itemmedicacao_set-MIN_NUM_FORMS': 1, 'itemmedicacao_set-MAX_NUM_FORMS': 1000,
+        }
+        for i, medicamento in enumerate(medicamentos):
+            data.update({
+                f'itemmedicacao_set-{i}-medicamento': medicamento,
+                f'itemmedicacao_set-{i}-dose': '1 tablet',
+                f'itemmedicacao_set-{i}-quantidade': 1,
+            })
+        return data
+
+    def test_rows_share_one_catalog_load(self):
+        formset = ItemMedicacaoFormSet(
+            queryset=ItemMedicacao.objects.none(),
+            initial=[{'medicamento': f'MED{i % 5}'} for i in range(15)],
+        )
+        formset.extra = 15
+        with CaptureQueriesContext(connection) as queries:
+            html = ''.join(str(form['medicamento']) for form in formset)
+        self.assertEqual(len(self.catalog_queries(queries)), 1)
+        self.assertEqual(html.count('value="Medicamento 0 (MED0)"'), 3)
+
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(reverse('create_medicacao'))
+        self.assertEqual(self.catalog_queries(queries), [])
+
+    def test_posted_rows_validated_from_catalog(self):
+        data = self.prescription('MED0', 'MED1', 'MED2')
+        MEDICAMENTOS.state()
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post(reverse('create_medicacao'), data)
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(self.catalog_queries(queries), [])
+        self.assertEqual(
+            sorted(ItemMedicacao.objects.filter(dose='1 tablet').values_list('medicamento', flat=True)),
+            ['MED0', 'MED1', 'MED2'],
+        )
+
+        response = self.client.post(reverse('create_medicacao'), self.prescription('NOPE'))
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'Select a valid choice')
+
+    def test_selected_value_rendered(self):
+        html = str(ItemMedicacaoForm(initial={'medicamento': 'MED3'})['medicamento'])
+        self.assertIn('name="medicamento" id="id_medicamento" value="MED3"', html)
+        self.assertIn('value="Medicamento 3 (MED3)"', html)
+
+    def test_catalog_writes_reload_choices(self):
+        MEDICAMENTOS.state()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse('create_medicamento'), {'id_medicamento': 'NEW1', 'nome': 'Novo'})
+        self.assertIn('value="Novo (NEW1)"', str(ItemMedicacaoForm(initial={'medicamento': 'NEW1'})['medicamento']))
+        self.assertEqual(self.client.post(
+            reverse('create_medicacao'), self.prescription('NEW1')
+        ).status_code, 302)
+
+
+# -------------------------------
+# Autocomplete
+# -------------------------------
+
+class AutocompleteTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        seed_clinic(pacientes=25, per_patient=1)
+        cls.paciente = Paciente.objects.get(cc=10000007)
+
+    def setUp(self):
+        cache.clear()
+
+    def test_forms_render_without_listing_choices(self):
+        for name in ['schedule_consulta', 'create_medicacao', 'create_exames']:
+            with self.subTest(name=name):
+                with self.assertNumQueries(0):
+                    response = self.client.get(reverse(name))
+                self.assertNotContains(response, '<option')
+                self.assertContains(response, 'data-autocomplete-url')
+
+    def test_bound_form_shows_chosen_label(self):
+        form = ConsultaForm(initial={'paciente': self.paciente.cc})
+        with self.assertNumQueries(1):
+            html = str(form['paciente'])
+        self.assertIn(f'value="{self.paciente.cc}"', html)
+        self.assertIn('value="Paciente 007 (CC: 10000007)"', html)
+        self.assertIn(f'data-autocomplete-url="{reverse("autocomplete", args=["paciente"])}"', html)
+        self.assertIn('for="id_paciente_search"', form['paciente'].label_tag())
+
+    def test_lookup_endpoint(self):
+        response = self.client.get(reverse('autocomplete', args=['paciente']), {'q': '1000000'})
+        self.assertEqual(
+            [result['id'] for result in response.json()['results']],
+            list(range(10000000, 10000010)),
+        )
+        response = self.client.get(reverse('autocomplete', args=['medicamento']), {'q': 'med2'})
+        self.assertEqual(response.json()['results'][0], {'id': 'MED2', 'label': 'Medicamento 2 (MED2)'})
+        response = self.client.get(reverse('autocomplete', args=['exame']), {'q': 'Exame 4'})
+        self.assertEqual(response.json()['results'][0]['id'], '4')
+        self.assertEqual(self.client.get(reverse('autocomplete', args=['paciente'])).json(), {'results': []})
+        response = self.client.get(reverse('autocomplete', args=['medico']), {'q': 'General'})
+        self.assertTrue(response.json()['results'])
+        self.assertEqual(self.client.get(reverse('autocomplete', args=['receita'])).status_code, 404)
+
+    def test_posted_key_validated(self):
+        data = {'data_hora': '2026-10-20T10:00', 'motivo': 'Follow-up'}
+        response = self.client.post(reverse('schedule_consulta'), {**data, 'paciente': 99999999})
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'Select a valid choice')
+        self.assertEqual(self.client.post(
+            reverse('schedule_consulta'), {**data, 'paciente': self.paciente.cc}
+        ).status_code, 302)
+        self.assertTrue(Consulta.objects.filter(paciente=self.paciente, motivo='Follow-up').exists())
+
+
+# -------------------------------
+# Prescription Writes
+# -------------------------------
+
+class PrescriptionWriteTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        seed_clinic(pacientes=2, per_patient=1)
+        cls.pacientes = list(Paciente.objects.order_by('cc'))
+
+    def statements(self, queries, verb, table):
+        return [q['sql'] for q in queries if q['sql'].startswith(verb) and f'"{table}"' in q['sql']]
+
+    def test_batch_written_in_bulk(self):
+        prescriptions = [
+            Prescription(
+                Medicacao(paciente=paciente, date=date.today()),
+                [ItemMedicacao(medicamento_id=f'MED{i}', dose='1 tablet') for i in range(3)],
+            )
+            for paciente in self.pacientes
+        ]
+        with CaptureQueriesContext(connection) as queries:
+            save_prescriptions(prescriptions)
+        self.assertEqual(len(self.statements(queries, 'INSERT', 'workshop_itemmedicacao')), 1)
+        for paciente in self.pacientes:
+            paciente.refresh_from_db()
+            self.assertEqual(paciente.num_medicacoes, 2)
+            self.assertEqual(
+                ItemMedicacao.objects.filter(medicacao__paciente=paciente, dose='1 tablet').count(), 3
+            )
+
+    def test_batch_is_atomic(self):
+        before = Medicacao.objects.count()
+        with self.assertRaises(ValueError):
+            save_prescriptions([
+                Prescription(Medicacao(paciente=self.pacientes[0], date=date.today()),
+                             [ItemMedicacao(medicamento_id='MED0')]),
+                Prescription(Medicacao(paciente=self.pacientes[1], date=date.today()),
+                             [ItemMedicacao(medicamento_id='MED0', quantidade='many')]),
+            ])
+        self.assertEqual(Medicacao.objects.count(), before)
+        self.pacientes[0].refresh_from_db()
+        self.assertEqual(self.pacientes[0].num_medicacoes, 1)
+
+    def test_only_changed_rows_updated(self):
+        medicacao = Medicacao.objects.filter(paciente=self.pacientes[0]).get()
+        ItemMedicacao.objects.bulk_create([
+            ItemMedicacao(medicacao=medicacao, medicamento_id='MED3'),
+            ItemMedicacao(medicacao=medicacao, medicamento_id='MED4'),
+        ])
+        first, second, third = ItemMedicacao.objects.filter(medicacao=medicacao).order_by('pk')
+        second.dose = '2 tablets'
+        with CaptureQueriesContext(connection) as queries:
+            save_prescriptions([Prescription(medicacao, [first, second], deleted=[third])])
+        self.assertEqual(self.statements(queries, 'UPDATE', 'workshop_medicacao'), [])
+        updates = self.statements(queries, 'UPDATE', 'workshop_itemmedicacao')
+        self.assertEqual(len(updates), 1)
+        self.assertIn('"dose"', updates[0])
+        self.assertNotIn('"quantidade"', updates[0])
+        self.assertTrue(updates[0].endswith(f'IN ({second.pk})'), updates[0])
+        self.assertEqual(
+            list(ItemMedicacao.objects.filter(medicacao=medicacao).order_by('pk').values_list('dose', flat=True)),
+            ['', '2 tablets'],
+        )
+
+    def test_deleted_items_removed_in_bulk(self):
+        exames = Exames.objects.filter(paciente=self.pacientes[0]).get()
+        name = f'ImagemExames/aa/bb/{"ab" * 32}.png'
+        ItemExames.objects.bulk_create([
+            ItemExames(exames=exames, exame_id=f'{i}', imagem=name) for i in range(1, 5)
+        ])
+        ImagemBlob.objects.create(name=name, refcount=4)
+        deleted = list(ItemExames.objects.filter(exames=exames, imagem=name))
+        with CaptureQueriesContext(connection) as queries:
+            save_prescriptions([Prescription(exames, deleted=deleted)])
+        # Header check, image names, one DELETE and one refcount UPDATE,
+        # inside a savepoint, whatever the number of items
+        self.assertEqual(len(queries), 6, [q['sql'] for q in queries])
+        self.assertEqual(len(self.statements(queries, 'DELETE', 'workshop_itemexames')), 1)
+        self.assertEqual(ItemExames.objects.filter(exames=exames).count(), 1)
+        self.assertEqual(ImagemBlob.objects.get(name=name).refcount, 0)
+
+    def test_exam_images_counted(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        exames = Exames.objects.filter(paciente=self.pacientes[0]).get()
+        with self.settings(MEDIA_ROOT=media_root, EXAM_PREVIEWS_ASYNC=False), \
+                self.captureOnCommitCallbacks(execute=True):
+            save_prescriptions([Prescription(exames, [
+                ItemExames(exame_id='1', imagem=png_upload(size=(40, 30))),
+                ItemExames(exame_id='2', imagem=png_upload(size=(40, 30))),
+            ])])
+        items = ItemExames.objects.filter(exames=exames).exclude(imagem='')
+        self.assertEqual(len({item.imagem.name for item in items}), 1)
+        self.assertEqual(ImagemBlob.objects.get(name=items[0].imagem.name).refcount, 2)
+        self.assertTrue(all(item.imagem_sha256 for item in items))
+
+    def test_edit_exam_prescription(self):
+        exames = Exames.objects.filter(paciente=self.pacientes[0]).get()
+        item = ItemExames.objects.get(exames=exames)
+        url = reverse('update_exames', args=[exames.pk])
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post(url, {
+                'paciente': exames.paciente_id, 'date': exames.date.isoformat(),
+                'itemexames_set-TOTAL_FORMS': 2, 'itemexames_set-INITIAL_FORMS': 1,
+                'itemexames_set-MIN_NUM_FORMS': 1, 'itemexames_set-MAX_NUM_FORMS': 1000,
+                'itemexames_set-0-id': item.pk, 'itemexames_set-0-exames': exames.pk,
+                'itemexames_set-0-exame': item.exame_id, 'itemexames_set-0-resultados': 'Normal',
+                'itemexames_set-1-exames': exames.pk, 'itemexames_set-1-exame': '4',
+            })
+        # Before assertRedirects, whose request resets the query log
+        self.assertEqual(len(self.statements(queries, 'UPDATE', 'workshop_itemexames')), 1)
+        self.assertRedirects(response, reverse('doctor_dashboard'))
+        self.assertEqual(
+            list(ItemExames.objects.filter(exames=exames).order_by('pk').values_list('exame_id', 'resultados')),
+            [(item.exame_id, 'Normal'), ('4', '')],
+        )
+        self.assertContains(self.client.get(url), '>\nNormal</textarea>')
+
+
+# -------------------------------
+# JSON API
+# -------------------------------
+
+class ApiTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        seed_clinic(pacientes=5, per_patient=2)
+        cls.paciente = Paciente.objects.order_by('cc').first()
+
+    def setUp(self):
+        cache.clear()
+
+    def test_sparse_fields(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('api_list', args=['pacientes']), {'fields': 'nome,email'})
+        self.assertEqual(len(queries), 1)
+        self.assertNotIn('"morada"', queries[0]['sql'])
+        rows = response.json()['data']
+        self.assertEqual(len(rows), 5)
+        self.assertEqual(rows[0], {'cc': self.paciente.cc, 'nome': 'Paciente 000', 'email': 'paciente0@sns.pt'})
+
+        response = self.client.get(reverse('api_list', args=['pacientes']), {'fields': 'nome,password'})
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('password', response.json()['error'])
+
+    def test_includes(self):
+        medicacao = Medicacao.objects.filter(paciente=self.paciente).order_by('pk').first()
+        url = reverse('api_detail', args=['medicacoes', medicacao.pk])
+        with self.assertNumQueries(2):
+            data = self.client.get(url, {'include': 'paciente,items'}).json()['data']
+        self.assertEqual(data['paciente'], {'cc': self.paciente.cc, 'nome': 'Paciente 000'})
+        self.assertEqual(
+            [(item['medicamento'], item['nome']) for item in data['items']],
+            list(ItemMedicacao.objects.filter(medicacao=medicacao)
+                 .values_list('medicamento', 'medicamento__nome')),
+        )
+        self.assertEqual(self.client.get(url).json()['data']['paciente'], self.paciente.cc)
+        self.assertEqual(self.client.get(
+            reverse('api_detail', args=['medicacoes', 0])
+        ).status_code, 404)
+        self.assertEqual(self.client.get(reverse('api_list', args=['receitas'])).status_code, 404)
+
+    def test_cursor_walks_every_row(self):
+        url = reverse('api_list', args=['consultas'])
+        params, seen = {'limit': 3, 'fields': 'id'}, []
+        while True:
+            body = self.client.get(url, params).json()
+            seen += [row['id'] for row in body['data']]
+            if not body['next_cursor']:
+                break
+            params['cursor'] = body['next_cursor']
+        self.assertEqual(seen, list(Consulta.objects.order_by('pk').values_list('pk', flat=True)))
+
+        body = self.client.get(url, {'paciente': self.paciente.cc}).json()
+        self.assertEqual({row['paciente'] for row in body['data']}, {self.paciente.cc})
+
+    def test_conditional_get(self):
+        url = reverse('api_list', args=['consultas'])
+        params = {'include': 'paciente'}
+        etag = self.client.get(url, params)['ETag']
+
+        with self.assertNumQueries(0):
+            response = self.client.get(url, params, headers={'if-none-match': etag})
+        self.assertEqual(response.status_code, 304)
+        response = self.client.get(url, {'include': 'medicos'}, headers={'if-none-match': etag})
+        self.assertEqual(response.status_code, 200)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Paciente.objects.filter(pk=self.paciente.pk).get().save()
+        response = self.client.get(url, params, headers={'if-none-match': etag})
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+        # Consultas without the patient included do not depend on Paciente
+        etag = self.client.get(url)['ETag']
+        with self.captureOnCommitCallbacks(execute=True):
+            Paciente.objects.filter(pk=self.paciente.pk).get().save()
+        self.assertEqual(self.client.get(url, headers={'if-none-match': etag}).status_code, 304)
+
+
+# -------------------------------
+# Async Views and Concurrent Reads
+# -------------------------------
+
+def sleep_query(seconds):
+    with connection.cursor() as cursor:
+        cursor.execute('SELECT pg_sleep(%s)', [seconds])
+    return seconds
+
+
+class ConcurrentReadTests(TransactionTestCase):
+
+    def test_reads_overlap(self):
+        started = time.perf_counter()
+        results = async_to_sync(gather_reads)(
+            partial(sleep_query, 0.4), partial(sleep_query, 0.2), partial(sleep_query, 0.4),
+        )
+        self.assertEqual(results, [0.4, 0.2, 0.4])
+        self.assertLess(time.perf_counter() - started, 0.9)
+
+    def test_worker_queries_count_against_budget(self):
+        with QueryRecorder() as recorder:
+            async_to_sync(gather_reads)(partial(sleep_query, 0), partial(sleep_query, 0))
+        self.assertEqual(recorder.count, 2)
+
+    def test_reads_see_uncommitted_writes_in_transaction(self):
+        with transaction.atomic():
+            Paciente.objects.create(
+                cc=42, nome='Uncommitted', data_nascimento=date(1990, 1, 1),
+                morada='Rua', telefone=920000042, email='uncommitted@sns.pt',
+                numero_seguranca_social=42,
+            )
+            count, = async_to_sync(gather_reads)(Paciente.objects.count)
+        self.assertEqual(count, 1)
+
+
+class AsyncViewTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        seed_clinic(pacientes=2, per_patient=2)
+        cls.paciente = Paciente.objects.order_by('cc').first()
+
+    def setUp(self):
+        cache.clear()
+
+    async def test_detail_views(self):
+        medicacao = await Medicacao.objects.filter(paciente=self.paciente).afirst()
+        exames = await Exames.objects.filter(paciente=self.paciente).afirst()
+        consulta = await Consulta.objects.filter(paciente=self.paciente).afirst()
+        for name, pk, text in [
+            ('medicacao_detail', medicacao.pk, 'Medicamento'),
+            ('exames_detail', exames.pk, 'Exame'),
+            ('consulta_detail', consulta.pk, consulta.motivo),
+        ]:
+            with self.subTest(name):
+                response = await self.async_client.get(reverse(name, args=[pk]))
+                self.assertContains(response, text)
+                response = await self.async_client.get(reverse(name, args=[0]))
+                self.assertEqual(response.status_code, 404)
+
+    def test_doctor_dashboard_repeat_view(self):
+        url = reverse('doctor_dashboard')
+        params = {'patient_cc': self.paciente.cc}
+        first = self.client.get(url, params)
+        self.assertContains(first, self.paciente.nome)
+        self.assertEqual(len(first.context['pacientes']), 2)
+        # Only the statistics rollup and the page of patients are read again
+        with self.assertNumQueries(2):
+            self.assertEqual(self.client.get(url, params).content, first.content)
+        self.assertIsNone(self.client.get(url, {'patient_cc': 'x'}).context['selected_patient'])
+
+
+# -------------------------------
+# Connection Pool
+# -------------------------------
+
+class ConnectionPoolTests(TestCase):
+
+    def test_report_includes_pool_metrics(self):
+        with self.settings(DEBUG=True):
+            pools = self.client.get(reverse('query_report')).json()['pools']
+        self.assertTrue(pools['default']['open'])
+        self.assertEqual(pools['default']['pool_max'], connection.settings_dict['OPTIONS']['pool']['max_size'])
+        self.assertGreaterEqual(pools['default']['pool_size'], 1)
+
+    def test_exhausted_pool_answers_503(self):
+        request = RequestFactory().get(reverse('doctor_dashboard'))
+        middleware = ConnectionPoolMiddleware(lambda request: None)
+        try:
+            try:
+                raise PoolTimeout("couldn't get a connection after 5.00 sec")
+            except PoolTimeout as exc:
+                raise OperationalError(*exc.args) from exc
+        except OperationalError as exc:
+            with self.assertLogs('workshop.dbpool', 'WARNING'):
+                response = middleware.process_exception(request, exc)
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response['Retry-After'], '1')
+        self.assertIsNone(middleware.process_exception(request, OperationalError('gone')))
+
+
+# -------------------------------
+# Read Replicas
+# -------------------------------
+
+class ReadReplicaTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        seed_clinic(pacientes=2, per_patient=1)
+        cls.paciente = Paciente.objects.order_by('cc').first()
+
+    def setUp(self):
+        cache.clear()
+        # The test database has no replica: record where reads would go and
+        # serve them from the primary
+        patcher = mock.patch('workshop.routers.random.choice', return_value='default')
+        self.choice = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def replica_reads(self, method, path, data=None):
+        self.choice.reset_mock()
+        response = getattr(self.client, method)(path, data)
+        return response, self.choice.called
+
+    @override_settings(DATABASE_REPLICAS=[{}])
+    def test_read_views_use_replicas(self):
+        dashboard = reverse('patient_dashboard')
+        _, routed = self.replica_reads('get', dashboard, {'patient_cc': self.paciente.cc})
+        self.assertTrue(routed)
+        _, routed = self.replica_reads('get', reverse('list_pacientes'))
+        self.assertTrue(routed)
+        _, routed = self.replica_reads('get', reverse('create_medicamento'))
+        self.assertFalse(routed)
+
+    @override_settings(DATABASE_REPLICAS=[{}])
+    def test_reads_after_own_write_stick_to_primary(self):
+        response, _ = self.replica_reads(
+            'post', reverse('create_medicamento'), {'id_medicamento': 'NEW1', 'nome': 'Novo'},
+        )
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(response.cookies[STICKY_COOKIE]['max-age'], 5)
+        _, routed = self.replica_reads('get', reverse('list_pacientes'))
+        self.assertFalse(routed)
+
+        self.client.cookies.pop(STICKY_COOKIE)
+        _, routed = self.replica_reads('get', reverse('list_pacientes'))
+        self.assertTrue(routed)
+
+    def test_without_replicas_everything_uses_primary(self):
+        response, _ = self.replica_reads(
+            'post', reverse('create_medicamento'), {'id_medicamento': 'NEW1', 'nome': 'Novo'},
+        )
+        self.assertNotIn(STICKY_COOKIE, response.cookies)
+        _, routed = self.replica_reads('get', reverse('list_pacientes'))
+        self.assertFalse(routed)
+
+    @override_settings(DATABASE_REPLICAS=[{}, {}])
+    def test_router(self):
+        router = ReplicaRouter()
+        self.assertEqual(router.db_for_read(Paciente), 'default')
+        with replica_reads():
+            router.db_for_read(Paciente)
+            self.assertEqual(self.choice.call_args.args[0], ['replica1', 'replica2'])
+            self.assertEqual(router.db_for_write(Paciente), 'default')
+            self.choice.reset_mock()
+            self.assertEqual(router.db_for_read(Paciente), 'default')
+            self.assertFalse(self.choice.called)
+        self.assertTrue(router.allow_migrate('default', 'workshop'))
+        self.assertFalse(router.allow_migrate('replica1', 'workshop'))
+
+    @override_settings(DATABASE_REPLICAS=[{}])
+    def test_admin_changelist_uses_replicas(self):
+        self.client.force_login(User.objects.create_superuser('admin', 'admin@sns.pt', 'pw'))
+        response, routed = self.replica_reads('get', reverse('admin:workshop_paciente_changelist'))
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(routed)
+
+    @override_settings(DATABASE_REPLICAS=[{}])
+    def test_fragments_retired_again_after_replica_lag(self):
+        before = patient_version(self.paciente.cc)
+        with self.captureOnCommitCallbacks(execute=True):
+            Consulta.objects.create(paciente=self.paciente, data_hora=timezone.now(), motivo='Lagging')
+        # A token lasting only the lag window replaces the retired one
+        self.assertIsNotNone(cache.get(version_key(self.paciente.cc)))
+        self.assertNotEqual(patient_version(self.paciente.cc), before)
+
+
+# -------------------------------
+# Scheduling
+# -------------------------------
+
+class SchedulingTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        seed_clinic(pacientes=3, medicos=3, per_patient=1)
+        cls.paciente, cls.other, _ = Paciente.objects.order_by('cc')
+        cls.medico, cls.colleague, _ = Medico.objects.order_by('nome', 'cc')
+        # A Monday two weeks ahead
+        today = date.today()
+        cls.monday = today + timedelta(days=14 - today.weekday())
+
+    def at(self, hour, minute=0, days=0):
+        day = datetime.combine(self.monday + timedelta(days=days), datetime.min.time())
+        return timezone.make_aware(day + timedelta(hours=hour, minutes=minute))
+
+    def book(self, paciente, medico, start):
+        return book_consulta(Consulta(paciente=paciente, data_hora=start, motivo='Booked'), medico)
+
+    def test_free_slots_skip_bookings(self):
+        self.book(self.paciente, self.medico, self.at(8))
+        medicos = doctors_for(medico=self.medico.cc)
+        with self.assertNumQueries(2):
+            slots = free_slots(medicos, self.at(0), self.at(0, days=1), limit=3)
+        self.assertEqual([slot.start for slot in slots], [self.at(8, 30), self.at(9), self.at(9, 30)])
+        self.assertEqual({slot.medico for slot in slots}, {self.medico})
+
+        slots = free_slots(doctors_for(especialidade='general medicine'), self.at(8), self.at(9), limit=4)
+        self.assertEqual(
+            [(slot.start, slot.medico.cc) for slot in slots],
+            [(self.at(8), medico.cc) for medico in Medico.objects.order_by('nome', 'cc')[1:]]
+            + [(self.at(8, 30), self.medico.cc), (self.at(8, 30), self.colleague.cc)],
+        )
+        # Saturday and Sunday are closed
+        self.assertEqual(free_slots(medicos, self.at(0, days=5), self.at(23, days=6)), [])
+
+    def test_patient_cannot_be_double_booked(self):
+        self.book(self.paciente, self.medico, self.at(10))
+        count = Consulta.objects.count()
+        with self.assertRaises(SlotUnavailable):
+            self.book(self.paciente, self.colleague, self.at(10, 15))
+        self.assertEqual(Consulta.objects.count(), count)
+        self.book(self.paciente, self.colleague, self.at(10, 30))
+
+    def test_doctor_cannot_be_double_booked(self):
+        url = reverse('schedule_consulta')
+        data = {'medico': self.medico.cc, 'data_hora': self.at(11).strftime('%Y-%m-%dT%H:%M'), 'motivo': 'Visit'}
+        self.assertEqual(self.client.post(url, {**data, 'paciente': self.paciente.cc}).status_code, 302)
+        booking = MedicoConsulta.objects.get(medico=self.medico, periodo__isnull=False)
+        self.assertEqual((booking.periodo.lower, booking.periodo.upper), (self.at(11), self.at(11, 30)))
+
+        response = self.client.post(url, {**data, 'paciente': self.other.cc})
+        self.assertContains(response, 'is already booked at that time')
+        self.assertEqual(MedicoConsulta.objects.filter(periodo__isnull=False).count(), 1)
+
+    def test_rescheduling_moves_bookings(self):
+        consulta = self.book(self.paciente, self.medico, self.at(14))
+        response = self.client.post(reverse('update_consulta', args=[consulta.pk]), {
+            'data_hora': self.at(15).strftime('%Y-%m-%dT%H:%M'), 'motivo': 'Moved',
+        })
+        self.assertEqual(response.status_code, 302)
+        booking = MedicoConsulta.objects.get(consulta=consulta)
+        self.assertEqual(booking.periodo.lower, self.at(15))
+        slots = free_slots(doctors_for(medico=self.medico.cc), self.at(14), self.at(16))
+        self.assertEqual([slot.start for slot in slots], [self.at(14), self.at(14, 30), self.at(15, 30)])
+
+    def test_rescheduling_conflict_shows_form_error(self):
+        self.book(self.paciente, self.medico, self.at(10))
+        consulta = self.book(self.paciente, self.colleague, self.at(11))
+        response = self.client.post(reverse('update_consulta', args=[consulta.pk]), {
+            'data_hora': self.at(10, 15).strftime('%Y-%m-%dT%H:%M'), 'motivo': 'Moved',
+        })
+        self.assertEqual(response.status_code, 200)
+        self.assertTemplateUsed(response, 'update_consulta.html')
+        self.assertFormError(
+            response.context['form'], 'data_hora', 'The patient already has a consultation at that time.',
+        )
+        consulta.refresh_from_db()
+        self.assertEqual(consulta.data_hora, self.at(11))
+
+    def test_free_slots_endpoint(self):
+        url = reverse('free_slots')
+        response = self.client.get(url, {
+            'especialidade': 'General Medicine', 'from': self.monday.isoformat(), 'limit': 2,
+        })
+        results = response.json()['results']
+        self.assertEqual(len(results), 2)
+        self.assertEqual(results[0]['start'], self.at(8).isoformat().replace('+00:00', 'Z'))
+        self.assertEqual(results[0]['medico']['cc'], self.medico.cc)
+        self.assertEqual(self.client.get(url).status_code, 400)
+        self.assertEqual(self.client.get(url, {'medico': self.medico.cc, 'from': 'soon'}).status_code, 400)
+
+    def test_recurrence(self):
+        friday = self.at(9, days=4)
+        self.assertEqual(recurrence(friday, 'weekdays', 3), [friday, self.at(9, days=7), self.at(9, days=8)])
+        self.assertEqual(recurrence(friday, 'biweekly', 2), [friday, self.at(9, days=18)])
+        monthly = recurrence(timezone.make_aware(datetime(2031, 1, 31, 9)), 'monthly', 3)
+        # February is clamped to its last day; 31/03/2031 is a Monday
+        self.assertEqual([start.date() for start in monthly], [date(2031, 1, 31), date(2031, 2, 28), date(2031, 3, 31)])
+        with self.assertRaises(ValueError):
+            recurrence(friday, 'daily', 2)
+
+    def test_book_series_in_bulk(self):
+        self.book(self.other, None, self.at(8))
+        starts = recurrence(self.at(9), 'weekly', 6)
+        before = Paciente.objects.get(pk=self.paciente.pk).num_consultas
+        with CaptureQueriesContext(connection) as queries:
+            consultas = book_series(
+                self.paciente, starts, 'Physiotherapy',
+                [(self.medico, 'Primary Doctor'), (self.colleague, 'Assistant')],
+            )
+        self.assertEqual([consulta.data_hora for consulta in consultas], starts)
+        self.assertEqual(sum('INSERT INTO "workshop_consulta"' in q['sql'] for q in queries), 1)
+        self.assertEqual(sum('INSERT INTO "workshop_medicoconsulta"' in q['sql'] for q in queries), 1)
+        self.assertEqual(MedicoConsulta.objects.filter(consulta__in=consultas, periodo__isnull=False).count(), 12)
+
+        paciente = Paciente.objects.get(pk=self.paciente.pk)
+        self.assertEqual(paciente.num_consultas, before + 6)
+        self.assertEqual(paciente.ultima_consulta, starts[-1])
+        rollups = EstatisticaDiaria.objects.filter(data__in=[start.date() for start in starts])
+        self.assertEqual(sorted(rollups.values_list('consultas', flat=True)), [1, 1, 1, 1, 1, 2])
+        slots = free_slots(doctors_for(medico=self.colleague.cc), self.at(9, days=7), self.at(10, days=7))
+        self.assertEqual([slot.start for slot in slots], [self.at(9, 30, days=7)])
+
+    def test_series_conflict_books_nothing(self):
+        self.book(self.other, self.colleague, self.at(16, days=14))
+        self.book(self.paciente, None, self.at(16, 15, days=28))
+        count = Consulta.objects.count()
+        with CaptureQueriesContext(connection) as queries:
+            with self.assertRaisesMessage(SlotUnavailable, self.at(16, days=14).strftime('%d/%m/%Y')) as error:
+                book_series(self.paciente, recurrence(self.at(16), 'weekly', 5), 'Follow-up',
+                            [(self.colleague, 'Primary Doctor')])
+        self.assertIn(self.at(16, days=28).strftime('%d/%m/%Y'), str(error.exception))
+        self.assertEqual(sum('unnest' in q['sql'] for q in queries), 1)
+        self.assertEqual(Consulta.objects.count(), count)
+
+        response = self.client.post(reverse('schedule_series'), {
+            'paciente': self.paciente.cc, 'medico': self.colleague.cc, 'frequencia': 'weekly',
+            'ocorrencias': 5, 'data_hora': self.at(16).strftime('%Y-%m-%dT%H:%M'), 'motivo': 'Follow-up',
+        })
+        self.assertContains(response, 'Already booked at')
+        self.assertEqual(Consulta.objects.count(), count)
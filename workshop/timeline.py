@@ -0,0 +1,147 @@
+from collections import namedtuple
+from datetime import datetime, time, timezone as dt_timezone
+
+from django.db.models import CharField, DateTimeField, F, Q, Value
+from django.db.models.functions import Cast
+from django.db.models.lookups import LessThan
+from django.http import Http404
+from django.utils.dateparse import parse_datetime
+
+from .models import Consulta, Medicacao, Exames
+from .pagination import FORWARD, Row, decode_cursor, encode_cursor
+from .records import patient_consultas, patient_medicacoes, patient_exames
+
+# -------------------------------
+# Patient Timeline
+# -------------------------------
+# A patient's consultations, medication prescriptions and exam prescriptions
+# merged into one newest-first stream. Each stream is read with a keyset
+# range scan on its (paciente, date desc, pk desc) index, limited to one
+# page, and PostgreSQL merges the three pages with UNION ALL ... ORDER BY ...
+# LIMIT. Only the rows of the visible window are then loaded.
+#
+# Entries are ordered by (at, kind, pk), all descending. Prescriptions only
+# carry a date, so they are placed at midnight UTC of that day, which is what
+# PostgreSQL's date -> timestamptz cast gives on Django connections.
+
+TIMELINE_DEFAULT_LIMIT = 25
+TIMELINE_MAX_LIMIT = 100
+
+TimelineEntry = namedtuple('TimelineEntry', ['kind', 'at', 'object'])
+
+
+class TimelineStream:
+    """One source table of the timeline and how to key its rows."""
+
+    def __init__(self, kind, model, field, is_date, load):
+        self.kind = kind
+        self.model = model
+        self.field = field
+        self.is_date = is_date
+        # Loads full rows for display, e.g. with prescription item counts
+        self.load = load
+
+    def instant(self):
+        if self.is_date:
+            return Cast(self.field, DateTimeField())
+        return F(self.field)
+
+    def older_than(self, at, kind, pk):
+        """Filter for the rows of this stream that sort after a cursor."""
+        value, exact = at, True
+        if self.is_date:
+            value = at.astimezone(dt_timezone.utc).date()
+            exact = at == datetime.combine(value, time.min, tzinfo=dt_timezone.utc)
+
+        if not exact or self.kind < kind:
+            return Q(**{f'{self.field}__lte': value})
+        if self.kind > kind:
+            return Q(**{f'{self.field}__lt': value})
+        return LessThan(Row(F(self.field), F('pk')), Row(Value(value), Value(pk)))
+
+
+STREAMS = {
+    stream.kind: stream for stream in [
+        TimelineStream('consulta', Consulta, 'data_hora', False, patient_consultas),
+        TimelineStream('medicacao', Medicacao, 'date', True, patient_medicacoes),
+        TimelineStream('exames', Exames, 'date', True, patient_exames),
+    ]
+}
+KINDS = tuple(STREAMS)
+
+
+class TimelinePage:
+    def __init__(self, entries, has_next):
+        self.entries = entries
+        self.has_next_page = has_next
+
+    def __iter__(self):
+        return iter(self.entries)
+
+    def __len__(self):
+        return len(self.entries)
+
+    def has_next(self):
+        return self.has_next_page
+
+    @property
+    def next_cursor(self):
+        if not self.has_next_page:
+            return None
+        last = self.entries[-1]
+        return encode_cursor(FORWARD, [last.at.isoformat(), last.kind, last.object.pk])
+
+
+def _decode_timeline_cursor(cursor):
+    direction, keys = decode_cursor(cursor)
+    if direction != FORWARD or not isinstance(keys, list) or len(keys) != 3:
+        raise Http404('Invalid cursor.')
+    at, kind, pk = keys
+    try:
+        at = parse_datetime(at)
+    except (TypeError, ValueError):
+        at = None
+    if at is None or kind not in STREAMS or not isinstance(pk, int):
+        raise Http404('Invalid cursor.')
+    return at, kind, pk
+
+
+def patient_timeline(paciente, kinds=KINDS, limit=TIMELINE_DEFAULT_LIMIT, cursor=None):
+    """Return the ``TimelinePage`` of ``paciente``'s history after ``cursor``.
+
+    ``kinds`` restricts the timeline to some of ``KINDS``. Runs one query
+    to merge the streams plus one per kind present on the page.
+    """
+    kinds = [kind for kind in KINDS if kind in kinds] or list(KINDS)
+    limit = max(1, min(limit, TIMELINE_MAX_LIMIT))
+    after = _decode_timeline_cursor(cursor) if cursor else None
+
+    windows = []
+    for kind in kinds:
+        stream = STREAMS[kind]
+        window = stream.model.objects.filter(paciente=paciente)
+        if after:
+            window = window.filter(stream.older_than(*after))
+        windows.append(
+            window.annotate(
+                kind=Value(kind, output_field=CharField()),
+                at=stream.instant(),
+                key=F('pk'),
+            ).values_list('kind', 'at', 'key').order_by(f'-{stream.field}', '-pk')[:limit + 1]
+        )
+
+    if len(windows) > 1:
+        rows = list(windows[0].union(*windows[1:], all=True).order_by('-at', '-kind', '-key')[:limit + 1])
+    else:
+        rows = list(windows[0])
+    has_next = len(rows) > limit
+    rows = rows[:limit]
+
+    objects = {}
+    for kind in kinds:
+        keys = [key for row_kind, _, key in rows if row_kind == kind]
+        if keys:
+            objects[kind] = STREAMS[kind].load(paciente).in_bulk(keys)
+
+    entries = [TimelineEntry(kind, at, objects[kind][key]) for kind, at, key in rows]
+    return TimelinePage(entries, has_next)
@@ -0,0 +1,227 @@
+import hashlib
+import os
+import shutil
+import uuid
+from datetime import timedelta
+from functools import partial
+
+from django.conf import settings
+from django.core.files import File
+from django.db import transaction
+from django.utils import timezone
+
+from .models import UploadSession
+
+# -------------------------------
+# Chunked Uploads
+# -------------------------------
+# Large exam images are sent in pieces to an UploadSession instead of in one
+# multipart request. Each chunk is appended at the offset the client claims,
+# which must match what the server already holds, so an interrupted upload
+# resumes from ``received`` instead of starting over. Chunks are streamed
+# from the request to disk; nothing is buffered in memory. When the last
+# byte arrives the file's SHA-256 is checked, and the exam formset can then
+# attach the finished upload by id (see ItemExamesForm).
+
+READ_SIZE = 64 * 1024
+DEFAULT_MAX_UPLOAD_SIZE = 2 * 1024 ** 3
+SESSION_MAX_AGE = timedelta(days=1)
+
+
+class UploadError(Exception):
+    """Rejected request; ``status`` is the HTTP status to answer with and
+    ``offset``, if known, where the upload stands."""
+
+    def __init__(self, message, status=400, offset=None):
+        super().__init__(message)
+        self.status = status
+        self.offset = offset
+
+
+def upload_dir():
+    return getattr(settings, 'CHUNKED_UPLOAD_DIR', os.path.join(settings.MEDIA_ROOT, 'partial'))
+
+
+def max_upload_size():
+    return getattr(settings, 'CHUNKED_UPLOAD_MAX_SIZE', DEFAULT_MAX_UPLOAD_SIZE)
+
+
+def part_path(session):
+    return os.path.join(upload_dir(), f'{session.pk}.part')
+
+
+def create_session(filename, size, sha256=''):
+    filename = os.path.basename(filename or '').strip()
+    if not filename:
+        raise UploadError('A filename is required.')
+    if size <= 0 or size > max_upload_size():
+        raise UploadError(f'Size must be between 1 and {max_upload_size()} bytes.', 413)
+    sha256 = (sha256 or '').lower()
+    if sha256 and (len(sha256) != 64 or not all(c in '0123456789abcdef' for c in sha256)):
+        raise UploadError('sha256 must be 64 hex digits.')
+
+    return UploadSession.objects.create(filename=filename, size=size, sha256=sha256)
+
+
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as part:
+        while chunk := part.read(READ_SIZE):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _discard_file(path):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+def _check_chunk(session, offset, length):
+    if session.status != UploadSession.PENDING:
+        raise UploadError('Upload is already finished.', 409, session.received)
+    if offset != session.received:
+        raise UploadError(f'Expected offset {session.received}.', 409, session.received)
+    if length <= 0 or offset + length > session.size:
+        raise UploadError('Chunk does not fit in the declared size.', 413, session.received)
+
+
+def append_chunk(session_id, offset, stream, length):
+    """Stream ``length`` bytes from ``stream`` into the session at ``offset``.
+
+    Keeps whatever arrived if the client disconnects mid-chunk, so the next
+    attempt resumes from there. Returns the updated session.
+
+    The chunk is spooled next to the part file before any lock is taken,
+    and the finished file is hashed after it is released: the session's
+    row is only locked, and a connection only held in a transaction, to
+    recheck the offset, append the spooled bytes and record the new size.
+    """
+    session = UploadSession.objects.get(pk=session_id)
+    if session.status == UploadSession.PENDING and session.received == session.size:
+        # The last chunk was stored, but its request ended before the check
+        return _finish(session)
+    _check_chunk(session, offset, length)
+
+    os.makedirs(upload_dir(), exist_ok=True)
+    spool_path = f'{part_path(session)}.{uuid.uuid4().hex}'
+    try:
+        written = 0
+        with open(spool_path, 'wb') as spool:
+            while written < length:
+                data = stream.read(min(READ_SIZE, length - written))
+                if not data:
+                    break
+                spool.write(data)
+                written += len(data)
+
+        with transaction.atomic():
+            # Serializes concurrent chunks for the same session
+            session = UploadSession.objects.select_for_update().get(pk=session_id)
+            _check_chunk(session, offset, length)
+            with open(spool_path, 'rb') as spool, \
+                    open(part_path(session), 'r+b' if offset else 'wb') as part:
+                part.seek(offset)
+                part.truncate()
+                shutil.copyfileobj(spool, part, READ_SIZE)
+            session.received = offset + written
+            session.save(update_fields=['received', 'updated'])
+    finally:
+        _discard_file(spool_path)
+
+    if session.received == session.size:
+        return _finish(session)
+    return session
+
+
+def _finish(session):
+    """Check the digest of the session's complete part file and settle it."""
+    digest = file_sha256(part_path(session))
+    failed = bool(session.sha256) and digest != session.sha256
+    status = UploadSession.FAILED if failed else UploadSession.COMPLETE
+    settled = UploadSession.objects.filter(
+        pk=session.pk, status=UploadSession.PENDING, received=session.size,
+    ).update(status=status, sha256=session.sha256 if failed else digest, updated=timezone.now())
+    if settled:
+        session.status, session.sha256 = status, session.sha256 if failed else digest
+        if failed:
+            _discard_file(part_path(session))
+    else:
+        # Settled meanwhile by a retry of the last chunk
+        session = UploadSession.objects.get(pk=session.pk)
+    if session.status == UploadSession.FAILED:
+        raise UploadError('Checksum mismatch; the upload must be restarted.', 422, session.received)
+    return session
+
+
+class PartFile(File):
+    """A finished part file, handed to ``Storage.save``.
+
+    ``temporary_file_path()`` lets file system storages move it into place
+    rather than copy it, and ``sha256`` spares a content-addressed storage
+    hashing it again.
+    """
+
+    def __init__(self, session, path=None):
+        super().__init__(open(path or part_path(session), 'rb'), session.filename)
+        self.sha256 = session.sha256
+
+    def temporary_file_path(self):
+        return self.file.name
+
+
+def _link(path):
+    """A second name for the file at ``path``, or a copy where links fail."""
+    linked = f'{path}.{uuid.uuid4().hex}'
+    try:
+        os.link(path, linked)
+    except OSError:
+        shutil.copyfile(path, linked)
+    return linked
+
+
+def claim(session, field_file):
+    """Move a complete upload into ``field_file``'s storage and drop the session.
+
+    Sets the file's name on its instance; the caller saves the instance in
+    the same transaction (see ``save_prescriptions``). The storage moves a
+    link to the part file into place, and the part itself is only removed
+    once that transaction commits: if it rolls back, the session is
+    complete again with its file intact, and can be attached on a retry.
+    """
+    if not UploadSession.objects.filter(pk=session.pk, status=UploadSession.COMPLETE).delete()[0]:
+        raise UploadError('Upload has already been used.', 409)
+
+    name = field_file.field.generate_filename(field_file.instance, session.filename)
+    linked = _link(part_path(session))
+    try:
+        with PartFile(session, linked) as part:
+            name = field_file.storage.save(name, part, max_length=field_file.field.max_length)
+    finally:
+        # Left behind when the storage copied the file or already had its content
+        _discard_file(linked)
+    transaction.on_commit(partial(_discard_file, part_path(session)))
+
+    setattr(field_file.instance, field_file.field.attname, name)
+    if hasattr(field_file.instance, 'imagem_sha256'):
+        field_file.instance.imagem_sha256 = ''
+    return name
+
+
+def discard(session):
+    try:
+        os.remove(part_path(session))
+    except FileNotFoundError:
+        pass
+    session.delete()
+
+
+def clear_stale_sessions(max_age=SESSION_MAX_AGE):
+    """Discard sessions untouched for ``max_age``, finished or not."""
+    stale = UploadSession.objects.filter(updated__lt=timezone.now() - max_age)
+    count = 0
+    for session in stale.iterator():
+        discard(session)
+        count += 1
+    return count
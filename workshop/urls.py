@@ -12,6 +12,9 @@ urlpatterns = [
     # -------------------------------
     path('patient/', views.PatientDashboardView.as_view(), name='patient_dashboard'),
     path('patient/dashboard/', views.PatientDashboardView.as_view(), name='patient_dashboard'),
+    path('pacientes/typeahead/', views.PacienteTypeaheadView.as_view(), name='paciente_typeahead'),
+    path('patient/<int:cc>/timeline/', views.PatientTimelineView.as_view(), name='patient_timeline'),
+    path('patient/<int:cc>/timeline.json', views.PatientTimelineJSONView.as_view(), name='patient_timeline_json'),
     path('consulta/<int:pk>/', views.PatientConsultaDetailView.as_view(), name='consulta_detail'),
     path('medicacoes/', views.PatientMedicacaoListView.as_view(), name='patient_medicacoes'),
     path('exames/', views.PatientExamesListView.as_view(), name='patient_exames'),
@@ -20,10 +23,13 @@ urlpatterns = [
     # -------------------------------
     path('doctor/', views.DoctorDashboardView.as_view(), name='doctor_dashboard'),
     path('doctor/consulta/new/', views.ScheduleConsultaView.as_view(), name='schedule_consulta'),
+    path('doctor/consulta/series/', views.ScheduleSeriesView.as_view(), name='schedule_series'),
+    path('doctor/slots/', views.FreeSlotsView.as_view(), name='free_slots'),
     path('consulta/<int:pk>/edit/', views.UpdateConsultaView.as_view(), name='update_consulta'),
+    path('autocomplete/<slug:lookup>/', views.AutocompleteView.as_view(), name='autocomplete'),
 
     path('exames/new/', views.CreateExamesView.as_view(), name='create_exames'),
-    path('exames/<int:pk>/edit/', views.UpdateExameView.as_view(), name='update_exames'),
+    path('exames/<int:pk>/edit/', views.UpdateExamesView.as_view(), name='update_exames'),
     path('exames/item/<int:pk>/edit/', views.UpdateExameResultsView.as_view(), name='update_exame_results'),
 
     path('medicacao/new/', views.CreateMedicacaoView.as_view(), name='create_medicacao'),
@@ -33,6 +39,8 @@ urlpatterns = [
     #Exams
     #--------------------------------
     path('exames/detail/<int:pk>/', views.ExamesDetailView.as_view(), name='exames_detail'),
+    path('uploads/', views.UploadSessionCreateView.as_view(), name='upload_create'),
+    path('uploads/<uuid:pk>/', views.UploadSessionView.as_view(), name='upload_session'),
 
     #--------------------------------
     #medications
@@ -63,4 +71,15 @@ urlpatterns = [
     path('administration/exame/create/', views.CreateExameView.as_view(), name='create_exame'),
     path('administration/exame/<int:pk>/edit/', views.UpdateExameView.as_view(), name='update_exame'),
     path('administration/exame/', views.ExameListView.as_view(), name='list_exame'),
+
+    # -------------------------------
+    # JSON API
+    # -------------------------------
+    path('api/v1/<slug:resource>/', views.ApiListView.as_view(), name='api_list'),
+    path('api/v1/<slug:resource>/<int:pk>/', views.ApiDetailView.as_view(), name='api_detail'),
+
+    # -------------------------------
+    # Diagnostics
+    # -------------------------------
+    path('diagnostics/queries/', views.QueryReportView.as_view(), name='query_report'),
 ]
\ No newline at end of file
@@ -1,13 +1,40 @@
-from datetime import date
-from django.shortcuts import render, redirect, get_object_or_404
-from django.views.generic import ListView, DetailView, UpdateView, TemplateView, CreateView, DeleteView
+from datetime import timedelta
+from functools import partial
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.http import Http404, HttpResponse, JsonResponse
+from django.shortcuts import render, redirect, get_object_or_404, aget_object_or_404
+from django.views.generic import ListView, UpdateView, TemplateView, CreateView
 from django.views import View
-from django.urls import reverse_lazy
-from .models import Paciente, Medico, Consulta, Medicacao, ItemMedicacao, Exames, ItemExames, Medicamento, Exame
+from django.utils.cache import get_conditional_response
+from django.urls import reverse, reverse_lazy
+from django.utils import timezone
+from .models import (
+    Paciente, Medico, Consulta, Medicacao, ItemMedicacao, Exames, ItemExames, Medicamento, Exame,
+    UploadSession,
+    MEDICO_SEARCH_VECTOR, PACIENTE_SEARCH_VECTOR, MEDICAMENTO_SEARCH_VECTOR, EXAME_SEARCH_VECTOR,
+)
+from . import api, media, uploads
+from .dbpool import pool_stats
+from .fanout import gather_reads
+from .pagination import KeysetPaginationMixin, keyset_paginate
+from .prescriptions import Prescription, save_prescriptions
+from .querybudget import query_stats
+from .scheduling import (
+    FREE_SLOTS_DEFAULT_LIMIT, FREE_SLOTS_MAX_LIMIT, SlotUnavailable, book_consulta, book_series,
+    doctors_for, free_slots, parse_instant, reschedule_consulta,
+)
+from .fragments import cached_patient, fragment_key, fragment_timeout, patient_version
+from .records import patient_consultas, patient_exames, patient_medicacoes
+from .search import SearchMixin, paciente_typeahead, TYPEAHEAD_DEFAULT_LIMIT
+from .stats import dashboard_statistics
+from .timeline import KINDS, TIMELINE_DEFAULT_LIMIT, patient_timeline
 from .forms import (
     MedicacaoForm, ItemMedicacaoFormSet,
     ExamesForm, ItemExamesFormSet,
-    ConsultaForm, MedicoForm, PacienteForm, MedicamentoForm, ExameForm
+    ConsultaForm, ConsultaSeriesForm, MedicoForm, PacienteForm, MedicamentoForm, ExameForm, LOOKUPS,
 )
 
 # -------------------------------
@@ -15,6 +42,7 @@ from .forms import (
 # -------------------------------
 class HomeView(TemplateView):
     template_name = 'home.html'
+    query_budget = 0
 
 
 # -------------------------------
@@ -25,16 +53,19 @@ class HomeView(TemplateView):
 
 class PatientDashboardView(View):
     template_name = 'patient_dashboard.html'
-    
-    def get(self, request):
-        # Get all patients for the dropdown
-        pacientes = Paciente.objects.all().order_by('nome')
-        
+    query_budget = 4
+    read_replica = True
+    sections = {
+        'consultas': patient_consultas,
+        'medicacoes': patient_medicacoes,
+        'exames': patient_exames,
+    }
+
+    async def get(self, request):
         # Get selected patient ID from query parameter
         patient_cc = request.GET.get('patient_cc')  # Changed from patient_id
         
         context = {
-            'pacientes': pacientes,
             'selected_patient': None,
             'consultas': [],
             'medicacoes': [],
@@ -42,94 +73,238 @@ class PatientDashboardView(View):
         }
         
         if patient_cc:
-            # Get the selected patient using cc field
-            try:
-                selected_patient = Paciente.objects.get(cc=patient_cc)
-            except Paciente.DoesNotExist:
-                selected_patient = None
-                # You might want to add an error message here
+            # Patient and sections come from the fragment cache
+            selected_patient, version = await sync_to_async(cached_patient)(patient_cc)
             
             if selected_patient:
-                # Filter data by selected patient
-                consultas = Consulta.objects.filter(paciente=selected_patient)
-                medicacoes = Medicacao.objects.filter(paciente=selected_patient)
-                exames = Exames.objects.filter(paciente=selected_patient)
-                
                 context.update({
                     'selected_patient': selected_patient,
-                    'consultas': consultas,
-                    'medicacoes': medicacoes,
-                    'exames': exames
+                    'patient_version': version,
+                    'fragment_timeout': fragment_timeout(),
                 })
+                # Sections whose fragment is missing are loaded concurrently;
+                # the rest stay lazy in case their fragment expires meanwhile
+                keys = {
+                    name: fragment_key(f'patient_{name}', selected_patient.cc, version)
+                    for name in self.sections
+                }
+                cached = await cache.aget_many(keys.values())
+                missing = [name for name, key in keys.items() if key not in cached]
+                loaded = await gather_reads(*(
+                    partial(list, self.sections[name](selected_patient)) for name in missing
+                ))
+                context.update({name: load(selected_patient) for name, load in self.sections.items()})
+                context.update(zip(missing, loaded))
         
-        return render(request, self.template_name, context)
+        return await sync_to_async(render)(request, self.template_name, context)
 
-class PatientConsultaDetailView(DetailView):
-    model = Consulta
+class PacienteTypeaheadView(View):
+    """JSON lookup used by the patient pickers on both dashboards."""
+    query_budget = 1
+
+    def get(self, request):
+        try:
+            limit = int(request.GET.get('limit', TYPEAHEAD_DEFAULT_LIMIT))
+        except ValueError:
+            limit = TYPEAHEAD_DEFAULT_LIMIT
+
+        pacientes = paciente_typeahead(request.GET.get('q', ''), limit)
+        results = [
+            {
+                'cc': paciente.cc,
+                'nome': paciente.nome,
+                'numero_seguranca_social': paciente.numero_seguranca_social,
+                'label': f"{paciente.nome} (CC: {paciente.cc})",
+            }
+            for paciente in pacientes
+        ]
+        return JsonResponse({'results': results})
+
+
+class AutocompleteView(View):
+    """JSON lookup behind the autocomplete widgets of the clinical forms."""
+    query_budget = 1
+
+    def get(self, request, lookup):
+        lookup = LOOKUPS.get(lookup)
+        if lookup is None:
+            raise Http404
+        try:
+            limit = int(request.GET.get('limit', TYPEAHEAD_DEFAULT_LIMIT))
+        except ValueError:
+            limit = TYPEAHEAD_DEFAULT_LIMIT
+        return JsonResponse({'results': lookup.results(request.GET.get('q', ''), limit)})
+
+
+class PatientTimelineMixin:
+    """Reads the timeline window requested by ``type``, ``limit`` and ``cursor``."""
+
+    def get_timeline(self, request, paciente):
+        kinds = [
+            kind for value in request.GET.getlist('type') for kind in value.split(',')
+        ] or KINDS
+        try:
+            limit = int(request.GET.get('limit', TIMELINE_DEFAULT_LIMIT))
+        except ValueError:
+            limit = TIMELINE_DEFAULT_LIMIT
+        return patient_timeline(paciente, kinds, limit, request.GET.get('cursor'))
+
+
+class PatientTimelineView(PatientTimelineMixin, View):
+    template_name = 'patient_timeline.html'
+    query_budget = 5
+    read_replica = True
+
+    def get(self, request, cc):
+        paciente = get_object_or_404(Paciente, cc=cc)
+        return render(request, self.template_name, {
+            'selected_patient': paciente,
+            'timeline': self.get_timeline(request, paciente),
+            'kinds': KINDS,
+            'selected_kinds': request.GET.getlist('type'),
+        })
+
+
+class PatientTimelineJSONView(PatientTimelineMixin, View):
+    """JSON feed of the timeline, for infinite scrolling."""
+    query_budget = 5
+    read_replica = True
+    detail_urls = {
+        'consulta': 'consulta_detail',
+        'medicacao': 'medicacao_detail',
+        'exames': 'exames_detail',
+    }
+
+    def describe(self, entry):
+        if entry.kind == 'consulta':
+            return entry.object.motivo
+        return f"Prescription #{entry.object.pk} ({entry.object.item_count} items)"
+
+    def get(self, request, cc):
+        paciente = get_object_or_404(Paciente, cc=cc)
+        timeline = self.get_timeline(request, paciente)
+        results = [
+            {
+                'type': entry.kind,
+                'id': entry.object.pk,
+                'at': entry.at.isoformat(),
+                'description': self.describe(entry),
+                'url': reverse(self.detail_urls[entry.kind], args=[entry.object.pk]),
+            }
+            for entry in timeline
+        ]
+        return JsonResponse({'results': results, 'next_cursor': timeline.next_cursor})
+
+
+class PatientConsultaDetailView(View):
     template_name = 'consulta_detail.html'
-    context_object_name = 'consulta'
+    query_budget = 1
+    read_replica = True
+
+    async def get(self, request, pk):
+        consulta = await aget_object_or_404(Consulta.objects.select_related('paciente'), pk=pk)
+        return await sync_to_async(render)(request, self.template_name, {
+            'object': consulta,
+            'consulta': consulta,
+        })
 
 
 class PatientMedicacaoListView(ListView):
     model = Medicacao
+    queryset = Medicacao.objects.select_related('paciente')
     template_name = 'patient_medicacoes.html'
     context_object_name = 'medicacoes'
+    query_budget = 1
+    read_replica = True
 
 
 class PatientExamesListView(ListView):
     model = Exames
+    queryset = Exames.objects.select_related('paciente')
     template_name = 'patient_exames.html'
     context_object_name = 'exames'
+    query_budget = 1
+    read_replica = True
 
 
 # -------------------------------
 # Doctor Views
 # -------------------------------
-class DoctorDashboardView(ListView):
-    model = Paciente
+class DoctorDashboardView(View):
     template_name = 'doctor_dashboard.html'
-    context_object_name = 'pacientes'
-    
-    def get_context_data(self, **kwargs):
-        context = super().get_context_data(**kwargs)
-        
+    keyset_ordering = ('nome', 'cc')
+    paginate_by = 24
+    query_budget = 4
+    read_replica = True
+
+    def recent_consultas(self, cc):
+        return Consulta.objects.filter(paciente_id=cc).order_by('-data_hora', '-id')[:5]
+
+    async def get(self, request):
+        # Statistics, the page of patients and the selected patient are
+        # independent, so they are read concurrently
+        reads = [
+            # Totals come from the daily rollup instead of counting the table
+            dashboard_statistics,
+            partial(
+                keyset_paginate, Paciente.objects.all(), self.keyset_ordering,
+                self.paginate_by, request.GET.get('cursor'),
+            ),
+        ]
+
         # Get selected patient from query parameter
-        patient_cc = self.request.GET.get('patient_cc')
-        selected_patient = None
-        
-        if patient_cc:
-            try:
-                selected_patient = Paciente.objects.get(cc=patient_cc)
-                
-                # Get counts for selected patient
-                context['consultas_count'] = Consulta.objects.filter(paciente=selected_patient).count()
-                context['medicacoes_count'] = Medicacao.objects.filter(paciente=selected_patient).count()
-                context['exames_count'] = Exames.objects.filter(paciente=selected_patient).count()
-                
-                # Get recent consultations (last 5)
-                context['recent_consultas'] = Consulta.objects.filter(
-                    paciente=selected_patient
-                ).order_by('-data_hora')[:5]
-                
-            except Paciente.DoesNotExist:
-                pass
-        
-        # Get general statistics for empty state
-        context['total_patients'] = Paciente.objects.count()
-        
-        # Get today's consultations count
-        today = date.today()
-        context['recent_consultas_total'] = Consulta.objects.filter(
-            data_hora__date=today
-        ).count()
-        
-        context['selected_patient'] = selected_patient
-        
-        return context
+        try:
+            patient_cc = int(request.GET.get('patient_cc', ''))
+        except ValueError:
+            patient_cc = None
+        recent_consultas = None
+        if patient_cc is not None:
+            reads.append(partial(cached_patient, patient_cc))
+            # Get recent consultations (last 5), unless cached
+            version = await sync_to_async(patient_version)(patient_cc)
+            key = fragment_key('doctor_recent_consultas', patient_cc, version)
+            if not await cache.ahas_key(key):
+                reads.append(partial(list, self.recent_consultas(patient_cc)))
+
+        statistics, page, *patient = await gather_reads(*reads)
+        context = {
+            'view': self,
+            'page_obj': page,
+            'paginator': None,
+            'is_paginated': page.has_other_pages(),
+            'object_list': page.object_list,
+            'pacientes': page.object_list,
+            'total_count': statistics['total_patients'],
+            'total_count_is_estimate': False,
+            # General statistics for the empty state
+            'total_patients': statistics['total_patients'],
+            'recent_consultas_total': statistics['consultas_today'],
+            'selected_patient': None,
+        }
+
+        if patient:
+            (selected_patient, version), *recent_consultas = patient
+            if selected_patient:
+                context.update({
+                    'selected_patient': selected_patient,
+                    # Counts are denormalized onto the patient row
+                    'consultas_count': selected_patient.num_consultas,
+                    'medicacoes_count': selected_patient.num_medicacoes,
+                    'exames_count': selected_patient.num_exames,
+                    'recent_consultas': (
+                        recent_consultas[0] if recent_consultas
+                        else self.recent_consultas(selected_patient.cc)
+                    ),
+                    'patient_version': version,
+                    'fragment_timeout': fragment_timeout(),
+                })
+
+        return await sync_to_async(render)(request, self.template_name, context)
 
 
 class ScheduleConsultaView(View):
     template_name = 'schedule_consulta.html'
+    query_budget = 14
 
     def get(self, request):
         form = ConsultaForm()
@@ -138,16 +313,79 @@ class ScheduleConsultaView(View):
     def post(self, request):
         form = ConsultaForm(request.POST)
         if form.is_valid():
-            form.save()
-            return redirect('doctor_dashboard')
+            try:
+                book_consulta(form.save(commit=False), form.cleaned_data['medico'])
+            except SlotUnavailable as error:
+                form.add_error('data_hora', str(error))
+            else:
+                return redirect('doctor_dashboard')
         return render(request, self.template_name, {'form': form})
 
 
+class ScheduleSeriesView(View):
+    template_name = 'schedule_series.html'
+    query_budget = 12
+
+    def get(self, request):
+        return render(request, self.template_name, {'form': ConsultaSeriesForm()})
+
+    def post(self, request):
+        form = ConsultaSeriesForm(request.POST)
+        if form.is_valid():
+            try:
+                book_series(
+                    form.cleaned_data['paciente'], form.starts(), form.cleaned_data['motivo'],
+                    form.medicos(),
+                )
+            except SlotUnavailable as error:
+                form.add_error('data_hora', str(error))
+            else:
+                return redirect('doctor_dashboard')
+        return render(request, self.template_name, {'form': form})
+
+
+class FreeSlotsView(View):
+    """Next free consultation slots of a doctor or of a specialty, as JSON.
+
+    Read from the primary: a lagging replica would still offer slots that
+    were just booked.
+    """
+    query_budget = 2
+
+    def get(self, request):
+        especialidade = request.GET.get('especialidade', '').strip()
+        try:
+            medico = int(request.GET['medico']) if request.GET.get('medico') else None
+            start = parse_instant(request.GET.get('from')) or timezone.now()
+            end = parse_instant(request.GET.get('to')) or start + timedelta(days=7)
+            limit = int(request.GET.get('limit', FREE_SLOTS_DEFAULT_LIMIT))
+        except ValueError:
+            return JsonResponse({'error': 'Invalid medico, from, to or limit.'}, status=400)
+        if medico is None and not especialidade:
+            return JsonResponse({'error': 'Pass medico or especialidade.'}, status=400)
+
+        limit = max(1, min(limit, FREE_SLOTS_MAX_LIMIT))
+        slots = free_slots(doctors_for(medico, especialidade), start, end, limit)
+        return JsonResponse({'results': [
+            {
+                'start': slot.start,
+                'end': slot.end,
+                'medico': {
+                    'cc': slot.medico.cc,
+                    'nome': slot.medico.nome,
+                    'especialidade': slot.medico.especialidade,
+                },
+            }
+            for slot in slots
+        ]})
+
+
 # -------------------------------
 # Medicacao Views
 # -------------------------------
 class CreateMedicacaoView(View):
     template_name = 'create_medicacao.html'
+    query_budget = 12
 
     def get(self, request):
         form = MedicacaoForm()
@@ -162,12 +400,7 @@ class CreateMedicacaoView(View):
         formset = ItemMedicacaoFormSet(request.POST)
         
         if form.is_valid() and formset.is_valid():
-            medicacao = form.save()
-            items = formset.save(commit=False)
-            for item in items:
-                item.medicacao = medicacao
-                item.save()
-            formset.save_m2m()  # Save many-to-many relationships
+            save_prescriptions([Prescription.from_forms(form, formset)])
             return redirect('doctor_dashboard')
         
         return render(request, self.template_name, {
@@ -178,6 +411,7 @@ class CreateMedicacaoView(View):
 
 class UpdateMedicacaoView(View):
     template_name = 'update_medicacao.html'
+    query_budget = 13
 
     def get(self, request, pk):
         medicacao = get_object_or_404(Medicacao, pk=pk)
@@ -195,8 +429,7 @@ class UpdateMedicacaoView(View):
         formset = ItemMedicacaoFormSet(request.POST, instance=medicacao)
         
         if form.is_valid() and formset.is_valid():
-            form.save()
-            formset.save()
+            save_prescriptions([Prescription.from_forms(form, formset)])
             return redirect('doctor_dashboard')
         
         return render(request, self.template_name, {
@@ -205,21 +438,29 @@ class UpdateMedicacaoView(View):
             'medicacao': medicacao
         })
 
-class MedicacaoDetailView(DetailView):
-    model = Medicacao
+class MedicacaoDetailView(View):
     template_name = 'medicacao_detail.html'
-    context_object_name = 'medicacao'
-    
-    def get_context_data(self, **kwargs):
-        context = super().get_context_data(**kwargs)
-        med_items = ItemMedicacao.objects.filter(medicacao=self.object)
-        context['med_items'] = med_items
-        return context
+    query_budget = 2
+    read_replica = True
+
+    async def get(self, request, pk):
+        medicacao, med_items = await gather_reads(
+            partial(get_object_or_404, Medicacao.objects.select_related('paciente'), pk=pk),
+            partial(list, ItemMedicacao.objects.filter(medicacao_id=pk).select_related('medicamento')),
+        )
+        return await sync_to_async(render)(request, self.template_name, {
+            'object': medicacao,
+            'medicacao': medicacao,
+            'med_items': med_items,
+        })
+
+
 # -------------------------------
 # Exames Views
 # -------------------------------
 class CreateExamesView(View):
     template_name = 'create_exames.html'
+    query_budget = 16
 
     def get(self, request):
         form = ExamesForm()
@@ -234,12 +475,7 @@ class CreateExamesView(View):
         formset = ItemExamesFormSet(request.POST,request.FILES)
         
         if form.is_valid() and formset.is_valid():
-            exames = form.save()
-            items = formset.save(commit=False)
-            for item in items:
-                item.exames = exames
-                item.save()
-            formset.save_m2m()
+            save_prescriptions([Prescription.from_forms(form, formset)])
             return redirect('doctor_dashboard')
         
         return render(request, self.template_name, {
@@ -248,8 +484,9 @@ class CreateExamesView(View):
         })
 
 
-class UpdateExameView(View):
+class UpdateExamesView(View):
     template_name = 'update_exames.html'
+    query_budget = 13
 
     def get(self, request, pk):
         exame_obj = get_object_or_404(Exames, pk=pk)
@@ -267,8 +504,7 @@ class UpdateExameView(View):
         formset = ItemExamesFormSet(request.POST, request.FILES, instance=exame_obj)
         
         if form.is_valid() and formset.is_valid():
-            form.save()
-            formset.save()
+            save_prescriptions([Prescription.from_forms(form, formset)])
             return redirect('doctor_dashboard')
         
         return render(request, self.template_name, {
@@ -284,17 +520,103 @@ class UpdateExameResultsView(UpdateView):
     fields = ['resultados']
     success_url = reverse_lazy('doctor_dashboard')
     context_object_name = 'item_exame'
+    query_budget = 5
 
-class ExamesDetailView(DetailView):
-    model = Exames
+class ExamesDetailView(View):
     template_name = 'exames_detail.html'
-    context_object_name = 'exame'
-    
-    def get_context_data(self, **kwargs):
-        context = super().get_context_data(**kwargs)
-        exam_items = ItemExames.objects.filter(exames=self.object)
-        context['exam_items'] = exam_items
-        return context
+    query_budget = 2
+    read_replica = True
+
+    async def get(self, request, pk):
+        exame, exam_items = await gather_reads(
+            partial(get_object_or_404, Exames.objects.select_related('paciente'), pk=pk),
+            partial(list, ItemExames.objects.filter(exames_id=pk).select_related('exame')),
+        )
+        return await sync_to_async(render)(request, self.template_name, {
+            'object': exame,
+            'exame': exame,
+            'exam_items': exam_items,
+        })
+
+
+# -------------------------------
+# Chunked Uploads
+# -------------------------------
+def upload_status(session):
+    response = JsonResponse({
+        'id': str(session.pk),
+        'filename': session.filename,
+        'size': session.size,
+        'offset': session.received,
+        'status': session.status,
+        'sha256': session.sha256 if session.status == UploadSession.COMPLETE else None,
+        'url': reverse('upload_session', args=[session.pk]),
+    })
+    response['Upload-Offset'] = str(session.received)
+    response['Cache-Control'] = 'no-store'
+    return response
+
+
+class UploadSessionCreateView(View):
+    """Opens a resumable upload for ``filename`` of ``size`` bytes.
+
+    ``sha256``, if given, is checked once the last chunk arrives.
+    """
+    query_budget = 1
+
+    def post(self, request):
+        try:
+            size = int(request.POST.get('size', ''))
+        except ValueError:
+            return JsonResponse({'error': 'size must be an integer.'}, status=400)
+        try:
+            session = uploads.create_session(
+                request.POST.get('filename'), size, request.POST.get('sha256', '')
+            )
+        except uploads.UploadError as exc:
+            return JsonResponse({'error': str(exc)}, status=exc.status)
+        response = upload_status(session)
+        response.status_code = 201
+        response['Location'] = reverse('upload_session', args=[session.pk])
+        return response
+
+
+class UploadSessionView(View):
+    """Status (GET/HEAD), next chunk (PATCH) or cancellation (DELETE).
+
+    A chunk is the raw request body, sent with ``Upload-Offset`` set to the
+    offset the server last reported; a mismatch answers 409 with the offset
+    to resume from.
+    """
+    query_budget = 6
+
+    def get(self, request, pk):
+        return upload_status(get_object_or_404(UploadSession, pk=pk))
+
+    def patch(self, request, pk):
+        try:
+            offset = int(request.headers['Upload-Offset'])
+            length = int(request.headers['Content-Length'])
+        except (KeyError, ValueError):
+            return JsonResponse(
+                {'error': 'Upload-Offset and Content-Length are required.'}, status=400
+            )
+        try:
+            session = uploads.append_chunk(pk, offset, request, length)
+        except UploadSession.DoesNotExist:
+            raise Http404
+        except uploads.UploadError as exc:
+            response = JsonResponse({'error': str(exc)}, status=exc.status)
+            if exc.offset is not None:
+                response['Upload-Offset'] = str(exc.offset)
+            return response
+        return upload_status(session)
+
+    def delete(self, request, pk):
+        session = get_object_or_404(UploadSession, pk=pk)
+        uploads.discard(session)
+        return HttpResponse(status=204)
+
 
 # -------------------------------
 # Update Consulta
@@ -305,6 +627,15 @@ class UpdateConsultaView(UpdateView):
     fields = ['data_hora', 'motivo']
     success_url = reverse_lazy('doctor_dashboard')
     context_object_name = 'consulta'
+    query_budget = 9
+
+    def form_valid(self, form):
+        try:
+            self.object = reschedule_consulta(form.save(commit=False))
+        except SlotUnavailable as error:
+            form.add_error('data_hora', str(error))
+            return self.form_invalid(form)
+        return redirect(self.get_success_url())
 
 
 # -------------------------------
@@ -312,6 +643,7 @@ class UpdateConsultaView(UpdateView):
 # -------------------------------
 class AdminDashboardView(TemplateView):
     template_name = 'admin_dashboard.html'
+    query_budget = 0
 
 
 class CreateMedicoView(CreateView):
@@ -319,6 +651,7 @@ class CreateMedicoView(CreateView):
     form_class = MedicoForm
     template_name = 'create_medico.html'
     success_url = reverse_lazy('admin_dashboard')
+    query_budget = 8
 
 
 class UpdateMedicoView(UpdateView):
@@ -328,6 +661,7 @@ class UpdateMedicoView(UpdateView):
     pk_url_kwarg = 'cc'
     success_url = reverse_lazy('admin_dashboard')
     context_object_name = 'medico'
+    query_budget = 7
 
 
 class CreatePacienteView(CreateView):
@@ -335,6 +669,7 @@ class CreatePacienteView(CreateView):
     form_class = PacienteForm
     template_name = 'create_paciente.html'
     success_url = reverse_lazy('admin_dashboard')
+    query_budget = 9
 
 
 class UpdatePacienteAdminView(UpdateView):
@@ -344,6 +679,7 @@ class UpdatePacienteAdminView(UpdateView):
     pk_url_kwarg = 'cc'
     success_url = reverse_lazy('admin_dashboard')
     context_object_name = 'paciente'
+    query_budget = 7
 
 
 class CreateMedicamentoView(CreateView):
@@ -351,6 +687,7 @@ class CreateMedicamentoView(CreateView):
     form_class = MedicamentoForm
     template_name = 'create_medicamento.html'
     success_url = reverse_lazy('admin_dashboard')
+    query_budget = 6
 
 class UpdateMedicamentoView(UpdateView):
     model = Medicamento
@@ -359,12 +696,14 @@ class UpdateMedicamentoView(UpdateView):
     pk_url_kwarg = 'id_medicamento'
     success_url = reverse_lazy('admin_dashboard')
     context_object_name = 'medicamento'
+    query_budget = 5
 
 class CreateExameView(CreateView):
     model = Exame
     form_class = ExameForm
     template_name = 'create_exame.html'
     success_url = reverse_lazy('admin_dashboard')
+    query_budget = 6
 
 class UpdateExameView(UpdateView):
     model = Exame
@@ -373,26 +712,133 @@ class UpdateExameView(UpdateView):
     pk_url_kwarg = 'pk'
     success_url = reverse_lazy('admin_dashboard')
     context_object_name = 'exame'
+    query_budget = 5
 
 
-class MedicoListView(ListView):
+class MedicoListView(SearchMixin, KeysetPaginationMixin, ListView):
     model = Medico
     template_name = 'list_medicos.html'
     context_object_name = 'medicos'
+    keyset_ordering = ('nome', 'cc')
+    paginate_by = 25
+    search_vector = MEDICO_SEARCH_VECTOR
+    search_trigram_fields = ('nome', 'especialidade', 'email')
+    search_prefix_fields = ('cc', 'numero_medico')
+    query_budget = 3
+    read_replica = True
 
 
-class PacienteListView(ListView):
+class PacienteListView(SearchMixin, KeysetPaginationMixin, ListView):
     model = Paciente
     template_name = 'list_pacientes.html'
     context_object_name = 'pacientes'
+    keyset_ordering = ('nome', 'cc')
+    paginate_by = 25
+    search_vector = PACIENTE_SEARCH_VECTOR
+    search_trigram_fields = ('nome', 'email')
+    search_prefix_fields = ('cc', 'numero_seguranca_social')
+    query_budget = 3
+    read_replica = True
 
 
-class MedicamentoListView(ListView):
+class MedicamentoListView(SearchMixin, KeysetPaginationMixin, ListView):
     model = Medicamento
     template_name = 'list_medicamentos.html'
     context_object_name = 'medicamentos'
-
-class ExameListView(ListView):
+    keyset_ordering = ('nome', 'id_medicamento')
+    paginate_by = 25
+    search_vector = MEDICAMENTO_SEARCH_VECTOR
+    search_trigram_fields = ('nome', 'id_medicamento')
+    query_budget = 3
+    read_replica = True
+
+class ExameListView(SearchMixin, KeysetPaginationMixin, ListView):
     model = Exame
     template_name = 'list_exame.html'
-    context_object_name = 'exame'
\ No newline at end of file
+    context_object_name = 'exame'
+    keyset_ordering = ('nome', 'id_exame')
+    paginate_by = 25
+    search_vector = EXAME_SEARCH_VECTOR
+    search_trigram_fields = ('nome', 'id_exame')
+    query_budget = 3
+    read_replica = True
+
+
+# -------------------------------
+# JSON API
+# -------------------------------
+class ApiView(View):
+    """Read-only JSON API over the resources of workshop.api.
+
+    Answers 304 from the ETag alone when If-None-Match still matches.
+    """
+
+    def get(self, request, resource, **kwargs):
+        resource = api.RESOURCES.get(resource)
+        if resource is None:
+            return JsonResponse({'error': 'Unknown resource.'}, status=404)
+        etag = api.etag(resource, request)
+        response = get_conditional_response(request, etag=etag)
+        if response is None:
+            try:
+                body = self.get_body(resource, request.GET, **kwargs)
+            except api.ApiError as error:
+                return JsonResponse({'error': error.message}, status=error.status)
+            if body is None:
+                return JsonResponse({'error': 'Not found.'}, status=404)
+            response = JsonResponse(body)
+        response['ETag'] = etag
+        response['Cache-Control'] = 'private, no-cache'
+        return response
+
+
+class ApiListView(ApiView):
+    query_budget = 3
+    read_replica = True
+
+    def get_body(self, resource, params):
+        return resource.page(params)
+
+
+class ApiDetailView(ApiView):
+    query_budget = 3
+    read_replica = True
+
+    def get_body(self, resource, params, pk):
+        return resource.detail(params, pk)
+
+
+# -------------------------------
+# Media
+# -------------------------------
+class MediaView(View):
+    """Serves MEDIA_URL with Range, ETag/Last-Modified and sendfile support."""
+    query_budget = 0
+
+    def get(self, request, name):
+        return media.serve(request, name)
+
+
+# -------------------------------
+# Diagnostics
+# -------------------------------
+class QueryReportView(View):
+    """Per-view query statistics gathered by QueryBudgetMiddleware, and
+    connection pool metrics (workshop.dbpool).
+
+    Only available with DEBUG on or to staff; POST clears the statistics.
+    """
+    query_budget = 2
+
+    def dispatch(self, request, *args, **kwargs):
+        if not (settings.DEBUG or request.user.is_staff):
+            raise Http404
+        return super().dispatch(request, *args, **kwargs)
+
+    def get(self, request):
+        return JsonResponse({'views': query_stats.report(), 'pools': pool_stats()})
+
+    def post(self, request):
+        query_stats.reset()
+        pool_stats(reset=True)
+        return HttpResponse(status=204)